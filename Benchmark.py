@@ -0,0 +1,244 @@
+# %% ===========================================================================
+# Preamble
+# =============================================================================
+from Utilities.Environment import Graph
+from Utilities.Maps import Risk, Bungalow, LivingArea, CSI_Cobot, Synthetic
+from Utilities.Optimise import Action_Optimiser
+from Utilities.Prism import Prism
+import numpy as np
+import random
+import heapq
+import time
+import sys
+
+#%% ===========================================================================
+# Benchmark Environments
+# -----------------------------------------------------------------------------
+# Each environment is created in the same way as Coop_Task for the agent. With 
+# n_probs=2, the return probabilities of the edges become failures.
+# =============================================================================
+def Create_Environments(backend="dict", n_probs=3):
+	risk_matrix = Risk()
+	environments = {
+		"Bungalow"   : Bungalow(risk_matrix)[0],
+		"LivingArea" : LivingArea(risk_matrix),
+		"CSI_Cobot"  : CSI_Cobot(risk_matrix),
+	}
+
+	graphs = dict()
+	for name, connections in environments.items():
+		num_nodes = max(max(c[0], c[1]) for c in connections)
+		graphs[name] = Graph(n_nodes=num_nodes, ID="Agent", n_probs=n_probs, backend=backend)
+		graphs[name].Create_Connections(connections)
+		graphs[name].Create_Map()
+
+	return graphs
+
+#%% ===========================================================================
+# Synthetic Environments
+# -----------------------------------------------------------------------------
+# Large synthetic buildings created using Maps.Synthetic.
+# =============================================================================
+def Create_Synthetic(sizes=(10000, 20000), backend="csr", seed=0):
+	graphs = dict()
+	for n_nodes in sizes:
+		connections = Synthetic(Risk(), n_nodes, seed=seed)
+		graphs[f"Synthetic_{n_nodes}"] = Graph(n_nodes=n_nodes, ID="Agent", n_probs=3, backend=backend)
+		graphs[f"Synthetic_{n_nodes}"].Create_Connections(connections)
+		graphs[f"Synthetic_{n_nodes}"].Create_Map()
+
+	return graphs
+
+#%% ===========================================================================
+# Legacy Probability Search
+# -----------------------------------------------------------------------------
+# The probability search used by Graph.Dijkstra before it was changed to a
+# label-settling search. The probabilities were pushed onto a min-heap, so the
+# least likely node was removed first and nodes were expanded many times. The
+# number of expansions is returned with the probabilities.
+# =============================================================================
+def Legacy_Probability(map, start):
+	nodes = {k : 0 for k in map.keys()}
+	nodes[start] = 1
+	expanded = 0
+
+	connections = list()
+	heapq.heappush(connections, (0, start))
+	while connections:
+		curr_prob, curr_node = heapq.heappop(connections)
+		expanded += 1
+		for neighbour, edge in map[curr_node].items():
+			edge = edge["Success"]
+			if edge == 0:
+				edge = 0.05
+
+			if curr_prob == 0:
+				new_probability = edge
+			else:
+				new_probability = curr_prob * edge
+
+			if new_probability > nodes[neighbour]:
+				nodes[neighbour] = new_probability
+				heapq.heappush(connections, (new_probability, neighbour))
+
+	return nodes, expanded
+
+#%% ===========================================================================
+# Benchmark: Probability Search Expansions
+# -----------------------------------------------------------------------------
+# Compare the number of node expansions and the time taken by the legacy and
+# the label-settling probability searches from every start node, and check the
+# probabilities obtained by both searches are the same.
+# =============================================================================
+def Benchmark_Probability_Search(graphs):
+	print(f"{'Environment':<12} {'Nodes':>6} {'Legacy Exp.':>12} {'Settled Exp.':>13} {'Ratio':>7} {'Legacy (ms)':>12} {'Settled (ms)':>13} {'Max Diff':>9}")
+	for name, graph in graphs.items():
+		legacy_expanded = 0
+		settled_expanded = 0
+		legacy_time = 0
+		settled_time = 0
+		max_diff = 0
+
+		for start in graph.map:
+			t0 = time.perf_counter()
+			legacy_values, expanded = Legacy_Probability(graph.map, start)
+			legacy_time += time.perf_counter() - t0
+			legacy_expanded += expanded
+
+			t0 = time.perf_counter()
+			tree = graph.Dijkstra_Tree(start, method="Probability")
+			settled_time += time.perf_counter() - t0
+			settled_expanded += tree["Expanded"]
+
+			max_diff = max(max_diff, max(abs(legacy_values[n] - tree["Values"][n]) for n in graph.map))
+
+		print(f"{name:<12} {graph.n_nodes:>6} {legacy_expanded:>12} {settled_expanded:>13} {legacy_expanded/settled_expanded:>7.2f} "
+			  f"{legacy_time*1e3:>12.2f} {settled_time*1e3:>13.2f} {max_diff:>9.1e}")
+
+#%% ===========================================================================
+# Benchmark: Landmark A* (ALT)
+# -----------------------------------------------------------------------------
+# Compare the time and number of expansions of Dijkstra and the A* search with
+# landmarks for random queries, and count the paths which are not identical. 
+# The path cache is disabled so every query performs a search.
+# =============================================================================
+def Benchmark_ALT(graphs, n_queries=50, n_landmarks=8, seed=0):
+	rng = random.Random(seed)
+	print(f"{'Environment':<16} {'Method':<12} {'Prep (s)':>9} {'Dijkstra (ms)':>14} {'ALT (ms)':>9} {'Speedup':>8} {'Dijkstra Exp.':>14} {'ALT Exp.':>9} {'Different':>10}")
+	for name, graph in graphs.items():
+		graph.cache_size = 0
+		t0 = time.perf_counter()
+		graph.Create_Landmarks(n_landmarks=n_landmarks)
+		prep_time = time.perf_counter() - t0
+
+		queries = [(rng.randint(1, graph.n_nodes), rng.randint(1, graph.n_nodes)) for i in range(n_queries)]
+		for method in ["Distance", "Probability"]:
+			dijkstra_time = 0
+			alt_time = 0
+			dijkstra_expanded = 0
+			alt_expanded = 0
+			different = 0
+			for start, final in queries:
+				t0 = time.perf_counter()
+				tree = graph.Dijkstra_Tree(start, method=method)
+				path_dijkstra = graph.Tree_Path(tree, final)
+				dijkstra_time += time.perf_counter() - t0
+				dijkstra_expanded += tree["Expanded"]
+
+				t0 = time.perf_counter()
+				tree = graph.A_Star(start, final, method=method)
+				path_alt = graph.Tree_Path(tree, final)
+				alt_time += time.perf_counter() - t0
+				alt_expanded += tree["Expanded"]
+
+				different += path_dijkstra[0] != path_alt[0]
+
+			print(f"{name:<16} {method:<12} {prep_time:>9.2f} {dijkstra_time*1e3/n_queries:>14.2f} {alt_time*1e3/n_queries:>9.2f} {dijkstra_time/alt_time:>8.1f} "
+				  f"{dijkstra_expanded//n_queries:>14} {alt_expanded//n_queries:>9} {different:>10}")
+
+#%% ===========================================================================
+# Benchmark: Contraction Hierarchy
+# -----------------------------------------------------------------------------
+# Compare the time and number of expansions of Dijkstra and the contraction 
+# hierarchy for random queries, including the time to create the hierarchy. 
+# Paths of equal value may be resolved differently, so the values of the paths
+# are compared rather than the paths.
+# =============================================================================
+def Benchmark_CH(graphs, n_queries=50, seed=0):
+	rng = random.Random(seed)
+	print(f"{'Environment':<16} {'Method':<12} {'Prep (s)':>9} {'Shortcuts':>10} {'Dijkstra (ms)':>14} {'CH (ms)':>8} {'Speedup':>8} {'Dijkstra Exp.':>14} {'CH Exp.':>8} {'Max Diff':>9}")
+	for name, graph in graphs.items():
+		graph.cache_size = 0
+		queries = [(rng.randint(1, graph.n_nodes), rng.randint(1, graph.n_nodes)) for i in range(n_queries)]
+		for method in ["Distance", "Probability"]:
+			t0 = time.perf_counter()
+			graph.Create_Hierarchy(methods=(method,))
+			prep_time = time.perf_counter() - t0
+
+			dijkstra_time = 0
+			ch_time = 0
+			dijkstra_expanded = 0
+			ch_expanded = 0
+			max_diff = 0
+			for start, final in queries:
+				t0 = time.perf_counter()
+				tree = graph.Dijkstra_Tree(start, method=method)
+				path_dijkstra = graph.Tree_Path(tree, final)
+				dijkstra_time += time.perf_counter() - t0
+				dijkstra_expanded += tree["Expanded"]
+
+				t0 = time.perf_counter()
+				tree = graph.Hierarchy_Search(start, final, method=method)
+				path_ch = graph.Tree_Path(tree, final)
+				ch_time += time.perf_counter() - t0
+				ch_expanded += tree["Expanded"]
+
+				value = 1 if method == "Distance" else 2
+				max_diff = max(max_diff, abs(path_dijkstra[value] - path_ch[value]))
+
+			print(f"{name:<16} {method:<12} {prep_time:>9.2f} {graph.hierarchy[method].n_shortcuts:>10} {dijkstra_time*1e3/n_queries:>14.2f} {ch_time*1e3/n_queries:>8.2f} "
+				  f"{dijkstra_time/ch_time:>8.1f} {dijkstra_expanded//n_queries:>14} {ch_expanded//n_queries:>8} {max_diff:>9.1e}")
+
+#%% ===========================================================================
+# Benchmark: Action Optimiser
+# -----------------------------------------------------------------------------
+# Run the cross-entropy action optimiser for random queries, seeded with the 
+# Dijkstra paths, and compare the best probability of the Dijkstra paths, the 
+# optimised actions and the maximum probability policy (Prism.Value_Iteration).
+# The edges can fail in the environments used, so the probabilities differ.
+# =============================================================================
+def Benchmark_Optimiser(graphs, n_queries=10, iterations=100, time_limit=5, seed=0):
+	rng = random.Random(seed)
+	print(f"{'Environment':<12} {'Dijkstra':>9} {'Optimised':>10} {'Policy':>7} {'Iterations':>11} {'Converged':>10} {'Time (s)':>9} {'Eval./s':>9}")
+	for name, graph in graphs.items():
+		for i in range(n_queries):
+			start, final = rng.randint(1, graph.n_nodes), rng.randint(1, graph.n_nodes)
+			paths = [graph.Dijkstra(start, final, method=method)[0] for method in ["Distance", "Probability"]]
+			dijkstra = max(Prism.Solve(graph.map, start, final, Prism.Generate_Action(graph.map, 1, initial_guess=path)[0]) for path in paths)
+
+			result = Action_Optimiser(graph.map, start, final, seed=seed).Run(paths, iterations=iterations, time_limit=time_limit)
+			policy = Prism.Value_Iteration(graph.map, [final])["Values"][0, start]
+
+			print(f"{name:<12} {dijkstra:>9.5f} {result['Probability']:>10.5f} {policy:>7.5f} {result['Iterations']:>11} {str(result['Converged']):>10} "
+				  f"{result['Time']:>9.2f} {result['Evaluations per Second']:>9.0f}")
+
+#%% ===========================================================================
+# Run Benchmarks
+# -----------------------------------------------------------------------------
+# Benchmarks are selected using the input arguments, or all are run if no
+# arguments are given. For example: python Benchmark.py probability
+# =============================================================================
+BENCHMARKS = {
+	"probability" : lambda: Benchmark_Probability_Search(Create_Environments()),
+	"alt"         : lambda: Benchmark_ALT(Create_Synthetic()),
+	"ch"          : lambda: Benchmark_CH(Create_Synthetic(sizes=(10000,))),
+	"optimiser"   : lambda: Benchmark_Optimiser(Create_Environments(n_probs=2)),
+}
+
+if __name__ == "__main__":
+	selected = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+	for name in selected:
+		print("-"*100)
+		print(f"Benchmark: {name}")
+		print("-"*100)
+		BENCHMARKS[name]()
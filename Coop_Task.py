@@ -48,6 +48,50 @@ print_steps_human = False
 PRISM_path_validation_human = False
 PRISM_path_validation_agent = True
 
+# Path validation engine ("prism", "native" or "check"). The native engine solves 
+# the model in process, while "check" compares the native solution with PRISM.
+VALIDATION_ENGINE = "prism"
+
+# Path planner for the agent ("dijkstra" or "policy"). The policy planner follows
+# the maximum probability policy, which is reused until the heat map changes. The
+# policy is found in process with the "native" validation engine, or otherwise
+# synthesised by PRISM.
+PLANNER_AGENT = "dijkstra"
+
+# Validation results are cached in memory, and can also be stored in a directory
+# shared between runs. Set to None to only use the memory cache.
+VALIDATION_CACHE_DIR = None
+Prism.cache.directory = VALIDATION_CACHE_DIR
+
+# Path finding engine for the human ("dijkstra", "alt", "ch" or "table"). The human 
+# only uses the default map, so the hierarchy or routing table is created once and 
+# reused. The routing table returns the same paths as Dijkstra.
+PATH_ENGINE_HUMAN = "dijkstra"
+
+# The routing table can be saved and shared between runs (or worker processes).
+# If the file exists and was created from the same map it is loaded, otherwise the
+# table is created and saved. Set to None to create the table in the first query 
+# of the "table" engine.
+ROUTING_TABLE_FILE = None
+
+# Method used to solve the order of the unordered tasks in each mission phase 
+# ("enumerate", "vectorised", "held-karp" or "branch-bound"). All give the same 
+# solutions, but Held-Karp and branch and bound do not create every permutation 
+# of the tasks, so the saved "Permuted" and "Results" only hold the optimal paths.
+MISSION_SOLVER = "enumerate"
+
+# Minimum probability of success of the agent's path in each mission phase. If set, 
+# the Pareto front of distance against probability is found for each phase and the
+# shortest path which reaches the threshold is used (or the most likely path if no
+# path does). Set to None to always use the most likely path.
+MISSION_MIN_SUCCESS = None
+
+# Solved mission plans are cached in memory, keyed by the agent's map, the mission
+# and the start location, and can also be stored in a directory shared between
+# runs. Set to None to only use the memory cache.
+PLAN_CACHE_DIR = None
+Mission.plans.directory = PLAN_CACHE_DIR
+
 SAVE = True
 
 #%% ===========================================================================
@@ -62,11 +106,19 @@ agent = Graph(n_nodes=num_nodes, ID="Agent", n_probs=3)
 agent.Create_Connections(connections)
 agent.Create_Map()
 
+# The hash of the agent's map is used to key the solved mission plans.
+AGENT_MAP_HASH = agent.Map_Hash()
+
 # Create environment for the human 
 human = Graph(n_nodes=num_nodes, ID="Human", n_probs=2)
 human.Create_Connections(connections)
 human.Create_Map(agent.map)
 
+if PATH_ENGINE_HUMAN == "table" and ROUTING_TABLE_FILE is not None:
+	if not os.path.exists(ROUTING_TABLE_FILE) or not human.Load_Routing_Table(ROUTING_TABLE_FILE):
+		human.Create_Routing_Table(method="Distance")
+		human.Save_Routing_Table(ROUTING_TABLE_FILE)
+
 SUCCESS = 0
 FAIL = 0
 STUCK = 0
@@ -97,14 +149,23 @@ for SIM_N in tqdm(range(N_EPISODES)):
 		#%% ===========================================================================
 		# Mission Breakdown
 		# =============================================================================
-		mission = Mission(agent)
-		mission.environment = Graph(n_nodes=num_nodes, ID="Agent", n_probs=3)
-		mission.environment.Create_Connections(mission.connections)
-		mission.environment.Create_Map()
-
-		sub_tasks = mission.Breakdown()
-		sub_tasks = mission.Permute(sub_tasks, apply_end_state=True)
-		sub_tasks = mission.Solve(sub_tasks)
+		# The mission is only planned if the same mission has not been planned from 
+		# this start location before.
+		plan_key = Mission.plans.Key(AGENT_MAP_HASH, tasks, headers, agent.mission.start, (MISSION_SOLVER, MISSION_MIN_SUCCESS is not None))
+		sub_tasks = Mission.plans.Get(plan_key)
+		if sub_tasks is None:
+			mission = Mission(agent)
+			mission.environment = Graph(n_nodes=num_nodes, ID="Agent", n_probs=3)
+			mission.environment.Create_Connections(mission.connections)
+			mission.environment.Create_Map()
+
+			sub_tasks = mission.Breakdown()
+			if MISSION_SOLVER in ("enumerate", "vectorised"):
+				sub_tasks = mission.Permute(sub_tasks, apply_end_state=True)
+			sub_tasks = mission.Solve(sub_tasks, method=MISSION_SOLVER)
+			if MISSION_MIN_SUCCESS is not None:
+				sub_tasks = mission.Pareto_Front(sub_tasks)
+			Mission.plans.Set(plan_key, sub_tasks)
 
 		# Compile the mission plan
 		agent.Compile_Mission(sub_tasks)
@@ -139,7 +200,7 @@ for SIM_N in tqdm(range(N_EPISODES)):
 			# If the c_phase boolean is True, that indicates a new phase will be started if one exists.
 			if agent.mission.c_phase is True and human.mission.c_phase is True: 
 				# Set the mission phase for the agent
-				agent.mission.phase = agent.mission.breakdown[agent.mission.i_phase-1]['Solutions']['Probability']['Paths'][0]
+				agent.mission.phase = Mission.Select_Plan(agent.mission.breakdown[agent.mission.i_phase-1], MISSION_MIN_SUCCESS)
 
 				# Set the mission phase for the human
 				human.mission.phase = agent.mission.breakdown[agent.mission.i_phase-1]["H"]
@@ -165,13 +226,13 @@ for SIM_N in tqdm(range(N_EPISODES)):
 
 			# Create path for the human 
 			if len(human.mission.phase) > 0:
-				human = Simulation.Select_Path(human, PRISM_PATH, validate=PRISM_path_validation_human, heated=False, print_output=print_paths_human)
+				human = Simulation.Select_Path(human, PRISM_PATH, validate=PRISM_path_validation_human, heated=False, print_output=print_paths_human, engine=PATH_ENGINE_HUMAN, validation=VALIDATION_ENGINE)
 			else:
 				human.paths.selected.path = [human.dynamics.position, human.dynamics.position]
 
 			# Create path for the agent 
 			agent.Update_Heat(human)
-			agent = Simulation.Select_Path(agent, PRISM_PATH, validate=PRISM_path_validation_agent, heated=True, print_output=print_paths_agent)
+			agent = Simulation.Select_Path(agent, PRISM_PATH, validate=PRISM_path_validation_agent, heated=True, print_output=print_paths_agent, validation=VALIDATION_ENGINE, planner=PLANNER_AGENT)
 
 			# Perform a discrete step along the current path.
 			human, data[simulation_steps]['human'] = Simulation.Step_Human(human, data[simulation_steps]['human'], print_steps=print_steps_human, creativity=human_creativity)
@@ -277,6 +338,20 @@ print("Episodes completed: ", SUCCESS)
 print("Episodes failed: ", FAIL, " with ", STUCK, " stuck states.")
 print(20*"-")
 
+# Path cache statistics for the agent and human
+for entity in [agent, human]:
+	stats = entity.Cache_Statistics()
+	print(f"{entity.ID} path cache: {stats['Hits']} hits, {stats['Misses']} misses ({100*stats['Hit Rate']:.1f}% hit rate)")
+
+# Validation cache statistics
+stats = Prism.cache.Statistics()
+print(f"Validation cache: {stats['Hits']} hits, {stats['Disk Hits']} disk hits, {stats['Misses']} misses ({100*stats['Hit Rate']:.1f}% hit rate)")
+
+# Mission plan cache statistics
+stats = Mission.plans.Statistics()
+print(f"Plan cache: {stats['Hits']} hits, {stats['Disk Hits']} disk hits, {stats['Misses']} misses ({100*stats['Hit Rate']:.1f}% hit rate)")
+print(20*"-")
+
 
 if SAVE:
 	# Compile a quick overview of the results for this entire simulation. 
@@ -0,0 +1,114 @@
+import hashlib, os, pickle, tempfile
+from collections import OrderedDict
+from copy import deepcopy
+
+# =============================================================================
+# Serialiser
+#
+# The functions used to write (dump) and read (load) a stored value, with the
+# file extension, whether the file is binary and the errors raised when a file
+# cannot be read.
+# =============================================================================
+class Serialiser:
+    def __init__(self, dump, load, extension="", binary=False, errors=()):
+        self.dump = dump            # dump(value, file)
+        self.load = load            # load(file) -> value
+        self.extension = extension
+        self.binary = binary
+        self.errors = (OSError,) + tuple(errors)
+
+# Values stored using pickle, or a single float stored as text.
+PICKLE = Serialiser(pickle.dump, pickle.load, extension=".pkl", binary=True, errors=(pickle.UnpicklingError, EOFError))
+FLOAT = Serialiser(lambda value, f: f.write(repr(value)), lambda f: float(f.read()), errors=(ValueError,))
+
+# =============================================================================
+# Disk Cache
+#
+# Values are kept in a least recently used cache, and can also be stored in a
+# directory which is shared between runs (or parallel processes). Each value
+# is stored in its own file, named by the key, using the serialiser. If copy is
+# True, copies of the values are stored and returned so a value in the cache is
+# never changed by the caller.
+# =============================================================================
+class Disk_Cache:
+    def __init__(self, cache_size=1024, directory=None, serialiser=PICKLE, copy=False):
+        self.cache_size = cache_size    # Maximum number of values kept in memory
+        self.directory = directory      # Optional directory for storing values
+        self.serialiser = serialiser
+        self.copy = copy
+        self.values = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # =============================================================================
+    # Hash
+    # -----------------------------------------------------------------------------
+    # Create a key from the hash of the representation of the values.
+    # =============================================================================
+    def Hash(*values):
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    # =============================================================================
+    # Get and Set
+    # -----------------------------------------------------------------------------
+    # Get returns the stored value, or None if the value has not been stored.
+    # Values are written to the directory using a temporary file which is then
+    # renamed, so other processes never read a partially written value.
+    # =============================================================================
+    def Get(self, key):
+        if key in self.values:
+            self.hits += 1
+            self.values.move_to_end(key)
+            return deepcopy(self.values[key]) if self.copy else self.values[key]
+
+        if self.directory is not None:
+            try:
+                with open(self.__Path(key), 'rb' if self.serialiser.binary else 'r') as f:
+                    value = self.serialiser.load(f)
+                self.disk_hits += 1
+                self.Set(key, value, write=False)
+                return deepcopy(value) if self.copy else value
+            except self.serialiser.errors:
+                pass
+
+        self.misses += 1
+        return None
+
+    def Set(self, key, value, write=True):
+        if value is None:
+            return
+
+        self.values[key] = deepcopy(value) if self.copy else value
+        self.values.move_to_end(key)
+        if len(self.values) > self.cache_size:
+            self.values.popitem(last=False)
+
+        if write and self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, 'wb' if self.serialiser.binary else 'w') as f:
+                self.serialiser.dump(value, f)
+            os.replace(temp_path, self.__Path(key))
+
+    def __Path(self, key):
+        return os.path.join(self.directory, key + self.serialiser.extension)
+
+    # =============================================================================
+    # Statistics
+    # -----------------------------------------------------------------------------
+    # Return the number of hits (in memory and from the directory) and misses.
+    # =============================================================================
+    def Statistics(self):
+        total = self.hits + self.disk_hits + self.misses
+        return {"Hits"      : self.hits,
+                "Disk Hits" : self.disk_hits,
+                "Misses"    : self.misses,
+                "Hit Rate"  : (self.hits + self.disk_hits) / total if total > 0 else 0,
+                "Size"      : len(self.values)}
+
+    def Clear(self):
+        self.values = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
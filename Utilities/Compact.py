@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# =============================================================================
+# Compressed Sparse Row (CSR) Map
+# =============================================================================
+''' The default environment map is a dictionary of dictionaries, where every
+    edge is its own dictionary of values ("Distance", "Success", "Return", "Fail"
+    and "Total"). For large environments this representation dominates both the
+    memory and the time spent walking the map. The CSR map stores the same
+    information as flat arrays:
+        - offsets:    row pointers indexed by node, where the edges leaving node
+                      n are located between offsets[n] and offsets[n+1]
+        - neighbours: connecting node for each edge
+        - sources:    originating node for each edge
+        - arrays:     dictionary of float arrays (one per edge value)
+
+    Node 0 is never used by the environment, so its row is always empty. This
+    allows nodes to index the offsets array directly.
+
+    A dictionary compatible view is provided so existing code which reads or
+    writes map[node][neighbour]["Success"] continues to work unchanged.
+'''
+class CSR_Map:
+    def __init__(self, n_nodes, sources, targets, values):
+        self.n_nodes = n_nodes
+
+        # Sort the edges by the originating node and then the connecting node. This
+        # keeps the same neighbour ordering as the dictionary map, which is important
+        # since the PRISM actions are indexed by the position of the neighbour.
+        sources = np.asarray(sources, dtype=np.int32)
+        targets = np.asarray(targets, dtype=np.int32)
+        order = np.lexsort((targets, sources))
+
+        self.sources = sources[order]
+        self.neighbours = targets[order]
+        self.arrays = {key : np.asarray(values[key], dtype=np.float64)[order] for key in values}
+
+        # Create the row pointers for each node.
+        counts = np.bincount(self.sources, minlength=n_nodes+1)
+        self.offsets = np.zeros(shape=(n_nodes+2), dtype=np.int64)
+        self.offsets[1:] = np.cumsum(counts)
+
+        # Cached adjacency lists used by the path finding algorithms.
+        self.__adjacency = dict()
+
+        # A heat map created from this map records the map it was created from and
+        # the human position and path used to create it.
+        self.base = None
+        self.signature = None
+
+    # =============================================================================
+    # Create from Dictionary
+    # -----------------------------------------------------------------------------
+    # Create a CSR map from a previously defined dictionary map.
+    # =============================================================================
+    def From_Dict(env_map):
+        sources = list()
+        targets = list()
+        values = dict()
+        for node in env_map:
+            for conn in env_map[node]:
+                sources.append(node)
+                targets.append(conn)
+                for key in env_map[node][conn]:
+                    values.setdefault(key, list()).append(env_map[node][conn][key])
+
+        return CSR_Map(max(env_map), sources, targets, values)
+
+    # =============================================================================
+    # Convert to Dictionary
+    # -----------------------------------------------------------------------------
+    # Create the dictionary of dictionaries representation of the map.
+    # =============================================================================
+    def To_Dict(self):
+        env_map = dict()
+        keys = list(self.arrays)
+        columns = [self.arrays[key].tolist() for key in keys]
+        neighbours = self.neighbours.tolist()
+        for node in range(1, self.n_nodes+1):
+            env_map[node] = dict()
+            for idx in range(self.offsets[node], self.offsets[node+1]):
+                env_map[node][neighbours[idx]] = {key : columns[k][idx] for k, key in enumerate(keys)}
+
+        return env_map
+
+    # =============================================================================
+    # Copy
+    # -----------------------------------------------------------------------------
+    # The structure of the map (offsets, neighbours, sources) never changes once
+    # the map is created, so a copy only needs to duplicate the value arrays.
+    # =============================================================================
+    def Copy(self):
+        new_map = CSR_Map.__new__(CSR_Map)
+        new_map.n_nodes = self.n_nodes
+        new_map.offsets = self.offsets
+        new_map.sources = self.sources
+        new_map.neighbours = self.neighbours
+        new_map.arrays = {key : self.arrays[key].copy() for key in self.arrays}
+        new_map.__adjacency = dict()
+        new_map.base = None
+        new_map.signature = None
+        return new_map
+
+    def __deepcopy__(self, memo):
+        return self.Copy()
+
+    # =============================================================================
+    # Map with New Values
+    # -----------------------------------------------------------------------------
+    # Create a map which shares the structure of this map, but with some of the 
+    # value arrays replaced. Arrays which are not replaced are copied.
+    # =============================================================================
+    def With_Values(self, arrays):
+        new_map = self.Copy()
+        new_map.base = self
+        for key in arrays:
+            new_map.arrays[key] = np.asarray(arrays[key], dtype=np.float64)
+        return new_map
+
+    # =============================================================================
+    # Vectorised Heat Map
+    # -----------------------------------------------------------------------------
+    # Apply the heat map rules of Graph.Update_Heat to the success, return and fail
+    # arrays for a batch of human paths and positions. The membership of the path
+    # nodes is a boolean mask, so each rule is a masked array operation:
+    #   - dual conflict (both nodes on the path): success scaled by scale1
+    #   - single conflict (one node on the path): success scaled by scale2
+    #   - blocked (connected to the human position, or the first or second node 
+    #     of the path): success = 0, return = 1, fail = 0
+    #
+    # The arrays returned have the shape (number of paths, number of edges), so 
+    # the heat maps of many episodes can be computed at once.
+    # =============================================================================
+    def Heat(self, paths, positions, scale1=0.5, scale2=0.90):
+        n_batch = len(paths)
+        lengths = np.array([len(p) for p in paths])
+        positions = np.asarray(positions).reshape(n_batch, 1)
+        first = np.array([p[0] for p in paths]).reshape(n_batch, 1)
+        second = np.array([p[1] if len(p) > 1 else -1 for p in paths]).reshape(n_batch, 1)
+
+        # Boolean mask of the nodes located on each path.
+        mask = np.zeros(shape=(n_batch, self.n_nodes+1), dtype=bool)
+        mask[np.repeat(np.arange(n_batch), lengths), np.concatenate([np.asarray(p) for p in paths])] = True
+        in_source = mask[:, self.sources]
+        in_target = mask[:, self.neighbours]
+        dual = in_source & in_target
+        single = in_source ^ in_target
+
+        # Scale the success probability and partition the remainder between the 
+        # return and fail probabilities.
+        success = self.arrays["Success"]
+        partition_1 = np.round(np.round(success * (1 - scale1), 5) / 3, 5)
+        partition_2 = np.round(np.round(success * (1 - scale2), 5) / 3, 5)
+        partition = np.where(dual, partition_1, np.where(single, partition_2, 0))
+
+        heat_success = np.where(dual, np.round(success * scale1, 5), np.where(single, np.round(success * scale2, 5), success))
+        heat_return = np.where(dual | single, self.arrays["Return"] + partition*2, self.arrays["Return"])
+        heat_fail = np.where(dual | single, self.arrays["Fail"] + partition, self.arrays["Fail"])
+
+        # Edges connected to the human position, or the next node along the path, 
+        # are blocked.
+        blocked = (self.sources == positions) | (self.neighbours == positions) | (self.sources == first) | (self.neighbours == second)
+        heat_success[blocked] = 0
+        heat_return[blocked] = 1
+        heat_fail[blocked] = 0
+
+        return {"Success" : heat_success, "Return" : heat_return, "Fail" : heat_fail}
+
+    # =============================================================================
+    # Edge Index
+    # -----------------------------------------------------------------------------
+    # Locate the position of the edge (node -> neighbour) within the edge arrays.
+    # =============================================================================
+    def Index(self, node, neighbour):
+        if node < 1 or node > self.n_nodes:
+            raise KeyError(node)
+        lo = self.offsets[node]
+        hi = self.offsets[node+1]
+        idx = lo + int(np.searchsorted(self.neighbours[lo:hi], neighbour))
+        if idx >= hi or self.neighbours[idx] != neighbour:
+            raise KeyError(neighbour)
+        return idx
+
+    # =============================================================================
+    # Adjacency Lists
+    # -----------------------------------------------------------------------------
+    # Path finding walks the neighbours of a node many times, which is much faster
+    # using native lists than through the numpy arrays. The adjacency list for
+    # each value is created once and is reused until the values change.
+    # =============================================================================
+    def Adjacency(self, key):
+        if key not in self.__adjacency:
+            neighbours = self.neighbours.tolist()
+            values = self.arrays[key].tolist()
+            offsets = self.offsets.tolist()
+            self.__adjacency[key] = [list(zip(neighbours[offsets[n]:offsets[n+1]], values[offsets[n]:offsets[n+1]]))
+                                     for n in range(self.n_nodes+1)]
+        return self.__adjacency[key]
+
+    # =============================================================================
+    # Invalidate
+    # -----------------------------------------------------------------------------
+    # If the value arrays are modified directly, the cached adjacency lists need
+    # to be removed.
+    # =============================================================================
+    def Invalidate(self):
+        self.__adjacency = dict()
+
+    # =============================================================================
+    # Dictionary Compatible View
+    # -----------------------------------------------------------------------------
+    # map[node] returns a row view and map[node][neighbour] returns an edge view.
+    # Both behave like the dictionaries of the default map.
+    # =============================================================================
+    def __len__(self):
+        return self.n_nodes
+
+    def __iter__(self):
+        return iter(range(1, self.n_nodes+1))
+
+    def __contains__(self, node):
+        return 1 <= node <= self.n_nodes
+
+    def __getitem__(self, node):
+        if node not in self:
+            raise KeyError(node)
+        return self.__Row(self, node)
+
+    def keys(self):
+        return range(1, self.n_nodes+1)
+
+    def items(self):
+        return ((node, self[node]) for node in self)
+
+    class __Row:
+        def __init__(self, csr, node):
+            self.csr = csr
+            self.node = node
+            self.lo = int(csr.offsets[node])
+            self.hi = int(csr.offsets[node+1])
+
+        def __len__(self):
+            return self.hi - self.lo
+
+        def __iter__(self):
+            return iter(self.csr.neighbours[self.lo:self.hi].tolist())
+
+        def __contains__(self, neighbour):
+            return neighbour in self.csr.neighbours[self.lo:self.hi]
+
+        def __getitem__(self, neighbour):
+            return self.csr._CSR_Map__Edge(self.csr, self.csr.Index(self.node, neighbour))
+
+        def keys(self):
+            return self.csr.neighbours[self.lo:self.hi].tolist()
+
+        def items(self):
+            return ((n, self.csr._CSR_Map__Edge(self.csr, idx)) for idx, n in enumerate(self.keys(), start=self.lo))
+
+    class __Edge:
+        def __init__(self, csr, idx):
+            self.csr = csr
+            self.idx = idx
+
+        def __getitem__(self, key):
+            return float(self.csr.arrays[key][self.idx])
+
+        def __setitem__(self, key, value):
+            self.csr.arrays[key][self.idx] = value
+            self.csr.Invalidate()
+
+        def __iter__(self):
+            return iter(self.csr.arrays)
+
+        def keys(self):
+            return self.csr.arrays.keys()
+
+        def items(self):
+            return ((key, self[key]) for key in self.csr.arrays)
+
+        def __repr__(self):
+            return str(dict(self.items()))
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-import heapq, random, glob, subprocess
+import heapq, random, glob, subprocess, math, hashlib
+from collections import OrderedDict
 import numpy as np
 from copy import deepcopy
 import numpy as np
 from random import randint, uniform
+from Utilities.Compact import CSR_Map
+from Utilities.Heat import Heat_Map
+from Utilities.Hierarchy import Contraction_Hierarchy
+from Utilities.Prism import Prism
+from Utilities.Transitions import Transition_Matrix
 
 # =============================================================================
 # Environment Creation Interface
@@ -14,17 +20,54 @@ from random import randint, uniform
     finding using Dijkstra's algorithm.    
 '''
 class Graph:
-    def __init__(self, n_nodes, ID, n_probs=3):
+    def __init__(self, n_nodes, ID, n_probs=3, backend="dict"):
         # Setup nodes and variables
         self.n_nodes = n_nodes  # Number of nodes in the environment
         self.n_probs = n_probs  # Number of probabilities (success, fail, return)
-        self.dist_array = np.zeros(shape=(n_nodes, n_nodes))
-        self.prob_array = np.zeros(shape=(n_nodes, n_nodes))
+        self.backend = backend  # Map representation ("dict" or "csr")
+
+        # The dense distance and probability arrays are only required to create the 
+        # dictionary map. The CSR map is created directly from the connections, which 
+        # prevents allocating two n_nodes x n_nodes arrays for large environments.
+        if backend == "csr":
+            self.dist_array = None
+            self.prob_array = None
+            self.__edges = dict()
+        else:
+            self.dist_array = np.zeros(shape=(n_nodes, n_nodes))
+            self.prob_array = np.zeros(shape=(n_nodes, n_nodes))
         self.map = dict()       # Default environment map
-        self.heat_map = dict()  # Adjusted heatmap.
+        self.heat_map = dict()  # Adjusted heatmap (overlay of the map, see Update_Heat).
         self.ID = ID
         self.connections = None # Map connections        
 
+        # Path cache for Dijkstra's algorithm. The map and heat map each have a version
+        # which is increased whenever their edge values change, and cached paths are 
+        # keyed by the version of the map they were created from.
+        self.map_version = 0
+        self.heat_version = 0
+        self.cache_size = 256
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.path_cache = OrderedDict()
+
+        # Landmarks for the A* search (see Create_Landmarks)
+        self.landmarks = None
+
+        # Contraction hierarchies for repeated queries (see Create_Hierarchy)
+        self.hierarchy = None
+
+        # All-pairs routing table of the default map (see Create_Routing_Table)
+        self.routing = None
+
+        # Synthesised policies towards each target, keyed by the target and the 
+        # version of the map they were created from (see Policy).
+        self.policies = OrderedDict()
+
+        # Transition matrices of the default map and heat map used by the native 
+        # solvers, stored with the version of the map (see Transitions).
+        self.transitions = {"map" : None, "heat" : None}
+
         # Variables for information.
         self.path = None
         self.paths = self.__Path()
@@ -48,6 +91,13 @@ class Graph:
             node_2 = c[1]
             distance = c[2]
             probability = c[3]
+
+            # The CSR backend does not use the dense arrays, so the edge values are 
+            # stored directly (mirrored in the same way as the arrays).
+            if self.dist_array is None:
+                self.__edges[(node_1, node_2)] = (distance, probability)
+                self.__edges[(node_2, node_1)] = (distance, probability)
+                continue
             
             # Update the value in the distance array for the first node and the 
             # second node. This should also be repeated as the array should be 
@@ -80,12 +130,18 @@ class Graph:
     # A map can also be created from a previously defined map. This helps eliminate
     # stochastic behaviour when creating the map, since many variables are randomly
     # computed, no two maps will ever be the same.
+    #
+    # If the graph was created with the "csr" backend, the map is stored as a 
+    # CSR_Map which provides the same dictionary interface using flat arrays.
     # =============================================================================
     def Create_Map(self, env_map=None):
         # The input variable env_map allows this instance to be created based on 
         # a previously created map. However, if this value is None, we should create 
         # the map from scratch. 
-        if env_map is None:
+        if env_map is None and self.backend == "csr":
+            self.map = self.__Create_CSR_Map()
+
+        elif env_map is None:
             # When creating the connections between each node, the connections are 
             # defined with two values: distance and probabilty. However, only the 
             # distance value is required with the probability optional. Therefore, 
@@ -146,19 +202,67 @@ class Graph:
         # from a previously defined map.                     
         else:
             # Crate a deep copy of the map to prevent values being known based on 
-            # memory addresses. 
-            self.map = deepcopy(env_map)
+            # memory addresses. The map is converted if it was created using a 
+            # different backend.
+            if self.backend == "csr" and not isinstance(env_map, CSR_Map):
+                self.map = CSR_Map.From_Dict(env_map)
+            elif self.backend != "csr" and isinstance(env_map, CSR_Map):
+                self.map = env_map.To_Dict()
+            else:
+                self.map = deepcopy(env_map)
             
             # If the map which was created does not have the same number of probabilities
-            # that are equal to 3, then we need to adjust the probabilities. 
-            if self.n_probs == 2:
+            # that are equal to 3, then we need to adjust the probabilities. For the CSR
+            # map this can be performed on the arrays directly.
+            if self.n_probs == 2 and isinstance(self.map, CSR_Map):
+                self.map.arrays['Fail'] = np.round(self.map.arrays['Fail'] + self.map.arrays['Return'], 2)
+                self.map.arrays['Return'] = np.zeros_like(self.map.arrays['Return'])
+                self.map.Invalidate()
+
+            elif self.n_probs == 2:
                 # We should add the "return" probability to the "fail" probability, and
                 # reset the "return" probabilty to zero as it won't be used. 
                 for node in self.map:
                     for conn in self.map[node]:
                         self.map[node][conn]['Fail'] = np.round(self.map[node][conn]["Fail"] + self.map[node][conn]['Return'], 2)
                         self.map[node][conn]['Return'] = 0
-                        
+
+        # The map has changed, so any cached paths are no longer valid.
+        self.map_version += 1
+
+    # =============================================================================
+    # Create CSR Map
+    # -----------------------------------------------------------------------------
+    # Internal method for creating the CSR map directly from the connections. This
+    # follows the same rules as the dictionary map: edges with zero distance are 
+    # ignored and probabilities are only created if the connections define them. 
+    # =============================================================================
+    def __Create_CSR_Map(self):
+        edges = {e : self.__edges[e] for e in self.__edges if self.__edges[e][0] != 0}
+
+        sources = [e[0] for e in edges]
+        targets = [e[1] for e in edges]
+        values = {"Distance" : [edges[e][0] for e in edges]}
+
+        if any(edges[e][1] for e in edges):
+            values["Success"] = list()
+            values["Return"] = list()
+            values["Fail"] = list()
+            values["Total"] = list()
+            for e in edges:
+                prob_success = edges[e][1] or 0
+                prob_fail, prob_return, total = self.__Random_Probabilities(prob_success)
+                if self.n_probs == 2:
+                    prob_fail += prob_return
+                    prob_return = 0
+
+                values["Success"].append(prob_success)
+                values["Return"].append(prob_return)
+                values["Fail"].append(prob_fail)
+                values["Total"].append(total)
+
+        return CSR_Map(self.n_nodes, sources, targets, values)
+
     # =============================================================================
     # Create Random Probabilities for Environment Map
     # -----------------------------------------------------------------------------
@@ -278,65 +382,226 @@ class Graph:
     #   2. human_position: current position of the human 
     #   3. scale1: scaling functionapplied when the edge has a dual conflict
     #   4. scale2: scaling function applied when the edge has a single conflict
+    #
+    # The heat map is an overlay of the default map (Heat_Map) which only stores 
+    # the edges connected to the human's position and path. If the position and 
+    # path of the human have not changed since the last update, the heat map is 
+    # not recomputed. The method returns True if the heat map was changed, in which 
+    # case the version of the heat map is increased.
+    #
+    # For CSR maps the engine can be set to "numpy", where the heat map is computed 
+    # using masked array operations over every edge (CSR_Map.Heat) and stored as a 
+    # CSR map. The numpy engine raises a ValueError for maps of the dict backend.
     # =============================================================================
-    def Update_Heat(self, human, scale1=0.5, scale2=0.90):
+    def Update_Heat(self, human, scale1=0.5, scale2=0.90, engine="overlay"):
         human_path = human.paths.selected.path
         human_position = human.dynamics.position
+        signature = (human_position, tuple(human_path), scale1, scale2)
+
+        if engine == "numpy":
+            if not isinstance(self.map, CSR_Map):
+                raise ValueError("The numpy heat map engine requires a map of the csr backend")
 
-        # Create a heat map based on the default map.
-        self.heat_map = deepcopy(self.map)
+            # Skip the update if the human has not moved and the predicted path is unchanged.
+            if isinstance(self.heat_map, CSR_Map) and self.heat_map.base is self.map and self.heat_map.signature == signature:
+                return False
+
+            arrays = self.map.Heat([human_path], [human_position], scale1, scale2)
+            previous = self.heat_map
+            self.heat_map = self.map.With_Values({key : arrays[key][0] for key in arrays})
+            self.heat_map.signature = signature
+
+            # Only increase the version if the values of the heat map have changed.
+            changed = not (isinstance(previous, CSR_Map) and previous.base is self.map and 
+                           all(np.array_equal(previous.arrays[key], self.heat_map.arrays[key]) for key in arrays))
+            if changed:
+                self.heat_version += 1
+            return changed
+
+        # Create a heat map overlay based on the default map.
+        if not isinstance(self.heat_map, Heat_Map) or self.heat_map.base is not self.map:
+            self.heat_map = Heat_Map(self.map)
+            self.heat_version += 1
+
+        # Skip the update if the human has not moved and the predicted path is unchanged.
+        if self.heat_map.signature == signature:
+            return False
+
+        # Remove the previous changes from the heat map.
+        previous = self.heat_map.edges
+        self.heat_map.Clear()
+        self.heat_map.signature = signature
         inv_scale1 = 1 - scale1
         inv_scale2 = 1 - scale2
+        path_nodes = set(human_path)
 
-        # Determine which connections should be adjusted based on the path.
+        # Determine which connections should be adjusted based on the path. Only the 
+        # connections to a node on the path, or the human's position, can be changed.
         # Iterate through each connection...
-        for c in self.connections:
+        for c in self.heat_map.Incident_Edges(path_nodes | {human_position}):
+            # Obtain the edge values from the default map.
+            edge = self.map[c[0]][c[1]]
+            success = edge["Success"]
+            ret = edge["Return"]
+            fail = edge["Fail"]
+
             # If both connections are in the path for the human, apply the harsher scale function
-            if (c[0] in human_path) and (c[1] in human_path):
-                success_scale =  np.round(self.heat_map[c[0]][c[1]]["Success"] * scale1, 5)  # Scale the success probability
-                remainder = np.round(self.heat_map[c[0]][c[1]]["Success"] * inv_scale1, 5)   # Calculate the remainder
+            if (c[0] in path_nodes) and (c[1] in path_nodes):
+                success_scale =  np.round(success * scale1, 5)  # Scale the success probability
+                remainder = np.round(success * inv_scale1, 5)   # Calculate the remainder
                 partition = np.round(remainder / 3, 5) # Scale the remainder to apply as return and fail offsets
 
-                self.heat_map[c[0]][c[1]]["Success"] = success_scale # Update the success prob for first edge
-                self.heat_map[c[0]][c[1]]["Return"] += partition*2   # Update the return state
-                self.heat_map[c[0]][c[1]]["Fail"] += partition       # Update the fail state
+                success = success_scale # Update the success prob for first edge
+                ret += partition*2      # Update the return state
+                fail += partition       # Update the fail state
                 
             # If only a single connection is in the path for the human, apply a reduced scale function
-            elif (c[0] in human_path) or (c[1] in human_path):
-                success_scale =  np.round(self.heat_map[c[0]][c[1]]["Success"] * scale2, 5)  # Scale the success probability
-                remainder = np.round(self.heat_map[c[0]][c[1]]["Success"] * inv_scale2, 5)    # Calculate the remainder
+            elif (c[0] in path_nodes) or (c[1] in path_nodes):
+                success_scale =  np.round(success * scale2, 5)  # Scale the success probability
+                remainder = np.round(success * inv_scale2, 5)    # Calculate the remainder
                 partition = np.round(remainder / 3, 5) # Scale the remainder to apply as return and fail offsets
 
-                self.heat_map[c[0]][c[1]]["Success"] = success_scale # Update the success prob for first edge
-                self.heat_map[c[0]][c[1]]["Return"] += partition*2   # Update the return state
-                self.heat_map[c[0]][c[1]]["Fail"] += partition       # Update the fail state
+                success = success_scale # Update the success prob for first edge
+                ret += partition*2      # Update the return state
+                fail += partition       # Update the fail state
             
             # If the position of the human is located at a node, we cannot move to that node
             # and if we are located at that node, we should NOT move from it and just hold 
             # position by setting the return statement to be 1
             if c[0] == human_position or c[1] == human_position:
-                self.heat_map[c[0]][c[1]]["Success"] = 0 # Set the success to 0
-                self.heat_map[c[0]][c[1]]["Return"] = 1  # Set the return to 1
-                self.heat_map[c[0]][c[1]]["Fail"] = 0    # Set the fail state to 0
+                success = 0 # Set the success to 0
+                ret = 1     # Set the return to 1
+                fail = 0    # Set the fail state to 0
 
             # Similarly, if a node is located along the next node for the predicted human's path, 
             # we should never attempt to go to it, so set the return statement to 1 and we will 
             # hold position. 
             elif c[0] == human_path[0] or c[1] == human_path[1]:
-                self.heat_map[c[0]][c[1]]["Success"] = 0 # Set the success to 0
-                self.heat_map[c[0]][c[1]]["Return"] = 1  # Set the return to 1
-                self.heat_map[c[0]][c[1]]["Fail"] = 0    # Set the fail state to 0
+                success = 0 # Set the success to 0
+                ret = 1     # Set the return to 1
+                fail = 0    # Set the fail state to 0
+
+            self.heat_map.Set_Edge(c[0], c[1], {"Success" : success, "Return" : ret, "Fail" : fail})
+
+        # Only increase the version if the values of the heat map have changed.
+        changed = self.heat_map.edges != previous
+        if changed:
+            self.heat_version += 1
+        return changed
 
 
     # =============================================================================
     # Dijkstra's Algorithm for Path Finding
+    # -----------------------------------------------------------------------------
+    # Dijkstra's algorithm creates a tree of the best paths from the start node to
+    # every other node in the map (Dijkstra_Tree). The path to the final node is 
+    # then extracted from the tree (Tree_Path). 
+    #
+    # Paths found on the default map or the heat map are stored in a least recently 
+    # used cache, keyed by the start, final, method and version of the map. If the 
+    # map has not changed, the path is returned from the cache without a search.
+    #
+    # The engine can be set to "alt", which uses the A* search with landmark lower
+    # bounds (A_Star) instead of solving the full tree, "ch", which uses the 
+    # contraction hierarchy of the default map (Hierarchy_Search), or "table", which
+    # reads the path from the all-pairs routing table (Table_Search).
     # =============================================================================
-    def Dijkstra(self, start, final, path_class=None, method="Distance", secondary="Success", map=None):       
+    def Dijkstra(self, start, final, path_class=None, method="Distance", secondary="Success", map=None, engine="dijkstra"):       
         # We want to be able to use updated heatmaps, so if the map variable is None, use the default map, 
         # else, set the map to be the map passed into the method. 
         if map is None:
             map = self.map  # Set the map to be the default map
 
+        # Determine the cache key. Maps which are not owned by this graph are not cached
+        # as we do not know when they change.
+        key = None
+        if map is self.map:
+            key = (start, final, method, engine, "map", self.map_version)
+        elif map is self.heat_map:
+            key = (start, final, method, engine, "heat", self.heat_version)
+
+        if key is not None and key in self.path_cache:
+            self.cache_hits += 1
+            self.path_cache.move_to_end(key)
+            path, distance, probability = self.path_cache[key]
+            path = list(path)   # Paths are modified by the simulation, so return a copy
+
+        else:
+            # Solve the tree for the start node and extract the path to the final node.
+            if engine == "alt":
+                tree = self.A_Star(start, final, method=method, map=map)
+            elif engine == "ch":
+                tree = self.Hierarchy_Search(start, final, method=method, map=map)
+            elif engine == "table":
+                tree = self.Table_Search(start, final, method=method, map=map)
+            else:
+                tree = self.Dijkstra_Tree(start, method=method, map=map)
+            path, distance, probability = self.Tree_Path(tree, final, map=map)
+
+            # Store the path in the cache and remove the least recently used path.
+            if key is not None:
+                self.cache_misses += 1
+                self.path_cache[key] = (tuple(path), distance, probability)
+                if len(self.path_cache) > self.cache_size:
+                    self.path_cache.popitem(last=False)
+            
+        # The method input has a "path_class" which indicates a map has been 
+        # applied for which the path solution can been appended to.
+        if path_class is not None:
+            # Create the exportation for the class.
+            path_class.path = path
+            path_class.length = distance
+            path_class.prob = probability
+            path_class.valid = None # Reset the validation value.
+            return self
+        
+        # The method does not have a class to update the values in. Therefore, 
+        # we will return the raw values for the path, distance and probability.
+        else: 
+            return path, distance, probability
+
+    # =============================================================================
+    # Path Cache Statistics
+    # -----------------------------------------------------------------------------
+    # Return the number of hits and misses of the path cache. The cache can be 
+    # cleared if a map is modified outside of Create_Map or Update_Heat.
+    # =============================================================================
+    def Cache_Statistics(self):
+        total = self.cache_hits + self.cache_misses
+        return {"Hits"     : self.cache_hits, 
+                "Misses"   : self.cache_misses, 
+                "Hit Rate" : self.cache_hits / total if total > 0 else 0, 
+                "Size"     : len(self.path_cache)}
+
+    def Clear_Cache(self):
+        self.path_cache = OrderedDict()
+        self.policies = OrderedDict()
+        self.map_version += 1
+        self.heat_version += 1
+
+    # =============================================================================
+    # Single-Source Dijkstra Tree
+    # -----------------------------------------------------------------------------
+    # Perform the search from the start node over the entire map. The tree stores 
+    # the predecessor of every node along with the best value (distance or 
+    # probability) from the start node, which allows paths to every node to be 
+    # extracted without repeating the search.
+    # =============================================================================
+    def Dijkstra_Tree(self, start, method="Distance", map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        # The CSR map and heat map overlay provide adjacency lists of (neighbour, value) 
+        # which avoids creating the dictionary views for every edge during the search.
+        adjacency = None
+        if hasattr(map, "Adjacency") and method in ("Distance", "Probability"):
+            adjacency = map.Adjacency("Distance" if method == "Distance" else "Success")
+
+        # Each node is settled (expanded) only once, when it is removed from the heap 
+        # with its final value. Entries left in the heap from earlier, worse values 
+        # are skipped. The number of expansions is stored with the tree.
+        settled = set()
+
         if method == "Distance":
             # We are using Dijkstra's algorithm to minimise distance.
             nodes = {k : np.inf for k in map.keys()}
@@ -350,15 +615,25 @@ class Graph:
             while connections:
                 # obtain the current lowest distance in the heap array
                 curr_distance, curr_node = heapq.heappop(connections)
+
+                # Skip nodes which have already been settled.
+                if curr_node in settled:
+                    continue
+                settled.add(curr_node)
                 
                 # Iterate through each neighbour at the current node location
                 # for neighbour, edge_dist in self.map[curr_node].items():
-                for connection in map[curr_node].items():
+                if adjacency is not None:
+                    connections_node = adjacency[curr_node]
+                else:
+                    connections_node = [(n, e["Distance"]) for n, e in map[curr_node].items()]
+
+                for connection in connections_node:
                     # the connection variable will return a list with two values:
                     #  - the connecting neighbour
-                    #  - and the values of distance, success.... etc within the map for this neighbour
+                    #  - and the distance within the map for this neighbour
                     neighbour = connection[0]
-                    edge = connection[1]["Distance"]
+                    edge = connection[1]
                     
                     # Calculate the new distance using the current distance and the distance 
                     # to the neighbour
@@ -371,30 +646,46 @@ class Graph:
                         
                         # push the connection for the current distance and neighbour
                         heapq.heappush(connections, (new_distance, neighbour))
+
         
         elif method == "Probability":
-            # We are using Dijkstra's to maximise probability.
+            # We are using Dijkstra's to maximise probability. Since every edge has a 
+            # probability no greater than one, the probability along a path can only 
+            # decrease, so the most likely node in the heap is final when it is removed. 
+            # heapq is a min-heap, therefore the negative probability is pushed to 
+            # remove the most likely node first.
             nodes = {k : 0 for k in map.keys()}
             nodes[start] = 1 # Set the edge we are starting at to the maximum expected value.
             prev_node = dict()
             
             # create connection list and use heapq priorty queue
             connections = list()
-            heapq.heappush(connections, (0, start))
+            heapq.heappush(connections, (-1, start))
             
             # While we have a node in the heap
             while connections: 
-                # obtain the current lowest 
+                # obtain the current highest probability in the heap array
                 curr_prob, curr_node = heapq.heappop(connections)
+                curr_prob = -curr_prob
+
+                # Skip nodes which have already been settled.
+                if curr_node in settled:
+                    continue
+                settled.add(curr_node)
                 
                 # Iterate through each neighbour at the current node location
                 # for neighbour, edge_dist in self.map[curr_node].items():
-                for connection in map[curr_node].items():
+                if adjacency is not None:
+                    connections_node = adjacency[curr_node]
+                else:
+                    connections_node = [(n, e["Success"]) for n, e in map[curr_node].items()]
+
+                for connection in connections_node:
                     # the connection variable will return a list with two values:
                     #  - the connecting neighbour
-                    #  - and the values of distance, success.... etc within the map for this neighbour
+                    #  - and the probability of success within the map for this neighbour
                     neighbour = connection[0]
-                    edge = connection[1]["Success"]# + connection[1]["Return"]
+                    edge = connection[1]# + connection[1]["Return"]
 
                     # If the success of moving across an edge is 0, this means a path 
                     # should not be created for this node. However, if this is a one-way 
@@ -405,24 +696,578 @@ class Graph:
                         edge = 0.05
 
                     # calculate the new probability to the neighbour
-                    if curr_prob == 0:
-                        new_probability = edge
-                    else:
-                        new_probability = curr_prob * edge
+                    new_probability = curr_prob * edge
     
-                    # If the new probability is less than the known probability to that neighbour, update its value
+                    # If the new probability is greater than the known probability to that neighbour, update its value
                     if new_probability > nodes[neighbour]:
                         nodes[neighbour] = new_probability
                         prev_node[neighbour] = curr_node
                         
-            
                         # Push the connection for the current probability and neighbour 
-                        heapq.heappush(connections, (new_probability, neighbour))
+                        heapq.heappush(connections, (-new_probability, neighbour))
+
         
         # If the input method was not recognised.
         else:
             print("Optional methods are: 'Distance' or 'Probability'")
-            
+            return None
+
+        return {"Start" : start, "Method" : method, "Values" : nodes, "Previous" : prev_node, "Expanded" : len(settled)}
+
+    # =============================================================================
+    # Create Landmarks
+    # -----------------------------------------------------------------------------
+    # The A* search uses lower bounds on the remaining cost to the final node, 
+    # which are created from a small number of landmark nodes using the triangle 
+    # inequality. For a landmark L, and the costs d(L, n) from the landmark and 
+    # d(n, L) to the landmark:
+    #       cost(n, final) >= d(L, final) - d(L, n)
+    #       cost(n, final) >= d(n, L) - d(final, L)
+    #
+    # The costs are computed once for the default map, for both the distance and 
+    # the -log(success) weights used by the probability search. The landmarks are
+    # selected as the nodes furthest (by distance) from the landmarks already 
+    # selected. 
+    #
+    # The heat map only reduces the probability of success, therefore the bounds 
+    # created for the default map remain valid for the heat map. Whether the map 
+    # has edges of zero cost (see A_Star) is stored for each method.
+    # =============================================================================
+    def Create_Landmarks(self, n_landmarks=8):
+        weights = {"Distance" : self.__Search_Weights(self.map, "Distance"),
+                   "Probability" : self.__Search_Weights(self.map, "Probability", bound=True)}
+
+        # Reverse the adjacency lists to obtain the costs to the landmarks.
+        reverse = dict()
+        for method in weights:
+            reverse[method] = [list() for n in range(len(weights[method]))]
+            for node, connections in enumerate(weights[method]):
+                for neighbour, weight in connections:
+                    reverse[method][neighbour].append((node, weight))
+
+        # Select the landmarks, starting with the node furthest from the first node.
+        nodes = list(self.map.keys())
+        landmarks = list()
+        closest = self.__Search_Costs(weights["Distance"], nodes[0])
+        for i in range(min(n_landmarks, len(nodes))):
+            reachable = np.where(np.isfinite(closest), closest, -1)
+            reachable[0] = -1
+            landmark = int(np.argmax(reachable))
+            landmarks.append(landmark)
+            closest = np.minimum(closest, self.__Search_Costs(weights["Distance"], landmark))
+
+        self.landmarks = {"Nodes" : landmarks, "Version" : self.map_version, "From" : dict(), "To" : dict(), "Zero" : dict()}
+        for method in weights:
+            self.landmarks["Zero"][method] = any(weight == 0 for connections in weights[method] for neighbour, weight in connections)
+            self.landmarks["From"][method] = np.array([self.__Search_Costs(weights[method], l) for l in landmarks])
+            self.landmarks["To"][method] = np.array([self.__Search_Costs(reverse[method], l) for l in landmarks])
+
+        return self.landmarks
+
+    # =============================================================================
+    # Search Weights
+    # -----------------------------------------------------------------------------
+    # Internal method to create the adjacency lists of (neighbour, weight) for the 
+    # distance or probability method, where the probability weight is -log(success). 
+    # Edges with zero success are given the same 0.05 probability as the Dijkstra 
+    # search. If bound is True, the weights are limited so they never exceed the 
+    # weight of a blocked edge in the heat map.
+    # =============================================================================
+    def __Search_Weights(self, map, method, bound=False):
+        key = "Distance" if method == "Distance" else "Success"
+        if hasattr(map, "Adjacency"):
+            adjacency = map.Adjacency(key)
+        else:
+            adjacency = [list()] + [[(n, e[key]) for n, e in map[node].items()] for node in range(1, max(map)+1)]
+
+        if method == "Distance":
+            return adjacency
+
+        max_weight = -math.log(0.05)
+        weights = list()
+        for connections in adjacency:
+            row = [(n, -math.log(p if p != 0 else 0.05)) for n, p in connections]
+            if bound:
+                row = [(n, min(w, max_weight)) for n, w in row]
+            weights.append(row)
+        return weights
+
+    # =============================================================================
+    # Search Costs
+    # -----------------------------------------------------------------------------
+    # Internal method to compute the minimum cost from the source node to every 
+    # node using adjacency lists of (neighbour, weight).
+    # =============================================================================
+    def __Search_Costs(self, adjacency, source):
+        costs = np.full(len(adjacency), np.inf)
+        costs[source] = 0
+        settled = set()
+        heap = [(0, source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            for neighbour, weight in adjacency[node]:
+                if cost + weight < costs[neighbour]:
+                    costs[neighbour] = cost + weight
+                    heapq.heappush(heap, (cost + weight, neighbour))
+        return costs
+
+    # =============================================================================
+    # A* Search with Landmarks (ALT)
+    # -----------------------------------------------------------------------------
+    # Search from the start node towards the final node, ordering the heap by the 
+    # cost so far plus the landmark lower bound of the remaining cost. Only a small 
+    # part of the map is explored when the final node is close. 
+    #
+    # The probability search uses the -log(success) weights, while the values of 
+    # the returned tree are the probabilities along the path (as with Dijkstra).
+    # The path is identical to the Dijkstra path. Dijkstra settles nodes in order 
+    # of their value and then their number, and keeps the first previous node 
+    # which reaches the best value. The search therefore continues until every 
+    # node which could be a previous node of the path is settled, and paths of 
+    # equal value are resolved to the previous node settled first by Dijkstra.
+    # This order is only known when every edge has a cost, so maps with edges of 
+    # zero cost (a distance of 0, or a success of 1) use Dijkstra_Tree.
+    #
+    # The landmarks are created if they do not exist or the map has changed. Maps 
+    # which were not created from the default map use a lower bound of zero.
+    # =============================================================================
+    def A_Star(self, start, final, method="Distance", map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        if self.landmarks is None or self.landmarks["Version"] != self.map_version:
+            self.Create_Landmarks(n_landmarks=8 if self.landmarks is None else len(self.landmarks["Nodes"]))
+
+        # Lower bounds of the remaining cost to the final node for every node.
+        if map is self.map or getattr(map, "base", None) is self.map:
+            if self.landmarks["Zero"][method]:
+                return self.Dijkstra_Tree(start, method=method, map=map)
+
+            from_landmark = self.landmarks["From"][method]
+            to_landmark = self.landmarks["To"][method]
+            bounds = np.maximum(from_landmark[:, [final]] - from_landmark, to_landmark - to_landmark[:, [final]])
+            bounds = np.nan_to_num(bounds, nan=0, posinf=0, neginf=0)
+            bounds = np.maximum(bounds.max(axis=0), 0).tolist()
+        else:
+            if any(weight == 0 for connections in self.__Search_Weights(map, method) for neighbour, weight in connections):
+                return self.Dijkstra_Tree(start, method=method, map=map)
+
+            bounds = [0] * (max(map)+1)
+
+        # Adjacency lists of (neighbour, distance) or (neighbour, success).
+        key = "Distance" if method == "Distance" else "Success"
+        if hasattr(map, "Adjacency"):
+            adjacency = map.Adjacency(key)
+        else:
+            adjacency = None
+
+        # The values are compared in the same way as Dijkstra (the sum of distances or
+        # the product of probabilities) so a path of the same value is found. The heap
+        # is ordered using the distance, or -log(probability), plus the lower bound.
+        values = {start : 0 if method == "Distance" else 1}
+        prev_node = dict()
+        settled = set()
+
+        # The order in which Dijkstra settles the nodes.
+        if method == "Distance":
+            order = lambda node: (values[node], node)
+        else:
+            order = lambda node: (-values[node], node)
+
+        # Every previous node of the path has an estimate no greater than the cost 
+        # of the final node, so the search stops at the first estimate above it 
+        # (with a tolerance for the rounding of the bounds).
+        limit = np.inf
+        heap = [(bounds[start], start)]
+        while heap:
+            estimate, curr_node = heapq.heappop(heap)
+            if estimate > limit:
+                break
+            if curr_node in settled:
+                continue
+            settled.add(curr_node)
+            if curr_node == final:
+                cost = values[final] if method == "Distance" else -math.log(values[final])
+                limit = cost + 1e-9 * (1 + cost)
+                continue
+
+            if adjacency is not None:
+                connections_node = adjacency[curr_node]
+            else:
+                connections_node = [(n, e[key]) for n, e in map[curr_node].items()]
+
+            curr_value = values[curr_node]
+            for neighbour, edge in connections_node:
+                if method == "Distance":
+                    new_value = curr_value + edge
+                    better = new_value < values.get(neighbour, np.inf)
+                else:
+                    if edge == 0:
+                        edge = 0.05
+                    new_value = curr_value * edge
+                    better = new_value > values.get(neighbour, 0)
+
+                if better:
+                    values[neighbour] = new_value
+                    prev_node[neighbour] = curr_node
+                    settled.discard(neighbour)
+
+                    cost = new_value if method == "Distance" else -math.log(new_value)
+                    heapq.heappush(heap, (cost + bounds[neighbour], neighbour))
+
+                # Paths of equal value are resolved to the previous node which Dijkstra 
+                # settles first. Every edge has a cost, so the previous node is always 
+                # better than the node and the previous nodes cannot form a loop.
+                elif new_value == values.get(neighbour) and neighbour in prev_node and order(curr_node) < order(prev_node[neighbour]):
+                    prev_node[neighbour] = curr_node
+
+        return {"Start" : start, "Method" : method, "Values" : values, "Previous" : prev_node, "Expanded" : len(settled)}
+
+    # =============================================================================
+    # Contraction Hierarchy
+    # -----------------------------------------------------------------------------
+    # Create the contraction hierarchy (see Utilities/Hierarchy.py) of the default 
+    # map for each method, using the distance or the -log(success) weights. This 
+    # is performed once, after which queries only search a small part of the map.
+    # The hierarchy is only valid for the version of the map it was created from.
+    # =============================================================================
+    def Create_Hierarchy(self, methods=("Distance", "Probability")):
+        if self.hierarchy is None or self.hierarchy["Version"] != self.map_version:
+            self.hierarchy = {"Version" : self.map_version}
+        for method in methods:
+            self.hierarchy[method] = Contraction_Hierarchy(self.__Search_Weights(self.map, method))
+
+        return self.hierarchy
+
+    # =============================================================================
+    # Contraction Hierarchy Search
+    # -----------------------------------------------------------------------------
+    # Find the path from the start node to the final node using the contraction 
+    # hierarchy, and return it as a tree (of the single path) for Tree_Path. The 
+    # values along the path are computed in the same way as Dijkstra.
+    #
+    # The hierarchy is created if it does not exist or the map has changed. Any 
+    # other map (such as the heat map) changes the edge weights, so the search 
+    # falls back to Dijkstra_Tree.
+    # =============================================================================
+    def Hierarchy_Search(self, start, final, method="Distance", map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        if map is not self.map:
+            return self.Dijkstra_Tree(start, method=method, map=map)
+
+        if self.hierarchy is None or self.hierarchy["Version"] != self.map_version or method not in self.hierarchy:
+            self.Create_Hierarchy(methods=(method,))
+
+        path, cost, expanded = self.hierarchy[method].Query(start, final)
+
+        values = {start : 0 if method == "Distance" else 1}
+        prev_node = dict()
+        if path is not None:
+            key = "Distance" if method == "Distance" else "Success"
+            adjacency = map.Adjacency(key) if hasattr(map, "Adjacency") else None
+            for i in range(len(path)-1):
+                if adjacency is not None:
+                    edge = next(e for n, e in adjacency[path[i]] if n == path[i+1])
+                else:
+                    edge = map[path[i]][path[i+1]][key]
+                if method == "Distance":
+                    values[path[i+1]] = values[path[i]] + edge
+                else:
+                    values[path[i+1]] = values[path[i]] * (edge if edge != 0 else 0.05)
+                prev_node[path[i+1]] = path[i]
+
+        return {"Start" : start, "Method" : method, "Values" : values, "Previous" : prev_node, "Expanded" : expanded}
+
+    # =============================================================================
+    # Map Hash
+    # -----------------------------------------------------------------------------
+    # Create a hash of the edges and values of a map (the default map if None). 
+    # Unlike the map version, the hash is the same for identical maps in different 
+    # processes, so it can be used to identify tables and results saved to disk.
+    # =============================================================================
+    def Map_Hash(self, map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        if isinstance(map, CSR_Map):
+            sources = map.sources
+            targets = map.neighbours
+            arrays = map.arrays
+        else:
+            edges = [(node, conn) for node in sorted(map) for conn in sorted(map[node])]
+            sources = np.array([e[0] for e in edges], dtype=np.int32)
+            targets = np.array([e[1] for e in edges], dtype=np.int32)
+            keys = map[edges[0][0]][edges[0][1]].keys() if edges else []
+            arrays = {key : np.array([map[e[0]][e[1]][key] for e in edges], dtype=np.float64) for key in keys}
+
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(sources, dtype=np.int32).tobytes())
+        digest.update(np.ascontiguousarray(targets, dtype=np.int32).tobytes())
+        for key in sorted(arrays):
+            digest.update(key.encode())
+            digest.update(np.ascontiguousarray(arrays[key], dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    # =============================================================================
+    # All-Pairs Routing Table
+    # -----------------------------------------------------------------------------
+    # Solve the Dijkstra tree from every node of the default map and store the 
+    # predecessors as a matrix, Previous[start, node], along with the values 
+    # (distance or probability) as a matrix, Values[start, node]. The path between 
+    # any two nodes is then read from the table without a search, and is the same
+    # path returned by Dijkstra. 
+    #
+    # The predecessors use the smallest unsigned integer type which can store the 
+    # node numbers, with 0 used where there is no predecessor. The table requires
+    # (n_nodes+1)^2 values, so it is intended for building sized maps.
+    # =============================================================================
+    def Create_Routing_Table(self, method="Distance"):
+        n_nodes = max(self.map)
+        if n_nodes < np.iinfo(np.uint8).max:
+            dtype = np.uint8
+        elif n_nodes < np.iinfo(np.uint16).max:
+            dtype = np.uint16
+        else:
+            dtype = np.uint32
+
+        previous = np.zeros(shape=(n_nodes+1, n_nodes+1), dtype=dtype)
+        values = np.full(shape=(n_nodes+1, n_nodes+1), fill_value=np.inf if method == "Distance" else 0, dtype=np.float64)
+        for start in self.map:
+            tree = self.Dijkstra_Tree(start, method=method)
+            nodes = list(tree["Previous"])
+            previous[start, nodes] = list(tree["Previous"].values())
+            nodes = list(tree["Values"])
+            values[start, nodes] = list(tree["Values"].values())
+
+        self.routing = {"Method" : method, "Version" : self.map_version, "Hash" : self.Map_Hash(),
+                        "Previous" : previous, "Values" : values}
+        return self.routing
+
+    # =============================================================================
+    # Save and Load the Routing Table
+    # -----------------------------------------------------------------------------
+    # The routing table is saved as a numpy archive, allowing it to be reused in
+    # later episodes or by other processes. A table is only loaded if the hash of 
+    # the map it was created from matches the default map, and True is returned
+    # if the table was loaded.
+    # =============================================================================
+    def Save_Routing_Table(self, file_name):
+        # The table is written through the file, as np.savez would otherwise add the 
+        # .npz extension to the file name and the table could not be found again.
+        with open(file_name, "wb") as f:
+            np.savez(f, Method=self.routing["Method"], Hash=self.routing["Hash"],
+                     Previous=self.routing["Previous"], Values=self.routing["Values"])
+
+    def Load_Routing_Table(self, file_name):
+        data = np.load(file_name)
+        if str(data["Hash"]) != self.Map_Hash():
+            return False
+
+        self.routing = {"Method" : str(data["Method"]), "Version" : self.map_version, "Hash" : str(data["Hash"]),
+                        "Previous" : data["Previous"], "Values" : data["Values"]}
+        return True
+
+    # =============================================================================
+    # Routing Table Search
+    # -----------------------------------------------------------------------------
+    # Read the path from the start node to the final node from the routing table, 
+    # and return it as a tree (of the single path) for Tree_Path. The table is 
+    # created if it does not exist, or the map or method has changed. Any other 
+    # map (such as the heat map) falls back to Dijkstra_Tree.
+    # =============================================================================
+    def Table_Search(self, start, final, method="Distance", map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        if map is not self.map:
+            return self.Dijkstra_Tree(start, method=method, map=map)
+
+        if self.routing is None or self.routing["Version"] != self.map_version or self.routing["Method"] != method:
+            self.Create_Routing_Table(method=method)
+
+        previous = self.routing["Previous"][start]
+        values = {start : 0 if method == "Distance" else 1}
+        prev_node = dict()
+        if final != start and previous[final] != 0:
+            values[final] = float(self.routing["Values"][start, final])
+            node = final
+            while node != start:
+                prev_node[node] = int(previous[node])
+                node = prev_node[node]
+
+        return {"Start" : start, "Method" : method, "Values" : values, "Previous" : prev_node, "Expanded" : len(prev_node)}
+
+    # =============================================================================
+    # Transition Matrix
+    # -----------------------------------------------------------------------------
+    # Return the transition matrix of a map (see Transition_Matrix), which is used 
+    # by the native solvers. The matrices of the default map and the heat map are 
+    # created once for each version of the map. The heat map overlay only patches
+    # the changed edges of the default map's matrix.
+    # =============================================================================
+    def Transitions(self, map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        if map is self.map:
+            slot, version = "map", self.map_version
+        elif map is self.heat_map:
+            slot, version = "heat", self.heat_version
+        else:
+            return Transition_Matrix.From_Map(map)
+
+        stored = self.transitions[slot]
+        if stored is not None and stored[0] == version and stored[1] is map:
+            return stored[2]
+
+        if isinstance(map, Heat_Map) and map.base is self.map:
+            matrix = self.Transitions(self.map).Apply_Heat(map)
+        else:
+            matrix = Transition_Matrix.From_Map(map)
+        self.transitions[slot] = (version, map, matrix)
+        return matrix
+
+    # =============================================================================
+    # Policy
+    # -----------------------------------------------------------------------------
+    # Return the policy which maximises the probability of reaching the final node 
+    # from every node, as a table of the next node {node : next}. The policy is 
+    # synthesised using PRISM (Prism.Synthesise_Policy), or in-process using value
+    # iteration if the engine is "native" (see Create_Policies). Policies are 
+    # created once for each target and version of the default map or heat map, 
+    # and are then reused until the map changes. Policies for other maps are not 
+    # stored.
+    # =============================================================================
+    def Policy(self, final, map=None, prism_path=None, engine="prism"):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        key = self.__Policy_Key(final, map, engine)
+        if key is not None and key in self.policies:
+            self.policies.move_to_end(key)
+            return self.policies[key]
+
+        if engine == "native":
+            return self.Create_Policies(targets=[final], map=map)[0][final]
+        
+        policy = Prism.Synthesise_Policy(prism_path, map, final)
+        self.__Store_Policy(key, policy)
+
+        return policy
+
+    # =============================================================================
+    # Create Policies
+    # -----------------------------------------------------------------------------
+    # Create the maximum probability policies of many target nodes at once using
+    # value iteration over the edge arrays of the map (Prism.Value_Iteration). The
+    # policies {target : {node : next}} are stored in the same way as Policy, and 
+    # are returned with the expected distance travelled by each policy from every
+    # node {target : array}. All nodes are used as targets if none are given.
+    # =============================================================================
+    def Create_Policies(self, targets=None, map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+        if targets is None:
+            targets = list(range(1, self.n_nodes+1))
+
+        solution = Prism.Value_Iteration(map, targets, transitions=self.Transitions(map))
+        policies = dict()
+        distances = dict()
+        for i, target in enumerate(solution["Targets"]):
+            table = solution["Policy"][i]
+            nodes = np.flatnonzero(table)
+            policies[target] = dict(zip(nodes.tolist(), table[nodes].tolist()))
+            distances[target] = solution["Distance"][i]
+            self.__Store_Policy(self.__Policy_Key(target, map, "native"), policies[target])
+
+        return policies, distances
+
+    # =============================================================================
+    # Policy Key
+    # -----------------------------------------------------------------------------
+    # Internal method for the key of a policy, or None if the policy is not stored.
+    # =============================================================================
+    def __Policy_Key(self, final, map, engine):
+        if map is self.map:
+            return (final, engine, "map", self.map_version)
+        elif map is self.heat_map:
+            return (final, engine, "heat", self.heat_version)
+        return None
+
+    # =============================================================================
+    # Store Policy
+    # -----------------------------------------------------------------------------
+    # Internal method which adds a policy to the cache, removing the least recently
+    # used policy if the cache is full.
+    # =============================================================================
+    def __Store_Policy(self, key, policy):
+        if key is None:
+            return
+        self.policies[key] = policy
+        if len(self.policies) > self.cache_size:
+            self.policies.popitem(last=False)
+
+    # =============================================================================
+    # Policy Path
+    # -----------------------------------------------------------------------------
+    # Create the path from the start node to the final node by following the next 
+    # node of the policy (see Policy). The path is returned (or applied to the 
+    # path class) in the same way as Dijkstra, with the probability of the path 
+    # computed in the same way as the probability method. If the policy does not 
+    # reach the final node, the path of highest probability is used instead.
+    # =============================================================================
+    def Policy_Path(self, start, final, path_class=None, map=None, prism_path=None, engine="prism"):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        policy = self.Policy(final, map=map, prism_path=prism_path, engine=engine)
+
+        # Follow the policy until the final node is reached, or a node is repeated.
+        path = [start]
+        visited = {start}
+        while path[-1] != final and policy.get(path[-1]) is not None and policy[path[-1]] not in visited:
+            path.append(policy[path[-1]])
+            visited.add(path[-1])
+
+        if path[-1] != final:
+            return self.Dijkstra(start, final, path_class, method="Probability", map=map)
+
+        distance = 0
+        probability = 1
+        for i in range(len(path)-1):
+            edge = map[path[i]][path[i+1]]
+            distance += edge["Distance"]
+            probability *= edge["Success"] if edge["Success"] != 0 else 0.05
+
+        if path_class is not None:
+            path_class.path = path
+            path_class.length = distance
+            path_class.prob = probability
+            path_class.valid = None # Reset the validation value.
+            return self
+
+        else: 
+            return path, distance, probability
+
+    # =============================================================================
+    # Extract Path from Dijkstra Tree
+    # -----------------------------------------------------------------------------
+    # Using the tree created by Dijkstra_Tree, create the path from the start node 
+    # of the tree to the final node, along with the distance and probability of 
+    # the path.
+    # =============================================================================
+    def Tree_Path(self, tree, final, map=None):
+        if map is None:
+            map = self.map  # Set the map to be the default map
+
+        start = tree["Start"]
+        method = tree["Method"]
+        prev_node = tree["Previous"]
         
         # Create the path
         path_position = final
@@ -430,7 +1275,7 @@ class Graph:
         
         # To create the path we need to traverse the predecessor locations from 
         # the final position to the start location.
-        while path_position is not start:
+        while path_position != start:
             next_position = prev_node[path_position]
             path.append(next_position)
             path_position = next_position
@@ -444,7 +1289,7 @@ class Graph:
                 x_1 = path[i]
                 x_2 = path[i+1]
                 probability *= (map[x_1][x_2]["Success"] + map[x_1][x_2]["Return"])
-            distance = nodes[final]
+            distance = tree["Values"][final]
         
         elif method == "Probability":
             distance = 0
@@ -452,22 +1297,9 @@ class Graph:
                 x_1 = path[i]
                 x_2 = path[i+1]
                 distance += map[x_1][x_2]["Distance"]
-            probability = nodes[final]
-            
-        # The method input has a "path_class" which indicates a map has been 
-        # applied for which the path solution can been appended to.
-        if path_class is not None:
-            # Create the exportation for the class.
-            path_class.path = path
-            path_class.length = distance
-            path_class.prob = probability
-            path_class.valid = None # Reset the validation value.
-            return self
-        
-        # The method does not have a class to update the values in. Therefore, 
-        # we will return the raw values for the path, distance and probability.
-        else: 
-            return path, distance, probability
+            probability = tree["Values"][final]
+
+        return path, distance, probability
     
     # =============================================================================
     #  Method for validating a created path using the PRISM class.
@@ -480,19 +1312,16 @@ class Graph:
     # the probabilty of success obtained through PRISM is usually larger than that 
     # returned using Dijkstra. 
     # =============================================================================
-    def Validate_Path(self, prism_path, path):
+    def Validate_Path(self, prism_path, path, engine="prism"):
         
         # To validate the path using PRISM we need to create the appropriate 
         # actions for the PRISM model using the created path.
         action = Prism.Generate_Action(self.map, num_solutions=1, initial_guess=path)
         
-        # Generate PRISM code and compile the PRISM model.
-        code = Prism.Create_Model(self.map, self.position, path[-1], action[0,:])
-        file_path, model_name = Prism.Export_Model(code, file_name="Model_1.prism")
-        
-        # Run the PRISM model and obtain the validation value from the PCTL.
-        validation = Prism.Simulate(prism_path, file_path+model_name, output_files=True)
-        
+        # Obtain the validation value from the PCTL, either using PRISM or the native
+        # solver (see Prism.Validate).
+        nodes = self.Transitions() if engine == "native" else self.map
+        validation = Prism.Validate(prism_path, nodes, self.dynamics.position, path[-1], action[0,:], engine=engine)
         
         return validation
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# =============================================================================
+# Heat Map Overlay
+# =============================================================================
+''' The heat map adjusts the probabilities of the edges surrounding the human's
+    position and predicted path. Rather than copying the entire map every time
+    the heat map is updated, the overlay only stores the edges which have been
+    changed, with every other value read from the base map.
+
+    The overlay behaves like the map dictionary, heat_map[node][neighbour]["Success"],
+    and clearing the overlay only requires removing the changed edges.
+'''
+class Heat_Map:
+    def __init__(self, base):
+        self.base = base            # Map which the overlay is applied to
+        self.edges = dict()         # Changed edges {(node, neighbour) : {value : ...}}
+        self.rows = dict()          # Changed neighbours for each node {node : set()}
+        self.signature = None       # Human position and path used to create the overlay
+        self.__incoming = None      # Incoming connections for each node in the base map
+        self.__patched = dict()     # Cached adjacency lists for the changed rows
+
+    # =============================================================================
+    # Clear
+    # -----------------------------------------------------------------------------
+    # Remove every changed edge from the overlay, returning it to the base map.
+    # =============================================================================
+    def Clear(self):
+        self.edges = dict()
+        self.rows = dict()
+        self.signature = None
+        self.__patched = dict()
+
+    # =============================================================================
+    # Set Edge
+    # -----------------------------------------------------------------------------
+    # Store the changed values of an edge in the overlay.
+    # =============================================================================
+    def Set_Edge(self, node, neighbour, values):
+        if (node, neighbour) not in self.edges:
+            self.edges[(node, neighbour)] = dict()
+            self.rows.setdefault(node, set()).add(neighbour)
+        self.edges[(node, neighbour)].update(values)
+        self.__patched = dict()
+
+    # =============================================================================
+    # Incident Edges
+    # -----------------------------------------------------------------------------
+    # Return every edge (outgoing and incoming) connected to the given nodes. The
+    # incoming connections are created once for the base map.
+    # =============================================================================
+    def Incident_Edges(self, nodes):
+        if self.__incoming is None:
+            self.__incoming = dict()
+            for node in self.base:
+                for neighbour in self.base[node]:
+                    self.__incoming.setdefault(neighbour, list()).append(node)
+
+        edges = set()
+        for node in nodes:
+            if node not in self.base:
+                continue
+            for neighbour in self.base[node]:
+                edges.add((node, neighbour))
+            for neighbour in self.__incoming.get(node, list()):
+                edges.add((neighbour, node))
+
+        return edges
+
+    # =============================================================================
+    # Adjacency Lists
+    # -----------------------------------------------------------------------------
+    # Provide the (neighbour, value) lists used by the path finding algorithms.
+    # Rows without changes are obtained from the base map, and changed rows are
+    # patched with the overlay values.
+    # =============================================================================
+    def Adjacency(self, key):
+        return self.__Adjacency(self, key)
+
+    def Patched_Row(self, node, key):
+        if key not in self.__patched:
+            self.__patched[key] = dict()
+        if node not in self.__patched[key]:
+            self.__patched[key][node] = [(n, self.edges[(node, n)].get(key, e[key]) if (node, n) in self.edges else e[key])
+                                         for n, e in self.base[node].items()]
+        return self.__patched[key][node]
+
+    class __Adjacency:
+        def __init__(self, heat, key):
+            self.heat = heat
+            self.key = key
+            self.base = heat.base.Adjacency(key) if hasattr(heat.base, "Adjacency") else None
+
+        def __getitem__(self, node):
+            if node in self.heat.rows:
+                return self.heat.Patched_Row(node, self.key)
+            if self.base is not None:
+                return self.base[node]
+            return [(n, e[self.key]) for n, e in self.heat.base[node].items()]
+
+    # =============================================================================
+    # Dictionary Compatible View
+    # =============================================================================
+    def __len__(self):
+        return len(self.base)
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __contains__(self, node):
+        return node in self.base
+
+    def __getitem__(self, node):
+        return self.__Row(self, node)
+
+    def keys(self):
+        return self.base.keys()
+
+    def items(self):
+        return ((node, self[node]) for node in self.base)
+
+    class __Row:
+        def __init__(self, heat, node):
+            self.heat = heat
+            self.node = node
+            self.row = heat.base[node]
+
+        def __len__(self):
+            return len(self.row)
+
+        def __iter__(self):
+            return iter(self.row)
+
+        def __contains__(self, neighbour):
+            return neighbour in self.row
+
+        def __getitem__(self, neighbour):
+            return self.heat._Heat_Map__Edge(self.heat, self.node, neighbour, self.row[neighbour])
+
+        def keys(self):
+            return self.row.keys()
+
+        def items(self):
+            return ((n, self[n]) for n in self.row)
+
+    class __Edge:
+        def __init__(self, heat, node, neighbour, base_edge):
+            self.heat = heat
+            self.key = (node, neighbour)
+            self.base_edge = base_edge
+
+        def __getitem__(self, value):
+            changed = self.heat.edges.get(self.key)
+            if changed is not None and value in changed:
+                return changed[value]
+            return self.base_edge[value]
+
+        def __setitem__(self, value, number):
+            self.heat.Set_Edge(self.key[0], self.key[1], {value : number})
+
+        def __iter__(self):
+            return iter(self.base_edge)
+
+        def keys(self):
+            return self.base_edge.keys()
+
+        def items(self):
+            return ((value, self[value]) for value in self.base_edge)
+
+        def __repr__(self):
+            return str(dict(self.items()))
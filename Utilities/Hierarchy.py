@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import heapq
+
+# =============================================================================
+# Contraction Hierarchy
+# =============================================================================
+''' A contraction hierarchy is created once for a static map, after which the
+    minimum cost path between any two nodes can be found by searching a very
+    small part of the map.
+
+    During preprocessing, the nodes are removed (contracted) one at a time, with
+    the least important nodes first. When a node is contracted, a shortcut edge is
+    added between each pair of its neighbours if the path through the node is the
+    only minimum cost path between them (no "witness" path exists). Each node is
+    given a rank based on the order it was contracted.
+
+    A query searches forwards from the start and backwards from the final node,
+    only moving to nodes of a higher rank. The minimum cost path passes through
+    the node where the two searches meet. The shortcuts are then unpacked into
+    the original edges using the node they were created from.
+
+    The costs are additive, so the hierarchy is created using either the distance
+    or the -log(success) weights of the map.
+'''
+class Contraction_Hierarchy:
+    def __init__(self, adjacency, witness_limit=30):
+        # Adjacency lists of (neighbour, weight) indexed by node.
+        n_nodes = len(adjacency)
+        self.witness_limit = witness_limit  # Maximum nodes settled by the witness search
+
+        # Edges of the remaining graph during contraction: {node : {neighbour : weight}}
+        out_edges = [dict() for n in range(n_nodes)]
+        in_edges = [dict() for n in range(n_nodes)]
+        self.middle = dict()    # Node a shortcut was created from {(node, neighbour) : middle}
+        for node, connections in enumerate(adjacency):
+            for neighbour, weight in connections:
+                if node != neighbour and weight < out_edges[node].get(neighbour, float("inf")):
+                    out_edges[node][neighbour] = weight
+                    in_edges[neighbour][node] = weight
+
+        # Edges to higher ranked nodes, searched by the forward and backward queries.
+        self.up = [list() for n in range(n_nodes)]
+        self.down = [list() for n in range(n_nodes)]
+        self.rank = [0] * n_nodes
+        self.n_shortcuts = 0
+
+        # Contract the nodes in order of importance using lazy updates: the node at
+        # the top of the heap has its importance recomputed and is only contracted
+        # if it is still the least important node.
+        contracted = [False] * n_nodes
+        n_contracted_neighbours = [0] * n_nodes
+        heap = [(self.__Importance(n, out_edges, in_edges, n_contracted_neighbours), n) for n in range(n_nodes)]
+        heapq.heapify(heap)
+        rank = 0
+        while heap:
+            importance, node = heapq.heappop(heap)
+            if contracted[node]:
+                continue
+            new_importance = self.__Importance(node, out_edges, in_edges, n_contracted_neighbours)
+            if heap and new_importance > heap[0][0]:
+                heapq.heappush(heap, (new_importance, node))
+                continue
+
+            # Contract the node, adding the required shortcuts.
+            for (source, target), weight in self.__Shortcuts(node, out_edges, in_edges):
+                if weight < out_edges[source].get(target, float("inf")):
+                    out_edges[source][target] = weight
+                    in_edges[target][source] = weight
+                    self.middle[(source, target)] = node
+                    self.n_shortcuts += 1
+
+            # The remaining edges of the node all connect to higher ranked nodes.
+            self.up[node] = list(out_edges[node].items())
+            self.down[node] = list(in_edges[node].items())
+            for neighbour in out_edges[node]:
+                del in_edges[neighbour][node]
+                n_contracted_neighbours[neighbour] += 1
+            for neighbour in in_edges[node]:
+                del out_edges[neighbour][node]
+                n_contracted_neighbours[neighbour] += 1
+            out_edges[node] = dict()
+            in_edges[node] = dict()
+
+            contracted[node] = True
+            self.rank[node] = rank
+            rank += 1
+
+    # =============================================================================
+    # Importance
+    # -----------------------------------------------------------------------------
+    # Internal method for the importance of a node, using the edge difference (the
+    # number of shortcuts added minus the number of edges removed) and the number
+    # of neighbours already contracted, which spreads the contraction over the map.
+    # =============================================================================
+    def __Importance(self, node, out_edges, in_edges, n_contracted_neighbours):
+        n_shortcuts = len(self.__Shortcuts(node, out_edges, in_edges))
+        return n_shortcuts - len(out_edges[node]) - len(in_edges[node]) + n_contracted_neighbours[node]
+
+    # =============================================================================
+    # Shortcuts
+    # -----------------------------------------------------------------------------
+    # Internal method which finds the shortcuts required to contract a node. For
+    # each incoming neighbour, a limited search (ignoring the node) looks for a
+    # witness path to each outgoing neighbour which is no longer than the path
+    # through the node.
+    # =============================================================================
+    def __Shortcuts(self, node, out_edges, in_edges):
+        shortcuts = list()
+        for source, weight_in in in_edges[node].items():
+            targets = {t : weight_in + w for t, w in out_edges[node].items() if t != source}
+            if not targets:
+                continue
+            max_cost = max(targets.values())
+
+            # Witness search from the source node.
+            costs = {source : 0}
+            settled = 0
+            heap = [(0, source)]
+            while heap and settled < self.witness_limit:
+                cost, curr_node = heapq.heappop(heap)
+                if cost > costs[curr_node]:
+                    continue
+                if cost > max_cost:
+                    break
+                settled += 1
+                for neighbour, weight in out_edges[curr_node].items():
+                    if neighbour == node:
+                        continue
+                    if cost + weight < costs.get(neighbour, float("inf")):
+                        costs[neighbour] = cost + weight
+                        heapq.heappush(heap, (cost + weight, neighbour))
+
+            for target, weight in targets.items():
+                if costs.get(target, float("inf")) > weight:
+                    shortcuts.append(((source, target), weight))
+
+        return shortcuts
+
+    # =============================================================================
+    # Query
+    # -----------------------------------------------------------------------------
+    # Find the minimum cost path from the start to the final node. Returns the path
+    # (as the original nodes), the cost and the number of nodes settled by both
+    # searches. The path is None if the final node cannot be reached.
+    # =============================================================================
+    def Query(self, start, final):
+        if start == final:
+            return [start], 0, 0
+
+        costs = [{start : 0}, {final : 0}]
+        previous = [dict(), dict()]
+        heaps = [[(0, start)], [(0, final)]]
+        edges = [self.up, self.down]
+        settled = [set(), set()]
+        best = float("inf")
+        meeting = None
+
+        # Alternate between the forward and backward searches until neither search
+        # can find a lower cost path.
+        while heaps[0] or heaps[1]:
+            for d in (0, 1):
+                if not heaps[d]:
+                    continue
+                cost, node = heapq.heappop(heaps[d])
+                if cost >= best:
+                    heaps[d] = list()
+                    continue
+                if node in settled[d]:
+                    continue
+                settled[d].add(node)
+
+                if node in costs[1-d] and cost + costs[1-d][node] < best:
+                    best = cost + costs[1-d][node]
+                    meeting = node
+
+                for neighbour, weight in edges[d][node]:
+                    if cost + weight < costs[d].get(neighbour, float("inf")):
+                        costs[d][neighbour] = cost + weight
+                        previous[d][neighbour] = node
+                        heapq.heappush(heaps[d], (cost + weight, neighbour))
+
+        if meeting is None:
+            return None, float("inf"), len(settled[0]) + len(settled[1])
+
+        # Create the path of the hierarchy from the start, through the meeting node,
+        # to the final node.
+        forward = [meeting]
+        while forward[-1] != start:
+            forward.append(previous[0][forward[-1]])
+        forward.reverse()
+        backward = [meeting]
+        while backward[-1] != final:
+            backward.append(previous[1][backward[-1]])
+        nodes = forward + backward[1:]
+
+        # Unpack the shortcuts into the original edges.
+        path = [nodes[0]]
+        for i in range(len(nodes)-1):
+            path.extend(self.__Unpack(nodes[i], nodes[i+1]))
+
+        return path, best, len(settled[0]) + len(settled[1])
+
+    # =============================================================================
+    # Unpack
+    # -----------------------------------------------------------------------------
+    # Internal method which returns the original nodes along an edge, excluding
+    # the first node.
+    # =============================================================================
+    def __Unpack(self, node, neighbour):
+        stack = [(node, neighbour)]
+        path = list()
+        while stack:
+            edge = stack.pop()
+            middle = self.middle.get(edge)
+            if middle is None:
+                path.append(edge[1])
+            else:
+                stack.append((middle, edge[1]))
+                stack.append((edge[0], middle))
+        return path
@@ -1,3 +1,6 @@
+import random
+import numpy as np
+
 def Risk():
     # risk_matrix = {
     #     "L"  : 0.95,
@@ -329,3 +332,38 @@ def CSI_Cobot(risk_matrix):
 
 
     return connections
+
+
+def Synthetic(risk_matrix, n_nodes, seed=None):
+    # Synthetic building used for testing the path finding methods on large 
+    # environments. The nodes are placed on a grid (as close to square as 
+    # possible), where each node is connected to the next node along the row and 
+    # column, and randomly to the diagonal node. The distance and risk of each 
+    # connection is randomly selected. Every node is connected, so a path always 
+    # exists between any two nodes. 
+    #
+    # The connections are compiled in the same way as the predefined maps:
+    #   1. starting node
+    #   2. connecting node
+    #   3. Linear distance 
+    #   4. Risk
+    rng = random.Random(seed)
+    width = int(np.ceil(np.sqrt(n_nodes)))
+    risks = list(risk_matrix)
+
+    connections = list()
+    for node in range(1, n_nodes+1):
+        row, col = divmod(node-1, width)
+        neighbours = list()
+        if col < width-1 and node+1 <= n_nodes:
+            neighbours.append(node+1)           # next node along the row
+        if node+width <= n_nodes:
+            neighbours.append(node+width)       # next node along the column
+            if col < width-1 and node+width+1 <= n_nodes and rng.uniform(0, 1) < 0.25:
+                neighbours.append(node+width+1) # diagonal node
+
+        for neighbour in neighbours:
+            distance = round(rng.uniform(0.25, 2.00), 2)
+            connections.append([node, neighbour, distance, risk_matrix[rng.choice(risks)]])
+
+    return connections
@@ -1,6 +1,29 @@
 import numpy as np
 from copy import deepcopy
 from itertools import permutations
+from Utilities.Cache import Disk_Cache, PICKLE
+
+# =============================================================================
+# Plan Cache
+# 
+# The solved mission plan (the sub-tasks returned by Mission.Solve) only depends
+# on the agent's map, the mission tasks and headers, the start location and the
+# solver, so a mission is only planned once for each start location (see 
+# Disk_Cache). Copies of the plans are stored and returned, as the simulation
+# changes the plan.
+# =============================================================================
+class Plan_Cache(Disk_Cache):
+	def __init__(self, cache_size=1024, directory=None):
+		super().__init__(cache_size=cache_size, directory=directory, serialiser=PICKLE, copy=True)
+
+	# =============================================================================
+	# Key
+	# -----------------------------------------------------------------------------
+	# Create the key of a plan from the hash of the agent's map (see Graph.Map_Hash),
+	# the tasks and headers of the mission, the start location and the solver.
+	# =============================================================================
+	def Key(self, map_hash, tasks, headers, start, method):
+		return Disk_Cache.Hash(map_hash, tuple(tasks), tuple(headers), start, method)
 
 
 # =============================================================================
@@ -18,6 +41,9 @@ from itertools import permutations
 # the probabiltiy of the solution using PRISM.
 # =============================================================================
 class Mission:
+	# Solved mission plans (see Plan_Cache)
+	plans = Plan_Cache()
+
 	def __init__(self, agent):
 		self = self.Create_Connections(agent)
 		self.environment = None	# Initialise the environment variable.
@@ -56,26 +82,32 @@ class Mission:
 
 		# Iterate through the list of tasks
 		for i in range(len(self.tasks)):
+			start = self.tasks[i] # start node
+
+			''' When creating a set of connections, we need the distance of the edge 
+				and the probability of successfully traversing the edge. Since these 
+				quantities are not known, we will use Dijkstra's algorithm to solve 
+				the distance and probability for each edge connection - forming the 
+				mission. 
+			
+				For this, we will only use the path with the best probability 
+				rather than the path of least distance. 
+				
+				Since we are using Dijkstra's algorithm to determine the probabiltiies,
+				they are going to be less than those determining systematically using
+				PRISM. So they will need validation.
+
+				A single search from the start node creates the tree of paths to every 
+				other node, so the paths to each of the other tasks are extracted from 
+				the same tree rather than searching for each pair of tasks.
+			'''
+			agent_tree_prob = agent.Dijkstra_Tree(start, method="Probability")
+
 			for j in range(len(self.tasks)):
-				start = self.tasks[i] # start node
 				final = self.tasks[j] # connecting node
 
-				''' When creating a set of connections, we need the distance of the edge 
-					and the probability of successfully traversing the edge. Since these 
-					quantities are not known, we will use Dijkstra's algorithm to solve 
-					the distance and probability for each edge connection - forming the 
-					mission. 
-				
-					For this, we will only use the path with the best probability 
-					rather than the path of least distance. 
-					
-					Since we are using Dijkstra's algorithm to determine the probabiltiies,
-					they are going to be less than those determining systematically using
-					PRISM. So they will need validation.
-				'''
-			
 				#agent_path_dist, agent_dist_dist, agent_dist_prob = agent.Dijkstra(start, final, path_class=None, method="Distance")
-				agent_path_prob, agent_prob_dist, agent_prob_prob = agent.Dijkstra(start, final, path_class=None, method="Probability")
+				agent_path_prob, agent_prob_dist, agent_prob_prob = agent.Tree_Path(agent_tree_prob, final)
 
 				# Append the probabilities and distance values obtained from Dijkstra's to the 
 				# mission connections.
@@ -208,10 +240,39 @@ class Mission:
 	# value for ever path permutation that creates the mission. This process is not 
 	# efficient and represents a 'cowboy' solution... I am digusted with myself for 
 	# this, but hey... it works! 
+	#
+	# The method selects how each phase is solved:
+	#	"enumerate"  - every permutation created by Permute is evaluated.
+	#	"held-karp"  - the optimal orders are found using dynamic programming over 
+	#				   the subsets of the unordered tasks (see Held_Karp), without 
+	#				   creating the permutations. 
+	#	"branch-bound" - the orders are searched one task at a time, removing the 
+	#				   partial orders which cannot be optimal (see Branch_Bound).
+	#	"vectorised" - every permutation created by Permute is evaluated at once 
+	#				   using arrays (see Score_Permutations).
+	#
+	# All methods create the same solutions, including the tied paths (in the same
+	# order). As Held-Karp and branch and bound do not keep every permutation, 
+	# "Permuted" and "Results" only contain the optimal paths, which the indices 
+	# refer to. The vectorised method gives identical results to "enumerate".
 	# =============================================================================
-	def Solve(self, sub_tasks):
+	def Solve(self, sub_tasks, method="enumerate"):
 		# Iterate through each set of sub-tasks in the sub-task variable.
 		for i in range(len(sub_tasks)):
+			if method in ("held-karp", "branch-bound"):
+				solver = self.Held_Karp if method == "held-karp" else self.Branch_Bound
+				sub_tasks[i]["Permuted"], results = solver(sub_tasks[i])
+				sub_tasks[i]["Solutions"] = dict()
+				sub_tasks[i]["Solutions"]["Results"] = results
+				sub_tasks[i] = self.__Solutions(sub_tasks[i])
+				continue
+
+			if method == "vectorised":
+				sub_tasks[i]["Solutions"] = dict()
+				sub_tasks[i]["Solutions"]["Results"] = self.Score_Permutations(sub_tasks[i]["Permuted"])
+				sub_tasks[i] = self.__Solutions(sub_tasks[i])
+				continue
+
 			# Create a solution dataset for the sub_tasks 
 			sub_tasks[i]["Solutions"] = dict() 
 			sub_tasks[i]["Solutions"]["Results"] = np.empty(shape=(0,2))
@@ -241,41 +302,424 @@ class Mission:
 				# array in the sub_tasks variable. 
 				sub_tasks[i]["Solutions"]["Results"] = np.vstack((sub_tasks[i]["Solutions"]["Results"], np.array([dist, prob]).reshape(1,2)))
 
+			sub_tasks[i] = self.__Solutions(sub_tasks[i])
 			
-			# After analysing all of the paths in the sub-directory for each sub-task, compile 
-			# the minimum distance paths. 
-			sub_tasks[i]["Solutions"]["Distance"] = dict()
+		return sub_tasks
 
-			# Determine the path value which has the minimum distance
-			min_dist_value = sub_tasks[i]["Solutions"]["Results"][:,0].min()
-			sub_tasks[i]["Solutions"]["Distance"]["Min Value"] = min_dist_value
+	# =============================================================================
+	# Score Permutations
+	# -----------------------------------------------------------------------------  
+	# Evaluate the distance and probability of every permuted path at once. The 
+	# paths are converted to an array of indices into dense matrices over the 
+	# mission nodes, and the values of each step are added (or multiplied) for 
+	# every path together. The steps are accumulated in order along the paths, so
+	# the results are identical to evaluating each path in turn.
+	# =============================================================================
+	def Score_Permutations(self, paths):
+		paths = np.asarray(paths)
+		nodes = np.unique(paths)
+		index = np.searchsorted(nodes, paths)
+		dist_matrix, prob_matrix = self.__Node_Matrices(nodes.tolist())
 
-			# Determine the index values of the path which has the minimum distance
-			min_dist_index = [i_1 for i_1, x in enumerate(sub_tasks[i]["Solutions"]["Results"][:,0]) if x == sub_tasks[i]["Solutions"]["Distance"]["Min Value"]]
-			sub_tasks[i]["Solutions"]["Distance"]["Min Index"] = min_dist_index
+		dist = np.zeros(len(paths))
+		prob = np.ones(len(paths))
+		for j in range(paths.shape[1]-1):
+			dist += dist_matrix[index[:,j], index[:,j+1]]
+			prob *= prob_matrix[index[:,j], index[:,j+1]]
 
-			# Iteratively locate paths which have the minimum distance
-			min_dist_paths = [sub_tasks[i]["Permuted"][i_2] for i_2 in sub_tasks[i]["Solutions"]["Distance"]["Min Index"]]
-			sub_tasks[i]["Solutions"]["Distance"]["Paths"] = min_dist_paths
-			
-			# After analysing all of the paths in the sub-directory for this mission, compile the 
-			# maximum probability paths
-			sub_tasks[i]["Solutions"]["Probability"] = dict()
+		return np.column_stack((dist, prob))
 
-			# Determine the path value which has the highest probabilty
-			max_prob_value = sub_tasks[i]["Solutions"]["Results"][:,1].max()
-			sub_tasks[i]["Solutions"]["Probability"]["Max Value"] = max_prob_value
+	# =============================================================================
+	# Compile Solutions
+	# -----------------------------------------------------------------------------  
+	# Internal method which compiles the minimum distance and maximum probability 
+	# paths of a sub-task from the results of its permuted paths.
+	# =============================================================================
+	def __Solutions(self, sub_task):
+		# After analysing all of the paths in the sub-directory for each sub-task, compile 
+		# the minimum distance paths. 
+		sub_task["Solutions"]["Distance"] = dict()
 
-			# Determine the index values of the path which has the highest probability
-			max_prob_index = [i_1 for i_1, x in enumerate(sub_tasks[i]["Solutions"]["Results"][:,1]) if x == sub_tasks[i]["Solutions"]["Probability"]["Max Value"]]
-			sub_tasks[i]["Solutions"]["Probability"]["Max Index"] = max_prob_index
+		# Determine the path value which has the minimum distance
+		min_dist_value = sub_task["Solutions"]["Results"][:,0].min()
+		sub_task["Solutions"]["Distance"]["Min Value"] = min_dist_value
+
+		# Determine the index values of the path which has the minimum distance
+		min_dist_index = np.flatnonzero(sub_task["Solutions"]["Results"][:,0] == min_dist_value).tolist()
+		sub_task["Solutions"]["Distance"]["Min Index"] = min_dist_index
+
+		# Iteratively locate paths which have the minimum distance
+		min_dist_paths = [sub_task["Permuted"][i_2] for i_2 in sub_task["Solutions"]["Distance"]["Min Index"]]
+		sub_task["Solutions"]["Distance"]["Paths"] = min_dist_paths
+		
+		# After analysing all of the paths in the sub-directory for this mission, compile the 
+		# maximum probability paths
+		sub_task["Solutions"]["Probability"] = dict()
+
+		# Determine the path value which has the highest probabilty
+		max_prob_value = sub_task["Solutions"]["Results"][:,1].max()
+		sub_task["Solutions"]["Probability"]["Max Value"] = max_prob_value
+
+		# Determine the index values of the path which has the highest probability
+		max_prob_index = np.flatnonzero(sub_task["Solutions"]["Results"][:,1] == max_prob_value).tolist()
+		sub_task["Solutions"]["Probability"]["Max Index"] = max_prob_index
+
+		# Iteratively locate paths which have the highest probability.
+		max_prob_paths = [sub_task["Permuted"][i_2] for i_2 in sub_task["Solutions"]["Probability"]["Max Index"]]
+		sub_task["Solutions"]["Probability"]["Paths"] = max_prob_paths
+
+		return sub_task
+
+	# =============================================================================
+	# Phase Matrices
+	# -----------------------------------------------------------------------------  
+	# Internal method which creates the distance and probability matrices between 
+	# the start (index 0), the unordered tasks (1 to n) and the end of a sub-task 
+	# (n+1, if the sub-task has an end). Moving between the same node has no 
+	# distance and a probability of 1, as in Solve.
+	# =============================================================================
+	def __Phase_Matrices(self, sub_task):
+		nodes = [sub_task["S"]] + list(sub_task["U"])
+		if "E" in sub_task:
+			nodes.append(sub_task["E"])
+
+		return (nodes,) + self.__Node_Matrices(nodes)
+
+	# =============================================================================
+	# Node Matrices
+	# -----------------------------------------------------------------------------  
+	# Internal method which creates the dense distance and probability matrices 
+	# between a list of nodes from the mission environment.
+	# =============================================================================
+	def __Node_Matrices(self, nodes):
+		dist = np.zeros(shape=(len(nodes), len(nodes)))
+		prob = np.ones(shape=(len(nodes), len(nodes)))
+		for a, s1 in enumerate(nodes):
+			for b, s2 in enumerate(nodes):
+				if s1 != s2:
+					dist[a,b] = self.environment.map[s1][s2]["Distance"]
+					prob[a,b] = self.environment.map[s1][s2]["Success"]
+
+		return dist, prob
+
+	# =============================================================================
+	# Held-Karp
+	# -----------------------------------------------------------------------------  
+	# Find the minimum distance and maximum probability orders of a sub-task using 
+	# the Held-Karp dynamic program. The value of every subset of the unordered 
+	# tasks (a bitmask) ending at each task is found from the smaller subsets:
+	#		value[mask | k][k] = best over j (value[mask][j] + distance[j,k])
+	# which requires O(2^n n^2) operations rather than evaluating all n! orders. 
+	# The subsets with the same number of tasks are updated together.
+	#
+	# The values of tied orders can differ by rounding depending on the order the 
+	# values are accumulated. The orders within a small tolerance of the optimal 
+	# value are therefore found first, and the tied paths are those with the best
+	# value when accumulated in the same way as Solve, so the ties are the same
+	# as evaluating every permutation. The paths are kept in the order of the 
+	# permutations.
+	#
+	# Returns the optimal paths (minimum distance, then maximum probability) and 
+	# their results [distance, probability].
+	# =============================================================================
+	def Held_Karp(self, sub_task, tolerance=1e-9):
+		nodes, dist, prob = self.__Phase_Matrices(sub_task)
+		n = len(sub_task["U"])
+		end = n + 1 if "E" in sub_task else None
+
+		paths = list()
+		results = list()
+		found = set()
+		for matrix, key, better in ((dist, "Distance", np.minimum), (prob, "Success", np.maximum)):
+			worst = np.inf if better is np.minimum else -1	# Value of the subsets which do not end at a task
+			values = self.__Subset_Values(matrix, n, better, worst)
+
+			candidates = list()
+			for order in self.__Near_Orders(values, matrix, n, end, better, tolerance):
+				path = [nodes[0]] + [nodes[k] for k in order]
+				if end is not None:
+					path.append(nodes[end])
+				candidates.append((path, self.__Path_Value(path, key)))
+
+			best = better.reduce([value for path, value in candidates])
+			for path in [path for path, value in candidates if value == best]:
+				if tuple(path) not in found:
+					found.add(tuple(path))
+					paths.append(path)
+					results.append([self.__Path_Value(path, "Distance"), self.__Path_Value(path, "Success")])
+
+		return paths, np.array(results).reshape(-1,2)
+
+	# =============================================================================
+	# Subset Values
+	# -----------------------------------------------------------------------------  
+	# Internal method for the table of Held-Karp values [mask, task] of the paths 
+	# from the start which visit the tasks of the mask and end at the task. The 
+	# tasks are numbered from 1 in the matrix and from 0 in the masks.
+	# =============================================================================
+	def __Subset_Values(self, matrix, n, better, worst):
+		accumulate = np.add if better is np.minimum else np.multiply
+		values = np.full(shape=(2**n, max(n, 1)), fill_value=worst, dtype=np.float64)
+		masks = np.arange(2**n)
+		count = np.zeros(2**n, dtype=np.int64)
+		for k in range(n):
+			count += (masks >> k) & 1
+			values[1 << k, k] = accumulate(accumulate.identity, matrix[0, k+1])
+
+		for size in range(1, n):
+			layer = masks[count == size]
+			for k in range(n):
+				subset = layer[(layer >> k) & 1 == 0]
+				candidates = accumulate(values[subset], matrix[1:n+1, k+1])
+				values[subset | (1 << k), k] = better.reduce(candidates, axis=1)
+
+		return values
+
+	# =============================================================================
+	# Near Orders
+	# -----------------------------------------------------------------------------  
+	# Internal method which follows the Held-Karp values back from the full set of 
+	# tasks to find every order within the tolerance of the optimal value, in the 
+	# order of the permutations. Each step backwards reduces the value remaining 
+	# for the rest of the order (the bound), and only the tasks whose subset value 
+	# is within the bound are followed.
+	# =============================================================================
+	def __Near_Orders(self, values, matrix, n, end, better, tolerance):
+		if n == 0:
+			return [[]]
+
+		full = 2**n - 1
+		if better is np.minimum:
+			totals = values[full] if end is None else values[full] + matrix[1:n+1, end]
+			bound = totals.min() + tolerance * max(1, abs(totals.min()))
+			within = lambda value, bound: value <= bound
+			remove = lambda bound, step: bound - step
+		else:
+			totals = values[full] if end is None else values[full] * matrix[1:n+1, end]
+			bound = totals.max() * (1 - tolerance)
+			within = lambda value, bound: value >= bound
+			remove = lambda bound, step: bound / step if step > 0 else (np.inf if bound > 0 else bound)
+
+		stack = list()
+		for k in reversed(range(n)):
+			if within(totals[k], bound):
+				stack.append((full, k, [k+1], bound if end is None else remove(bound, matrix[k+1, end])))
+
+		orders = list()
+		while stack:
+			mask, k, order, bound = stack.pop()
+			rest = mask & ~(1 << k)
+			if rest == 0:
+				orders.append(order[::-1])
+				continue
+			for j in reversed(range(n)):
+				if (rest >> j) & 1 and within(values[rest, j], remove(bound, matrix[j+1, k+1])):
+					stack.append((rest, j, order + [j+1], remove(bound, matrix[j+1, k+1])))
+
+		return sorted(orders)
+
+	# =============================================================================
+	# Branch and Bound
+	# -----------------------------------------------------------------------------  
+	# Find the minimum distance and maximum probability orders of a sub-task with a
+	# depth first search over the orders, adding one task at a time. Only the 
+	# partial orders waiting to be searched are stored, so the memory does not 
+	# depend on the number of permutations. A partial order is removed if it 
+	# cannot reach the best distance or the best probability found so far, using 
+	# bounds which add the shortest (or most likely) edge into each remaining task.
+	# The nearest tasks are searched first, so good solutions are found early.
+	#
+	# The values are accumulated in the same way as Solve, so the tied paths are 
+	# the same, and are sorted into the order of the permutations. The bounds are 
+	# loosened by a small tolerance so rounding cannot remove a tie.
+	#
+	# Returns the optimal paths (minimum distance, then maximum probability) and 
+	# their results [distance, probability].
+	# =============================================================================
+	def Branch_Bound(self, sub_task, tolerance=1e-9):
+		nodes, dist, prob = self.__Phase_Matrices(sub_task)
+		n = len(sub_task["U"])
+		end = n + 1 if "E" in sub_task else None
+
+		# Shortest and most likely edge into each task (and the end) from the start 
+		# or another task.
+		entry_dist = [0.0] * (n+2)
+		entry_prob = [1.0] * (n+2)
+		for k in range(1, len(nodes)):
+			sources = [a for a in range(n+1) if a != k]
+			entry_dist[k] = float(dist[sources, k].min())
+			entry_prob[k] = float(prob[sources, k].max())
+		end_dist = entry_dist[end] if end is not None else 0.0
+		end_prob = entry_prob[end] if end is not None else 1.0
+		dist = dist.tolist()
+		prob = prob.tolist()
+
+		best = {"Distance" : np.inf, "Success" : -np.inf}
+		ties = {"Distance" : list(), "Success" : list()}
+		stack = [((), list(range(1, n+1)), 0.0, 1.0)]
+		while stack:
+			order, remaining, distance, probability = stack.pop()
+			last = order[-1] if order else 0
+			if not remaining:
+				if end is not None:
+					distance += dist[last][end]
+					probability *= prob[last][end]
+				if distance < best["Distance"]:
+					best["Distance"], ties["Distance"] = distance, list()
+				if distance == best["Distance"]:
+					ties["Distance"].append(order)
+				if probability > best["Success"]:
+					best["Success"], ties["Success"] = probability, list()
+				if probability == best["Success"]:
+					ties["Success"].append(order)
+				continue
+
+			# Add each remaining task, keeping the partial orders which could still 
+			# reach either optimal value.
+			max_distance = best["Distance"] + tolerance * max(1, abs(best["Distance"]))
+			min_probability = best["Success"] * (1 - tolerance)
+			children = list()
+			for k in remaining:
+				rest = [r for r in remaining if r != k]
+				new_distance = distance + dist[last][k]
+				new_probability = probability * prob[last][k]
+				lower = new_distance + end_dist
+				upper = new_probability * end_prob
+				for r in rest:
+					lower += entry_dist[r]
+					upper *= entry_prob[r]
+				if lower <= max_distance or upper >= min_probability:
+					children.append((order + (k,), rest, new_distance, new_probability))
+
+			children.sort(key=lambda child: child[2], reverse=True)
+			stack.extend(children)
+
+		paths = list()
+		found = set()
+		for key in ("Distance", "Success"):
+			for order in sorted(ties[key]):
+				path = [nodes[0]] + [nodes[k] for k in order] + ([nodes[end]] if end is not None else [])
+				if tuple(path) not in found:
+					found.add(tuple(path))
+					paths.append(path)
+
+		results = np.array([[self.__Path_Value(path, "Distance"), self.__Path_Value(path, "Success")] for path in paths]).reshape(-1,2)
+		return paths, results
+
+	# =============================================================================
+	# Pareto Front
+	# -----------------------------------------------------------------------------  
+	# Find the Pareto front of each sub-task, the orders which cannot be improved
+	# in distance without reducing the probability of success (see Pareto). The 
+	# front is added to the solutions as "Pareto", with the paths and their 
+	# results [distance, probability] in order of increasing distance, so a plan 
+	# can be selected later without solving the mission again (see Select_Plan).
+	# =============================================================================
+	def Pareto_Front(self, sub_tasks):
+		for i in range(len(sub_tasks)):
+			paths, results = self.Pareto(sub_tasks[i])
+			sub_tasks[i].setdefault("Solutions", dict())
+			sub_tasks[i]["Solutions"]["Pareto"] = {"Paths" : paths, "Results" : results}
 
-			# Iteratively locate paths which have the highest probability.
-			max_prob_paths = [sub_tasks[i]["Permuted"][i_2] for i_2 in sub_tasks[i]["Solutions"]["Probability"]["Max Index"]]
-			sub_tasks[i]["Solutions"]["Probability"]["Paths"] = max_prob_paths
-			
-			
 		return sub_tasks
+
+	# =============================================================================
+	# Pareto
+	# -----------------------------------------------------------------------------  
+	# Find the Pareto front of the orders of a sub-task using dynamic programming
+	# over the subsets of the unordered tasks, as in Held_Karp. Rather than one 
+	# value, each subset and final task keeps the labels (distance, probability, 
+	# order) which are not dominated by another label: a label is dominated if 
+	# another label has no greater distance and no lower probability. As the rest
+	# of the order only depends on the subset and final task, a dominated label 
+	# can never be part of the front and is removed as soon as it is found. Of 
+	# labels with equal values, the first order in permutation order is kept.
+	#
+	# Returns the paths of the front and their results [distance, probability], 
+	# in order of increasing distance.
+	# =============================================================================
+	def Pareto(self, sub_task):
+		nodes, dist, prob = self.__Phase_Matrices(sub_task)
+		n = len(sub_task["U"])
+		end = n + 1 if "E" in sub_task else None
+		dist = dist.tolist()
+		prob = prob.tolist()
+
+		# Labels for each subset (bitmask) and final task {(mask, task) : [(distance, probability, order)]}
+		labels = {(1 << (k-1), k) : [(0 + dist[0][k], 1 * prob[0][k], (k,))] for k in range(1, n+1)}
+		for size in range(1, n):
+			extended = dict()
+			for (mask, k), current in labels.items():
+				for j in range(1, n+1):
+					if (mask >> (j-1)) & 1:
+						continue
+					key = (mask | (1 << (j-1)), j)
+					new = [(d + dist[k][j], p * prob[k][j], order + (j,)) for d, p, order in current]
+					extended[key] = self.__Non_Dominated(extended.get(key, list()) + new)
+			labels = extended
+
+		# Complete the orders at the end of the sub-task.
+		complete = list()
+		for (mask, k), current in labels.items():
+			for d, p, order in current:
+				if end is not None:
+					d, p = d + dist[k][end], p * prob[k][end]
+				complete.append((d, p, order))
+		if n == 0:
+			complete = [(0 + dist[0][end], 1 * prob[0][end], ()) if end is not None else (0, 1, ())]
+		front = self.__Non_Dominated(complete)
+
+		paths = [[nodes[0]] + [nodes[k] for k in order] + ([nodes[end]] if end is not None else []) for d, p, order in front]
+		results = np.array([[self.__Path_Value(path, "Distance"), self.__Path_Value(path, "Success")] for path in paths]).reshape(-1,2)
+		return paths, results
+
+	# =============================================================================
+	# Non-Dominated Labels
+	# -----------------------------------------------------------------------------  
+	# Internal method which removes the dominated labels. The labels are sorted by
+	# increasing distance, decreasing probability and then order, so a label is 
+	# only kept if its probability is greater than every label before it.
+	# =============================================================================
+	def __Non_Dominated(self, labels):
+		kept = list()
+		for label in sorted(labels, key=lambda label: (label[0], -label[1], label[2])):
+			if not kept or label[1] > kept[-1][1]:
+				kept.append(label)
+		return kept
+
+	# =============================================================================
+	# Select Plan
+	# -----------------------------------------------------------------------------  
+	# Select the path of a sub-task from its Pareto front (see Pareto_Front). The 
+	# shortest path with a probability of success of at least min_success is 
+	# selected, or the most likely path if no path reaches the threshold. If no 
+	# threshold is given, the first maximum probability path is used as before.
+	# =============================================================================
+	def Select_Plan(sub_task, min_success=None):
+		if min_success is None:
+			return sub_task["Solutions"]["Probability"]["Paths"][0]
+
+		front = sub_task["Solutions"]["Pareto"]
+		for path, (distance, probability) in zip(front["Paths"], front["Results"]):
+			if probability >= min_success:
+				return path
+		return front["Paths"][-1]
+
+	# =============================================================================
+	# Path Value
+	# -----------------------------------------------------------------------------  
+	# Internal method for the total distance or probability of success of a path, 
+	# accumulated in the same way as Solve.
+	# =============================================================================
+	def __Path_Value(self, path, key):
+		value = 0 if key == "Distance" else 1
+		for j in range(len(path)-1):
+			if path[j] != path[j+1]:
+				if key == "Distance":
+					value += self.environment.map[path[j]][path[j+1]][key]
+				else:
+					value *= self.environment.map[path[j]][path[j+1]][key]
+		return value
 		
 	   
 	   
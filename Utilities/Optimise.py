@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import time
+import numpy as np
+from Utilities.Prism import Prism
+from Utilities.Transitions import Transition_Matrix
+
+# =============================================================================
+# Action Optimiser
+# =============================================================================
+''' The cross-entropy method searches for the action array (see
+    Prism.Generate_Action) with the highest probability of reaching the final
+    node, with ties resolved by the least expected distance.
+
+    Each node has a probability of selecting each of its actions. Every iteration
+    a population of action arrays is sampled from these probabilities and scored
+    at once using Prism.Evaluate_Batch. The probabilities are then moved towards
+    the actions used by the best (elite) candidates, so the population converges
+    on the best actions. The best candidate found is always kept.
+
+    The probabilities are initialised using the action arrays of the Dijkstra
+    paths (or any other paths) given as the initial guesses, mixed with uniform
+    probabilities so the other actions can still be explored. The transition
+    matrix of the map (see Graph.Transitions) can be given if it already exists.
+'''
+class Action_Optimiser:
+    def __init__(self, nodes, start_location, final_location, population=100, elite=0.1, smoothing=0.7, seed=None, transitions=None):
+        self.nodes = nodes
+        self.start_location = start_location
+        self.final_location = final_location
+        self.population = population
+        self.n_elite = max(1, int(round(elite * population)))
+        self.smoothing = smoothing      # Weight of the elite actions in each update
+        self.rng = np.random.default_rng(seed)
+
+        # The edges of the map in the order of the actions, and the node and action
+        # of each edge.
+        self.transitions = transitions if transitions is not None else Transition_Matrix.From_Map(nodes)
+        self.arrays = self.transitions.arrays
+        offsets = self.arrays["Offsets"]
+        self.n_nodes = len(offsets) - 2
+        self.counts = np.diff(offsets)[1:]
+        self.edge_node = np.repeat(np.arange(1, self.n_nodes+1), self.counts)
+        self.edge_action = np.arange(len(self.edge_node)) - offsets[self.edge_node] + 1
+        self.rows = np.flatnonzero(self.counts > 0)     # Columns of the nodes with actions
+
+        self.probability = np.zeros(len(self.edge_node))
+        self.evaluations = 0
+
+    # =============================================================================
+    # Sample
+    # -----------------------------------------------------------------------------
+    # Internal method which samples action arrays from the probabilities. The
+    # cumulative probabilities of each node are offset by the node, so every
+    # action can be sampled at once using a single sorted search.
+    # =============================================================================
+    def __Sample(self, n_samples):
+        offsets = self.arrays["Offsets"]
+        cumulative = np.cumsum(self.probability)
+        totals = np.add.reduceat(self.probability, offsets[1:-1][self.rows])
+        within = cumulative - np.repeat(np.concatenate([[0], np.cumsum(totals)[:-1]]), self.counts[self.rows])
+        within /= np.repeat(totals, self.counts[self.rows])
+        ranked = np.repeat(np.arange(len(self.rows)), self.counts[self.rows]) + within
+        ranked[offsets[1:-1][self.rows] + self.counts[self.rows] - 1] = np.arange(1, len(self.rows)+1)   # Avoid rounding past the last action
+
+        u = self.rng.random(size=(n_samples, len(self.rows))) + np.arange(len(self.rows))
+        edges = np.minimum(np.searchsorted(ranked, u, side="left"), len(ranked)-1)
+
+        action_array = np.ones(shape=(n_samples, self.n_nodes), dtype=np.int32)
+        action_array[:, self.rows] = self.edge_action[edges]
+        return action_array
+
+    # =============================================================================
+    # Update
+    # -----------------------------------------------------------------------------
+    # Internal method which moves the probabilities towards the frequency of the
+    # actions of the given candidates.
+    # =============================================================================
+    def __Update(self, action_array, weight):
+        offsets = self.arrays["Offsets"]
+        edges = (offsets[1:-1][self.rows] + action_array[:, self.rows] - 1).ravel()
+        frequency = np.bincount(edges, minlength=len(self.edge_node)) / len(action_array)
+        self.probability = weight * frequency + (1 - weight) * self.probability
+
+    # =============================================================================
+    # Run
+    # -----------------------------------------------------------------------------
+    # Run the optimisation until the number of iterations or the time limit (in
+    # seconds) is reached, or the best candidate has not improved for a number
+    # of iterations (patience). The initial guesses are paths from the start to
+    # the final node, such as the Dijkstra solutions.
+    #
+    # Returns a dictionary of the best action array ("Actions"), its probability
+    # and expected distance, the best probability of each iteration ("History"),
+    # and the number of evaluations, iterations, time taken and whether the
+    # search converged.
+    # =============================================================================
+    def Run(self, initial_guesses=None, iterations=100, time_limit=None, patience=10):
+        t0 = time.perf_counter()
+        seeds = list()
+        for path in initial_guesses or list():
+            seeds.append(Prism.Generate_Action(self.nodes, num_solutions=1, initial_guess=path)[0])
+
+        # Initialise the probabilities as uniform, mixed with the actions of the
+        # initial guesses.
+        self.probability = 1 / np.repeat(self.counts, self.counts).astype(np.float64)
+        if seeds:
+            self.__Update(np.vstack(seeds), 0.5)
+
+        best_actions = None
+        best_score = (-1, -np.inf)
+        history = list()
+        converged = False
+        iteration = 0
+        while iteration < iterations:
+            if time_limit is not None and time.perf_counter() - t0 > time_limit:
+                break
+            iteration += 1
+
+            candidates = self.__Sample(self.population)
+            if best_actions is not None:
+                candidates[0] = best_actions
+            elif seeds:
+                candidates[:len(seeds)] = seeds[:self.population]
+            probability, distance = Prism.Evaluate_Batch(self.nodes, self.start_location, self.final_location, candidates, transitions=self.transitions)
+            self.evaluations += len(candidates)
+
+            # Rank by the highest probability and then the least expected distance.
+            order = np.lexsort((distance, -probability))
+            score = (probability[order[0]], -distance[order[0]])
+            if score > best_score:
+                best_score = score
+                best_actions = candidates[order[0]].copy()
+                last_improvement = iteration
+            history.append(best_score[0])
+
+            self.__Update(candidates[order[:self.n_elite]], self.smoothing)
+            if iteration - last_improvement >= patience:
+                converged = True
+                break
+
+        elapsed = time.perf_counter() - t0
+        return {"Actions"    : best_actions,
+                "Probability" : float(best_score[0]),
+                "Distance"   : float(-best_score[1]),
+                "History"    : history,
+                "Evaluations" : self.evaluations,
+                "Evaluations per Second" : self.evaluations / elapsed if elapsed > 0 else float("inf"),
+                "Iterations" : iteration,
+                "Time"       : elapsed,
+                "Converged"  : converged}
@@ -1,8 +1,33 @@
-import heapq, random, glob, subprocess
+import heapq, random, glob, subprocess, os, tempfile, time, re, warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from copy import deepcopy
 import numpy as np
 from random import randint, uniform
+from Utilities.Cache import Disk_Cache, FLOAT
+from Utilities.Compact import CSR_Map
+from Utilities.Transitions import Transition_Matrix
+
+# =============================================================================
+# Validation Cache
+# 
+# The result of a validation only depends on the edges which can be reached 
+# using the actions from the start location, so the results are stored using a 
+# hash of these edges along with the start and final location (see Disk_Cache).
+# =============================================================================
+class Validation_Cache(Disk_Cache):
+    def __init__(self, cache_size=1024, directory=None):
+        super().__init__(cache_size=cache_size, directory=directory, serialiser=FLOAT)
+
+    # =============================================================================
+    # Key
+    # -----------------------------------------------------------------------------
+    # Create the key of a validation from the engine, start and final location and
+    # the reachable chain of the model (see Prism.Reachable_Chain).
+    # =============================================================================
+    def Key(self, engine, start_location, final_location, chain):
+        return Disk_Cache.Hash(engine, start_location, final_location, chain)
 
 # =============================================================================
 # PRISM Interface Class
@@ -11,6 +36,12 @@ from random import randint, uniform
 # the PRISM interface.
 # =============================================================================
 class Prism:  
+    # Results of previous validations (see Validate and Validate_Batch)
+    cache = Validation_Cache()
+
+    # Directory for the temporary models and outputs (see Export_Model). Memory 
+    # backed storage (/dev/shm) is used where it exists.
+    scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
     
     # =============================================================================
     # Generate Actions
@@ -32,7 +63,10 @@ class Prism:
         # to locate the optimal action set. However, if a path is applied as 
         # the initial_guess variable, then a path is applied from Dijkstra's
         # and optimisation will not actually be performed. 
-        num_actions = [len(nodes[node]) for node in nodes]
+        if isinstance(nodes, CSR_Map):
+            num_actions = np.diff(nodes.offsets)[1:].tolist()
+        else:
+            num_actions = [len(nodes[node]) for node in nodes]
         action_array = np.zeros(shape=(num_solutions, len(num_actions)), dtype=np.int32)
     
         for j, action in enumerate(action_array):
@@ -49,7 +83,10 @@ class Prism:
             for n in range(len(initial_guess)-1):
                 curr_node = initial_guess[n]     # current node in the iteration
                 next_node = initial_guess[n+1]   # next node we intend to move to from the curr_node
-                action_array[0, curr_node-1] = list(nodes[curr_node].keys()).index(next_node) + 1
+                if isinstance(nodes, CSR_Map):
+                    action_array[0, curr_node-1] = nodes.Index(curr_node, next_node) - nodes.offsets[curr_node] + 1
+                else:
+                    action_array[0, curr_node-1] = list(nodes[curr_node].keys()).index(next_node) + 1
         
         return action_array
     
@@ -64,8 +101,6 @@ class Prism:
     # =============================================================================
     def Create_Model(nodes, start_location, final_location, actions):
         PREAMBLE = list()           # initial code for the PRISM model
-        WORKFLOW = list()           # main body of the PRISM model
-        REWARD_DISTANCE = list()    # Reward structure for the PRISM model
     
         # Create the preamble
         PREAMBLE.append("// Code generaetion for preamble.\n")
@@ -82,48 +117,250 @@ class Prism:
         for i in range(len(nodes)):
             act = actions[i]
             PREAMBLE.append(f"const int a_s{i+1} = {act}; \t// Selected action in the range 1 to {len(nodes[i+1])};\n")
+
+        # Compile
+        model = PREAMBLE + Prism.__Workflow(nodes, start_location)
+        
+        return model 
+    
+    # =============================================================================
+    # Create Batch PRISM Model
+    # -----------------------------------------------------------------------------
+    # Create a single model which validates many candidates (start location, final 
+    # location and actions). The constant k is left undefined, and the start, final
+    # and action constants are selected using k, so every candidate is checked in
+    # a single run of PRISM using -const k=0:N-1 (see Simulate_Batch). 
+    #
+    # The actions of nodes which cannot be reached by a candidate do not change its
+    # result, so these use the action of another candidate. This keeps the model 
+    # small as only the actions of the nodes along the paths are selected using k.
+    #
+    # With the actions fixed, only the edges selected along the paths can be used.
+    # If reduced is True, the model only contains the nodes which can be reached 
+    # by the candidates (renumbered from 1) and the failure state, which gives the
+    # same result as the model of the entire map.
+    # =============================================================================
+    def Create_Batch_Model(nodes, start_locations, final_locations, action_array, reduced=False):
+        PREAMBLE = list()           # initial code for the PRISM model
+        n_candidates = len(start_locations)
+
+        # Create the preamble
+        PREAMBLE.append("// Code generaetion for preamble.\n")
+        PREAMBLE.append("mdp\n\n")
+
+        if reduced:
+            index, edges, selected = Prism.__Reduced(nodes, start_locations, final_locations, action_array)
+
+            # model parameters
+            PREAMBLE.append("// Model parameters\n")
+            PREAMBLE.append(f"const int k; \t// Candidate in the range 0 to {n_candidates-1}\n")
+            PREAMBLE.append(f"const int start = {Prism.__Select([index[n] for n in start_locations], index[start_locations[0]])};\n")
+            PREAMBLE.append(f"const int final = {Prism.__Select([index[n] for n in final_locations], index[final_locations[0]])};\n")
+            PREAMBLE.append("\n")
+
+            # begin action synthesis
+            PREAMBLE.append("// Create action selections\n")
+            for node in selected:
+                PREAMBLE.append(f"const int a_s{node} = {Prism.__Select(selected[node], None)}; \t// Selected action for node {node} (state {index[node]})\n")
+
+            return PREAMBLE + Prism.__Workflow(nodes, "start", edges=edges, index=index)
+    
+        # model parameters
+        PREAMBLE.append("// Model parameters\n")
+        PREAMBLE.append(f"const int k; \t// Candidate in the range 0 to {n_candidates-1}\n")
+        PREAMBLE.append(f"const int start = {Prism.__Select(list(start_locations), start_locations[0])};\n")
+        PREAMBLE.append(f"const int final = {Prism.__Select(list(final_locations), final_locations[0])};\n")
+        PREAMBLE.append("\n")
+
+        # Nodes which can be reached by each candidate
+        reachable = [{link[0] for link in Prism.Reachable_Chain(nodes, start_locations[k], final_locations[k], action_array[k])} 
+                     for k in range(n_candidates)]
+    
+        # begin action synthesis
+        PREAMBLE.append("// Create action selections\n")
+        for i in range(len(nodes)):
+            values = [int(action_array[k][i]) if i+1 in reachable[k] else None for k in range(n_candidates)]
+            PREAMBLE.append(f"const int a_s{i+1} = {Prism.__Select(values, int(action_array[0][i]))}; \t// Selected action in the range 1 to {len(nodes[i+1])};\n")
+
+        # Compile
+        model = PREAMBLE + Prism.__Workflow(nodes, "start")
+        
+        return model 
+
+    # =============================================================================
+    # Create Policy Model
+    # -----------------------------------------------------------------------------
+    # Create a model where every edge of a node can be selected, so PRISM performs 
+    # the policy synthesis. Every node is an initial state, so the adversary of 
+    # Pmax=? [F (end & s=final)] gives the best edge from every node of the map 
+    # towards the final location (see Synthesise_Policy).
+    # =============================================================================
+    def Create_Policy_Model(nodes, final_location):
+        PREAMBLE = list()           # initial code for the PRISM model
+    
+        # Create the preamble
+        PREAMBLE.append("// Code generaetion for preamble.\n")
+        PREAMBLE.append("mdp\n\n")
+    
+        # model parameters
+        PREAMBLE.append("// Model parameters\n")
+        PREAMBLE.append(f"const int final = {final_location};\n")
+        PREAMBLE.append("\n")
+
+        # Compile
+        model = PREAMBLE + Prism.__Workflow(nodes, None, fixed=False)
+        
+        return model 
+
+    # =============================================================================
+    # Select
+    # -----------------------------------------------------------------------------
+    # Internal method which creates the expression selecting the value of each 
+    # candidate k, where a value of None can use any value. Candidates with the 
+    # same value share a condition, for example ((k=0|k=2) ? 3 : 1).
+    # =============================================================================
+    def __Select(values, default):
+        groups = dict()
+        for k, value in enumerate(values):
+            if value is not None:
+                groups.setdefault(value, list()).append(k)
+        if not groups:
+            return f"{default}"
+
+        groups = list(groups.items())
+        expression = f"{groups[-1][0]}"
+        for value, candidates in reversed(groups[:-1]):
+            condition = "|".join(f"k={k}" for k in candidates)
+            expression = f"(({condition}) ? {value} : {expression})"
+        return expression
+
+    # =============================================================================
+    # Workflow
+    # -----------------------------------------------------------------------------
+    # Internal method which creates the workflow module and the reward structure 
+    # of the model, where the state is initialised to init. 
+    #
+    # For a reduced model, the commands are only created for the selected edges 
+    # of (node, action, neighbour, distance, success, return, fail), and the nodes
+    # are renumbered to the states given by index.
+    #
+    # If fixed is False, the commands are not restricted by the action constants,
+    # so every edge of a node can be selected. If init is None, every state which
+    # has not ended is an initial state.
+    # =============================================================================
+    def __Workflow(nodes, init, edges=None, index=None, fixed=True):
+        WORKFLOW = list()           # main body of the PRISM model
+        REWARD_DISTANCE = list()    # Reward structure for the PRISM model
+
+        # The CSR map stores each edge value as an array, so the workflow can be 
+        # created directly from the arrays rather than through the edge views.
+        if edges is not None:
+            commands = edges
+        elif isinstance(nodes, CSR_Map):
+            commands = zip(nodes.sources.tolist(), (np.arange(len(nodes.sources)) - nodes.offsets[nodes.sources] + 1).tolist(), 
+                           nodes.neighbours.tolist(), nodes.arrays["Distance"].tolist(), nodes.arrays["Success"].tolist(), 
+                           nodes.arrays["Return"].tolist(), nodes.arrays["Fail"].tolist())
+        else:
+            commands = ((node, act, trans, nodes[node][trans]["Distance"], nodes[node][trans]["Success"], 
+                         nodes[node][trans]["Return"], nodes[node][trans]["Fail"]) 
+                        for node in nodes for act, trans in enumerate(nodes[node], start=1))
+
+        # The states are the node numbers, unless the nodes have been renumbered.
+        if index is None:
+            n_states = len(nodes)
+            state = lambda node: node
+        else:
+            n_states = len(index) - 1
+            state = lambda node: index[node]
     
         # create WORKFLOW module 
         WORKFLOW.append("\n\n\n")
         WORKFLOW.append("module workflow\n")
-        WORKFLOW.append("\tend : bool init false;\n")
-        WORKFLOW.append(f"\ts : [0..{len(nodes)}] init {start_location};\n\n")
-        for node in nodes:
-            act = 0 # start action counter
-            for trans in nodes[node]:
-                act += 1
-                # Each state/action in the workflow is comprised of four parts (condition, success, return, and fail)
-                WORKFLOW.append(f"\t[s{node}_s{trans}] (s={node}) & (a_s{node}={act}) & (!end) -> ")  # Condition
-                WORKFLOW.append(f"{nodes[node][trans]['Success']}:(s'={trans}) + ")                  # Success state
-                WORKFLOW.append(f"{nodes[node][trans]['Return']}:(s'={node}) + ")                    # Return state
-                WORKFLOW.append(f"{nodes[node][trans]['Fail']}:(s'=0); \n")                          # Fail state
-    
-                # Each of the state/action needs to also have a reward structure
-                REWARD_DISTANCE.append(f'\t[s{node}_s{trans}] true : {nodes[node][trans]["Distance"]};\n')
+        if init is None:
+            WORKFLOW.append("\tend : bool;\n")
+            WORKFLOW.append(f"\ts : [0..{n_states}];\n\n")
+        else:
+            WORKFLOW.append("\tend : bool init false;\n")
+            WORKFLOW.append(f"\ts : [0..{n_states}] init {init};\n\n")
+        for node, act, trans, distance, success, ret, fail in commands:
+            # Each state/action in the workflow is comprised of four parts (condition, success, return, and fail)
+            if fixed:
+                WORKFLOW.append(f"\t[s{node}_s{trans}] (s={state(node)}) & (a_s{node}={act}) & (!end) -> ")  # Condition
+            else:
+                WORKFLOW.append(f"\t[s{node}_s{trans}] (s={state(node)}) & (!end) -> ")                      # Condition
+            WORKFLOW.append(f"{success}:(s'={state(trans)}) + ")                  # Success state
+            WORKFLOW.append(f"{ret}:(s'={state(node)}) + ")                       # Return state
+            WORKFLOW.append(f"{fail}:(s'=0); \n")                                # Fail state
+
+            # Each of the state/action needs to also have a reward structure
+            REWARD_DISTANCE.append(f'\t[s{node}_s{trans}] true : {distance};\n')
     
         WORKFLOW.append("\n\t[end] (!end) & (s=0 | s=final) -> (end'=true);\n")
         WORKFLOW.append("\nendmodule\n\n\n")
+        if init is None:
+            WORKFLOW.append("init !end endinit\n\n")
     
         # reward structure
         REWARD_DISTANCE.insert(0, '\nrewards "distance" \n')
         REWARD_DISTANCE.append("endrewards")
                
-        # Compile
-        model = PREAMBLE + WORKFLOW + REWARD_DISTANCE
-        
-        return model 
-    
+        return WORKFLOW + REWARD_DISTANCE
+
+    # =============================================================================
+    # Reduced Model States
+    # -----------------------------------------------------------------------------
+    # Internal method which finds the edges of a reduced model. Only the nodes 
+    # which can be reached by the candidates (see Reachable_Chain) and the final 
+    # nodes are included, and these are renumbered from 1, with 0 remaining the 
+    # failure state. Returns the renumbering of the nodes {node : state}, the 
+    # selected edges, and the action of each included node for each candidate.
+    # =============================================================================
+    def __Reduced(nodes, start_locations, final_locations, action_array):
+        index = {0 : 0}
+        edges = list()
+        created = set()     # Edges which have been created (node, action)
+        actions = dict()    # {node : [action of each candidate, or None if not reached]}
+        for k in range(len(start_locations)):
+            for link in Prism.Reachable_Chain(nodes, start_locations[k], final_locations[k], action_array[k]):
+                node = link[0]
+                act = int(action_array[k][node-1])
+                if node not in actions:
+                    actions[node] = [None] * len(start_locations)
+                actions[node][k] = act
+                index.setdefault(node, len(index))
+
+                # Create the edge if it has not been created by another candidate.
+                edge = Prism.Action_Edge(nodes, node, act)
+                if edge is not None and (node, act) not in created:
+                    created.add((node, act))
+                    edges.append((node, act) + edge)
+
+        # The final nodes and the start nodes (if they are the final node) are added
+        # after the reachable nodes.
+        for node in list(final_locations) + list(start_locations):
+            index.setdefault(node, len(index))
+
+        return index, edges, actions
+
     # =============================================================================
     # Export Model 
     # -----------------------------------------------------------------------------
     # The PRISM model which was created is exported using this method based on the 
     # model file, file name and path. Each entry in the model is written line by
     # line. 
+    #
+    # If no file name is given, a uniquely named model is created in the path (or
+    # the scratch directory if no path is given). This allows models to be exported
+    # by parallel processes and threads without overwriting each other. These 
+    # files should be removed using Remove_Files once they are no longer required.
     # =============================================================================
     def Export_Model(model, file_name=None, path=""):
         if file_name is None:
-            n_files = len(glob.glob1(path, "*.prism")) + 1
-            file_name = f"Model_{n_files}.prism"
+            if path == "":
+                path = Prism.scratch_dir + os.sep
+            handle, model_path = tempfile.mkstemp(dir=path, prefix="Model_", suffix=".prism")
+            os.close(handle)
+            file_name = os.path.basename(model_path)
             
         with open(path + file_name, 'w') as f:
             for row in model:
@@ -131,41 +368,540 @@ class Prism:
                 
         return path, file_name
 
+    # =============================================================================
+    # Remove Files
+    # -----------------------------------------------------------------------------
+    # Remove an exported model along with the outputs created by PRISM (results, 
+    # adversary and states files).
+    # =============================================================================
+    def Remove_Files(model):
+        for file_path in [model, model[0:-6]+".csv", model[0:-6]+".tra", model[0:-6]+".sta"]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
     # =============================================================================
     # Simulate
     # -----------------------------------------------------------------------------
-    #  
+    # Check the model using PRISM and return the result of the PCTL property. The
+    # result is read from the file exported by PRISM (-exportresults), rather than
+    # the printed output. 
+    #
+    # The adversary and model are only exported if output_files is True. If 
+    # return_stats is True, the statistics of the run (see Run_Statistics) are 
+    # also returned.
     # =============================================================================
-    def Simulate(prism_path, model, output_files=False):
+    def Simulate(prism_path, model, output_files=False, return_stats=False):
+        results_path = model[0:-6]+".csv"
+        if os.path.exists(results_path):
+            os.remove(results_path)     # Prevent the results of a previous run being read
+        expression = [f"{prism_path}", f"{model}", "-pctl", "Pmax=? [F (end & s=final)]", "-exportresults", f"{results_path}:csv"]
+
         if output_files:
             # Output the policy and states files as well
             policy_path = model[0:-6]+".tra"
             states_path = model[0:-6]+".sta"
-            expression = [f"{prism_path}", f"{model}", "-pctl", "Pmax=? [F (end & s=final)]", 
-                          "-exportadv", f"{policy_path}", "-exportmodel", f"{states_path}"]
+            expression += ["-exportadv", f"{policy_path}", "-exportmodel", f"{states_path}"]
 
             # expression = [f"{prism_path}", f"{model}", "-pctl", "Pmin=? [F (end & s=final)]", 
             #               "-exportadv", f"{policy_path}", "-exportmodel", f"{states_path}"]
-        else:
-            # Don't output the policy and states, but run the model
-            expression = [f"{prism_path}", f"{model}",  "-pctl", 'Pmax=? [F (end & s=final)]']
                       
         # Run the expression in the command line using subprocess
-        process = subprocess.Popen(expression, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = process.communicate()
-        out = out.decode('utf-8')
-        out = out.split()
+        stats = Prism.Run_Statistics(expression)
         
-        # The output from running the PRISM model is stored within the out variable, 
-        # where the result is located in the immediate cell after the cell which reads 
-        # "Result:"
+        # The results file contains a header followed by the result.
         result = None
-        for j, entry in enumerate(out):
-            if entry == "Result:":
-                 result = (float(out[j+1]))
-                 break
+        try:
+            with open(results_path, 'r') as f:
+                rows = [row for row in f.read().split("\n")[1:] if row.strip() != ""]
+            result = float(rows[0].split(",")[-1])
+        except (OSError, ValueError, IndexError):
+            pass
         
         if result is None: 
             print("Something went wrong. Check the model path.")
             
-        return result
\ No newline at end of file
+        if return_stats:
+            return result, stats
+        return result
+
+    # =============================================================================
+    # Run Statistics
+    # -----------------------------------------------------------------------------
+    # Run PRISM using the expression and return the statistics printed by PRISM:
+    #   - Models:            number of models built (one per value of the constants)
+    #   - Construction Time: total time to construct the models (s)
+    #   - Checking Time:     total time to check the property (s)
+    #   - States:            total number of states of the models 
+    #   - Transitions:       total number of transitions of the models
+    #   - Wall Time:         time taken by the run, including starting PRISM (s)
+    # =============================================================================
+    def Run_Statistics(expression):
+        t0 = time.perf_counter()
+        process = subprocess.Popen(expression, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        out = out.decode('utf-8')
+
+        number = r"([0-9.eE+-]+)"
+        construction = [float(t) for t in re.findall(rf"Time for model construction: {number} seconds", out)]
+        checking = [float(t) for t in re.findall(rf"Time for model checking: {number} seconds", out)]
+        states = [int(n) for n in re.findall(r"States:\s+(\d+)", out)]
+        transitions = [int(n) for n in re.findall(r"Transitions:\s+(\d+)", out)]
+
+        return {"Models"            : len(construction),
+                "Construction Time" : sum(construction),
+                "Checking Time"     : sum(checking),
+                "States"            : sum(states),
+                "Transitions"       : sum(transitions),
+                "Wall Time"         : time.perf_counter() - t0}
+    # =============================================================================
+    # Reachable Chain
+    # -----------------------------------------------------------------------------
+    # Since the actions are fixed, each node of the model has a single enabled 
+    # transition (success to the selected neighbour, return to the same node and 
+    # fail to node 0). Starting from the start location, the selected transitions
+    # are followed to find every node which can be reached before the final node.
+    # Each entry of the chain is (node, neighbour, success, return, fail), and the
+    # neighbour is None if the action of the node is not valid.
+    # =============================================================================
+    def Reachable_Chain(nodes, start_location, final_location, actions):
+        chain = list()
+        visited = set()
+        queue = deque([start_location])
+        while queue:
+            node = queue.popleft()
+            if node in visited or node == final_location or node == 0:
+                continue
+            visited.add(node)
+
+            # Locate the edge selected by the action of the node.
+            edge = Prism.Action_Edge(nodes, node, int(actions[node-1]))
+            if edge is None:
+                chain.append((node, None, 0, 0, 0))
+            else:
+                trans, distance, success, ret, fail = edge
+                chain.append((node, trans, success, ret, fail))
+                queue.append(trans)
+
+        return chain
+
+    # =============================================================================
+    # Action Edge
+    # -----------------------------------------------------------------------------
+    # Return the edge selected by an action (1 to the number of neighbours) of a 
+    # node as (neighbour, distance, success, return, fail), or None if the action 
+    # is not valid. The nodes can be the map or its transition matrix, which can 
+    # be used in the same way by Reachable_Chain and Solve.
+    # =============================================================================
+    def Action_Edge(nodes, node, act):
+        if isinstance(nodes, (CSR_Map, Transition_Matrix)):
+            lo = int(nodes.offsets[node])
+            hi = int(nodes.offsets[node+1])
+            if not 1 <= act <= hi - lo:
+                return None
+            idx = lo + act - 1
+            return (int(nodes.neighbours[idx]), float(nodes.arrays["Distance"][idx]), float(nodes.arrays["Success"][idx]), 
+                    float(nodes.arrays["Return"][idx]), float(nodes.arrays["Fail"][idx]))
+
+        connections = list(nodes[node].items())
+        if not 1 <= act <= len(connections):
+            return None
+        trans, edge = connections[act-1]
+        return (trans, edge["Distance"], edge["Success"], edge["Return"], edge["Fail"])
+
+    # =============================================================================
+    # Native Solver
+    # -----------------------------------------------------------------------------
+    # With the actions fixed, the model is a discrete time Markov chain and the 
+    # PCTL property Pmax=? [F (end & s=final)] is the probability of reaching the 
+    # final node, which is solved as a linear system over the reachable nodes:
+    #       x = Q x + b
+    # where Q holds the transitions between the reachable nodes and b holds the 
+    # transitions into the final node. As with PRISM, the nodes which cannot 
+    # reach the final node are first removed (probability 0), which ensures the 
+    # system (I - Q) x = b can be solved.
+    # =============================================================================
+    def Solve(nodes, start_location, final_location, actions):
+        if start_location == final_location:
+            return 1.0
+
+        chain = Prism.Reachable_Chain(nodes, start_location, final_location, actions)
+
+        # Find the nodes which can reach the final node using the transitions with 
+        # a non-zero success probability.
+        incoming = dict()
+        for node, trans, success, ret, fail in chain:
+            if trans is not None and success > 0:
+                incoming.setdefault(trans, list()).append(node)
+        reach = set()
+        queue = [final_location]
+        while queue:
+            for node in incoming.get(queue.pop(), list()):
+                if node not in reach:
+                    reach.add(node)
+                    queue.append(node)
+
+        if start_location not in reach:
+            return 0.0
+
+        # Create and solve the linear system for the nodes which can reach the final
+        # node.
+        states = [link for link in chain if link[0] in reach]
+        index = {link[0] : i for i, link in enumerate(states)}
+        A = np.eye(len(states))
+        b = np.zeros(len(states))
+        for i, (node, trans, success, ret, fail) in enumerate(states):
+            A[i, i] -= ret
+            if trans == final_location:
+                b[i] += success
+            elif trans in index:
+                A[i, index[trans]] -= success
+
+        result = np.linalg.solve(A, b)
+        return float(min(max(result[index[start_location]], 0.0), 1.0))
+
+    # =============================================================================
+    # Evaluate Batch
+    # -----------------------------------------------------------------------------
+    # Evaluate many action arrays (one per row) at once, giving the same results 
+    # as Solve. With the actions fixed, each node has a single neighbour, so the
+    # probability of reaching the final node is the product of success/(1-return)
+    # along the path of selected edges, and is 0 if the path fails or returns to 
+    # a node. The expected distance (the "distance" reward of the model) adds the
+    # expected distance of each edge, distance/(1-return), weighted by the 
+    # probability of reaching the edge.
+    #
+    # All candidates are moved forward one edge at a time, so the time taken 
+    # depends on the length of the paths rather than the size of the map. The 
+    # transition matrix of the map can be given if it has already been created.
+    # Returns the probabilities and the expected distances of the candidates.
+    # =============================================================================
+    def Evaluate_Batch(nodes, start_location, final_location, action_array, transitions=None):
+        if transitions is None:
+            transitions = Transition_Matrix.From_Map(nodes)
+        arrays = transitions.arrays
+        edges = transitions.Apply_Action(action_array)     # Edge selected at each node, or -1
+        n_candidates, n_nodes = edges.shape[0], edges.shape[1] - 1
+        rows = np.arange(n_candidates)
+
+        ret = arrays["Return"]
+        leave = np.where(ret < 1, 1 - ret, np.inf)
+        weight = np.append(np.minimum(arrays["Success"] / leave, 1), 0)          # Index -1 has no edge
+        cost = np.append(arrays["Distance"] / leave, 0)
+        neighbours = np.append(arrays["Neighbours"], 0)
+
+        probability = np.ones(n_candidates)
+        distance = np.zeros(n_candidates)
+        position = np.full(n_candidates, start_location)
+        active = position != final_location
+        visited = np.zeros(shape=(n_candidates, n_nodes+1), dtype=bool)
+        while active.any():
+            visited[rows, position] = True
+            edge = edges[rows, position]
+            distance = np.where(active, distance + probability * cost[edge], distance)
+            probability = np.where(active, probability * weight[edge], probability)
+            position = np.where(active, neighbours[edge], position)
+            active &= (position != final_location) & (probability > 0) & ~visited[rows, position]
+
+        # Candidates which have not reached the final node have failed or are in a loop.
+        probability[position != final_location] = 0
+        return probability, distance
+
+    # =============================================================================
+    # Native Value Iteration
+    # -----------------------------------------------------------------------------
+    # Find the policy which maximises the probability of reaching each target from
+    # every node, for many targets at once, in the same way as Synthesise_Policy. 
+    # Since a return leaves the agent at the same node, repeating an edge until 
+    # it succeeds or fails reaches the neighbour with probability success/(1-return), 
+    # so the values are found from:
+    #       V(node) = max over edges (success * V(next) / (1 - return))
+    # The values of every target are updated together using the edge arrays of the 
+    # CSR map, taking the maximum of each node's edges using np.maximum.reduceat. 
+    # The values only change when a better path is found, so the search stops 
+    # once no value changes (at most one iteration per node).
+    #
+    # The expected distance travelled by the policy (the "distance" reward of the 
+    # model) is then found from the edge selected at each node:
+    #       D(node) = (distance + success * D(next)) / (1 - return)
+    #
+    # Returns a dictionary of arrays indexed by [target, node]: "Values", "Policy"
+    # (the next node, or 0 if the target cannot be reached) and "Distance". The 
+    # targets are solved in chunks to limit the memory required. The transition
+    # matrix of the map can be given if it has already been created.
+    # =============================================================================
+    def Value_Iteration(nodes, targets=None, chunk=64, transitions=None):
+        if transitions is None:
+            transitions = Transition_Matrix.From_Map(nodes)
+        if targets is None:
+            targets = list(range(1, transitions.n_nodes+1))
+
+        n_states = transitions.n_nodes + 1
+        offsets = transitions.offsets
+        neighbours = transitions.neighbours
+        n_edges = transitions.n_edges
+        sources = np.repeat(np.arange(n_states), np.diff(offsets)[:n_states])
+        success = transitions.arrays["Success"]
+        ret = transitions.arrays["Return"]
+        leave = np.where(ret < 1, 1 - ret, np.inf)          # Blocked edges are never left
+        weight = np.minimum(success / leave, 1)             # Rounding must not create loops with a gain
+        distance = transitions.arrays["Distance"]
+
+        # Nodes with edges, and the first edge of each of these nodes.
+        rows = np.flatnonzero(np.diff(offsets) > 0)
+        starts = offsets[rows]
+
+        values = np.zeros(shape=(len(targets), n_states))
+        policy = np.zeros(shape=(len(targets), n_states), dtype=np.int64)
+        expected = np.full(shape=(len(targets), n_states), fill_value=np.inf)
+        iterations = 0
+        for lo in range(0, len(targets), chunk):
+            batch = np.asarray(targets[lo:lo+chunk])
+            n_batch = len(batch)
+            batch_index = np.arange(n_batch)
+            V = np.zeros(shape=(n_batch, n_states))
+            V[batch_index, batch] = 1
+            P = np.full(shape=(n_batch, n_states), fill_value=-1, dtype=np.int64)   # Selected edge of each node
+
+            for i in range(n_states):
+                Q = weight * V[:, neighbours]
+                best = np.zeros(shape=(n_batch, n_states))
+                best[:, rows] = np.maximum.reduceat(Q, starts, axis=1)
+                best[batch_index, batch] = 1
+
+                improved = best > V
+                if not improved.any():
+                    break
+                iterations += 1
+
+                # Select the first edge of each improved node with the best value.
+                candidates = np.where(Q == best[:, sources], np.arange(n_edges), n_edges)
+                first = np.full(shape=(n_batch, n_states), fill_value=n_edges, dtype=np.int64)
+                first[:, rows] = np.minimum.reduceat(candidates, starts, axis=1)
+                P = np.where(improved, first, P)
+                V = np.maximum(V, best)
+
+            # Expected distance of the policy, starting from zero at the targets.
+            selected = np.where(P >= 0, P, 0)
+            valid = (P >= 0) & (V > 0)
+            D = np.zeros(shape=(n_batch, n_states))
+            for i in range(n_states):
+                new_D = np.where(valid, (distance[selected] + success[selected] * D[batch_index[:, None], neighbours[selected]]) / leave[selected], 0)
+                if np.array_equal(new_D, D):
+                    break
+                D = new_D
+
+            values[lo:lo+n_batch] = V
+            policy[lo:lo+n_batch] = np.where(valid, neighbours[selected], 0)
+            expected[lo:lo+n_batch] = np.where(valid, D, np.inf)
+            expected[lo + batch_index, batch] = 0
+
+        return {"Targets" : list(targets), "Values" : values, "Policy" : policy, "Distance" : expected, "Iterations" : iterations}
+
+    # =============================================================================
+    # Validate
+    # -----------------------------------------------------------------------------
+    # Obtain the probability of reaching the final location using the actions. The
+    # engine selects how the probability is obtained:
+    #   - "prism":  the model is exported and checked using PRISM (Simulate_Batch)
+    #   - "native": solved in process using the native solver (Solve)
+    #   - "check":  both are used and a RuntimeWarning is issued if the results 
+    #               differ by more than the tolerance. The PRISM result is returned.
+    #
+    # Results are stored in the validation cache (Prism.cache), so a model which 
+    # has already been validated is not solved again. Set use_cache to False to 
+    # always solve the model. The cache is not used by the "check" engine, so 
+    # every model is compared.
+    # =============================================================================
+    def Validate(prism_path, nodes, start_location, final_location, actions, engine="prism", file_name=None, tolerance=1e-5, use_cache=True, reduced=False):
+        return Prism.Validate_Batch(prism_path, nodes, [start_location], [final_location], [actions], engine=engine, 
+                                    file_name=file_name, tolerance=tolerance, use_cache=use_cache, reduced=reduced)[0]
+
+    # =============================================================================
+    # Simulate Batch
+    # -----------------------------------------------------------------------------
+    # Check a batch model (see Create_Batch_Model) for every candidate in a single 
+    # run of PRISM. The results of the sweep over k are exported as a csv file and
+    # returned as a list, in the order of the candidates. If return_stats is True,
+    # the statistics of the run (see Run_Statistics) are also returned.
+    # =============================================================================
+    def Simulate_Batch(prism_path, model, n_candidates, return_stats=False):
+        results_path = model[0:-6]+".csv"
+        if os.path.exists(results_path):
+            os.remove(results_path)     # Prevent the results of a previous run being read
+        expression = [f"{prism_path}", f"{model}", "-pctl", "Pmax=? [F (end & s=final)]", 
+                      "-const", f"k=0:{n_candidates-1}", "-exportresults", f"{results_path}:csv"]
+
+        # Run the expression in the command line using subprocess
+        stats = Prism.Run_Statistics(expression)
+
+        # Each row of the results is the value of k followed by the result.
+        results = [None] * n_candidates
+        try:
+            with open(results_path, 'r') as f:
+                for row in f.read().split("\n")[1:]:
+                    row = row.split(",")
+                    if len(row) == 2:
+                        results[int(row[0])] = float(row[1])
+        except (OSError, ValueError):
+            pass
+        
+        if None in results: 
+            print("Something went wrong. Check the model path.")
+            
+        if return_stats:
+            return results, stats
+        return results
+
+    # =============================================================================
+    # Synthesise Policy
+    # -----------------------------------------------------------------------------
+    # Use PRISM to find the policy which maximises the probability of reaching the
+    # final location from every node. The adversary (.tra) and states (.sta) are
+    # exported and read into a table of the next node for each node (see 
+    # Read_Policy). A RuntimeError is raised if PRISM did not export the files.
+    # =============================================================================
+    def Synthesise_Policy(prism_path, nodes, final_location, file_name=None):
+        code = Prism.Create_Policy_Model(nodes, final_location)
+        file_path, model_name = Prism.Export_Model(code, file_name=file_name)
+        model = file_path + model_name
+        policy_path = model[0:-6]+".tra"
+        states_path = model[0:-6]+".sta"
+        expression = [f"{prism_path}", f"{model}", "-pctl", "Pmax=? [F (end & s=final)]", 
+                      "-exportadv", f"{policy_path}", "-exportstates", f"{states_path}"]
+
+        try:
+            Prism.Run_Statistics(expression)
+            return Prism.Read_Policy(policy_path, states_path, final_location)
+        except OSError as error:
+            raise RuntimeError("PRISM did not export the policy. Check the model path.") from error
+        finally:
+            if file_name is None:
+                Prism.Remove_Files(model)
+
+    # =============================================================================
+    # Read Policy
+    # -----------------------------------------------------------------------------
+    # Read the adversary (.tra) and states (.sta) exported by PRISM into a table of
+    # the next node for each node {node : next}. Nodes which cannot reach the final
+    # location are not included. A ValueError is raised if a row cannot be read.
+    # =============================================================================
+    def Read_Policy(policy_path, states_path, final_location):
+        # Each state is listed as index:(end,s).
+        states = dict()
+        with open(states_path, 'r') as f:
+            for row in f.read().split("\n")[1:]:
+                if row.strip() == "":
+                    continue
+                idx, values = row.split(":")
+                end, node = values.strip("()").split(",")
+                states[int(idx)] = (end == "true", int(node))
+
+        # Each transition of the adversary is listed as source, target, probability 
+        # and action, where the action s{node}_s{next} is selected at the source.
+        policy = dict()
+        with open(policy_path, 'r') as f:
+            for row in f.read().split("\n")[1:]:
+                row = row.split()
+                if len(row) == 4 and row[3].startswith("s"):
+                    if int(row[0]) not in states:
+                        raise ValueError(f"Unknown state {row[0]} in {policy_path}")
+                    end, node = states[int(row[0])]
+                    if not end and node != final_location:
+                        policy[node] = int(row[3].split("_s")[1])
+
+        return policy
+
+    # =============================================================================
+    # Check Group
+    # -----------------------------------------------------------------------------
+    # Internal method which checks a group of candidates using a single run of 
+    # PRISM. Temporary models (no file name) are removed once they are checked.
+    # =============================================================================
+    def __Check_Group(prism_path, nodes, start_locations, final_locations, action_array, file_name, reduced):
+        code = Prism.Create_Batch_Model(nodes, start_locations, final_locations, action_array, reduced=reduced)
+        file_path, model_name = Prism.Export_Model(code, file_name=file_name)
+        try:
+            return Prism.Simulate_Batch(prism_path, file_path+model_name, len(start_locations))
+        finally:
+            if file_name is None:
+                Prism.Remove_Files(file_path+model_name)
+
+    # =============================================================================
+    # Validate Batch
+    # -----------------------------------------------------------------------------
+    # Validate many candidates at once using the same engines as Validate. With 
+    # PRISM, the candidates share a single model and run, so the start up of PRISM
+    # and parsing the model are only performed once. Candidates found in the cache,
+    # or identical to another candidate, are not validated again. If reduced is 
+    # True, the model only contains the nodes reached by the candidates (see 
+    # Create_Batch_Model).
+    #
+    # If no file name is given, the model is exported to a temporary file which is
+    # removed (along with the PRISM outputs) once the results are obtained.
+    #
+    # With more than one worker, the candidates are split into groups which are 
+    # checked by separate runs of PRISM at the same time. Each run starts PRISM,
+    # so the candidates are only split if every group has at least min_group 
+    # candidates. Each group always uses a temporary file, and the results are 
+    # returned in the order of the candidates.
+    # =============================================================================
+    def Validate_Batch(prism_path, nodes, start_locations, final_locations, action_array, engine="prism", file_name=None, tolerance=1e-5, use_cache=True, reduced=False, workers=1, min_group=4):
+        n_candidates = len(start_locations)
+        results = [None] * n_candidates
+        use_cache = use_cache and engine != "check"
+
+        # Find the candidates which need to be validated.
+        keys = [None] * n_candidates
+        required = dict()   # First candidate with each key
+        for k in range(n_candidates):
+            if use_cache:
+                chain = Prism.Reachable_Chain(nodes, start_locations[k], final_locations[k], action_array[k])
+                keys[k] = Prism.cache.Key(engine, start_locations[k], final_locations[k], chain)
+                if keys[k] in required:
+                    Prism.cache.hits += 1   # Identical to another candidate
+                    continue
+                results[k] = Prism.cache.Get(keys[k])
+                if results[k] is not None:
+                    continue
+                required[keys[k]] = k
+            else:
+                required[k] = k
+        candidates = list(required.values())
+
+        if candidates and engine == "native":
+            for k in candidates:
+                results[k] = Prism.Solve(nodes, start_locations[k], final_locations[k], action_array[k])
+
+        elif candidates:
+            n_groups = min(workers, len(candidates) // min_group)
+            if n_groups > 1:
+                groups = [[int(k) for k in group] for group in np.array_split(candidates, n_groups)]
+                with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                    batches = list(executor.map(lambda group: Prism.__Check_Group(prism_path, nodes, [start_locations[k] for k in group], 
+                                                                                 [final_locations[k] for k in group], 
+                                                                                 [action_array[k] for k in group], None, reduced), groups))
+            else:
+                groups = [candidates]
+                batches = [Prism.__Check_Group(prism_path, nodes, [start_locations[k] for k in candidates], [final_locations[k] for k in candidates], 
+                                               [action_array[k] for k in candidates], file_name, reduced)]
+
+            for group, batch in zip(groups, batches):
+                for k, result in zip(group, batch):
+                    results[k] = result
+
+            if engine == "check":
+                for k in candidates:
+                    native = Prism.Solve(nodes, start_locations[k], final_locations[k], action_array[k])
+                    if results[k] is None or abs(results[k] - native) > tolerance:
+                        warnings.warn(f"Validation mismatch from node {start_locations[k]} to {final_locations[k]}: PRISM = {results[k]}, native = {native}", 
+                                      RuntimeWarning)
+
+        # Store the new results, and copy the results to the identical candidates.
+        if use_cache:
+            for k in candidates:
+                Prism.cache.Set(keys[k], results[k])
+            for k in range(n_candidates):
+                if results[k] is None:
+                    results[k] = results[required[keys[k]]]
+
+        return results
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from Utilities.Prism import Prism
 from copy import deepcopy
+from collections import deque
 from random import uniform, randint
 import numpy as np
 
@@ -77,8 +78,8 @@ class Simulation:
 					curr_position = human.paths.selected.path[human.paths.selected.i_path]
 					next_position = human.paths.selected.path[human.paths.selected.i_path+1]
 
-					# Remove the fisrt element from the human's list.
-					human.paths.selected.path.pop(0)
+					# Remove the fisrt element from the human's list (a deque, see Select_Path).
+					human.paths.selected.path.popleft()
 
 					# Update the position of the human 
 					human.dynamics.position = human.paths.selected.path[human.paths.selected.i_path]
@@ -94,7 +95,7 @@ class Simulation:
 					# The human progressed the path. 
 					else:
 						if print_steps:
-							print(f"\t[{human.mission.events+1}] The human moved from node {curr_position} to {next_position} (on path) --> {human.paths.selected.path}")
+							print(f"\t[{human.mission.events+1}] The human moved from node {curr_position} to {next_position} (on path) --> {list(human.paths.selected.path)}")
 
 				state = "Predicted"
 
@@ -114,7 +115,7 @@ class Simulation:
 		data['state'] = state
 		data['creativity'] = creativity
 		data['rand move'] = random_movement
-		data['path'] = human.paths.selected.path
+		data['path'] = list(human.paths.selected.path)
 		data['Task ID'] = human.mission.t_task,
 		data['Phase ID'] = human.mission.i_phase,
 		data['Phase '] = human.mission.i_task,
@@ -148,9 +149,10 @@ class Simulation:
 			# If the next node is the same location as the current node we do not need to move. 
 			# Therefore, check to see if the values are the same and adjust the success rates.
 			if curr_node != next_node:
-				p_success = map[curr_node][next_node]["Success"] 	# Success probability of the next transition
-				p_return  = map[curr_node][next_node]["Return"]	# Return probability of the next transition	
-				p_fail    = map[curr_node][next_node]["Fail"]		# Fail probability of the next transition
+				edge = map[curr_node][next_node]	# Edge values (dictionary or CSR view) for the transition
+				p_success = edge["Success"] 	# Success probability of the next transition
+				p_return  = edge["Return"]		# Return probability of the next transition	
+				p_fail    = edge["Fail"]		# Fail probability of the next transition
 
 			# Agent is not moving this step, so set the transition probability of success 
 			# to be 1.0 and the failure states to 0.
@@ -342,8 +344,20 @@ class Simulation:
 	#
 	# Paths are stored within the agent's path class (agent.paths) and are selected 
 	# based on a PRISM validation analysis. 
+	#
+	# The engine is passed to Graph.Dijkstra. With "ch", paths on the default map 
+	# use the contraction hierarchy, while the heat map falls back to Dijkstra.
+	# Paths are validated when the PRISM path is given. The validation engine is 
+	# passed to Prism.Validate, where "prism" runs PRISM and "native" solves the 
+	# model in process.
+	#
+	# With the "policy" planner, the agent follows the maximum probability policy 
+	# (see Graph.Policy_Path), which is reused until the map or heat map changes. 
+	# The policy is found in process by value iteration if the validation engine 
+	# is "native", and is otherwise synthesised by PRISM. The policy already 
+	# maximises the probability of success, so the path is not validated.
 	# =============================================================================
-	def Select_Path(entity, prism_path=None, validate=True, heated=False, print_output=True):
+	def Select_Path(entity, prism_path=None, validate=True, heated=False, print_output=True, engine="dijkstra", validation="prism", planner="dijkstra"):
 		# We have two classes of agents ("agent" and "human") which require different 
 		# processes.
 		if entity.ID == "Human":
@@ -351,26 +365,41 @@ class Simulation:
 			next_waypoint = entity.mission.phase[entity.mission.i_task]
 			
 			# Find the path of least distance
-			entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance")
+			entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance", engine=engine)
 			entity.paths.selected = deepcopy(entity.paths.min_dist)
 
+			# The human removes the first node of the path at every step, so the path 
+			# is stored as a deque.
+			entity.paths.selected.path = deque(entity.paths.selected.path)
+
 		if entity.ID == "Agent":
 			curr_position = entity.dynamics.position
 			next_waypoint = entity.mission.phase[entity.mission.i_task]
+			# The agent follows the synthesised policy.
+			if planner == "policy":
+				map = entity.heat_map if heated else entity.map
+				policy_engine = "native" if validation == "native" else "prism"
+				entity = entity.Policy_Path(curr_position, next_waypoint, entity.paths.max_prob, map=map, prism_path=prism_path, engine=policy_engine)
+
 			# For the agent we find two solutions: least distance and highest prob of success
-			if heated is False:
+			elif heated is False:
 				# Use the heated map for path finding
-				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance")
-				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.max_prob, method="Probability")	
+				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance", engine=engine)
+				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.max_prob, method="Probability", engine=engine)	
 
 			elif heated is True:
 				# Use the heated map for path finding
-				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance",    map=entity.heat_map)
-				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.max_prob, method="Probability", map=entity.heat_map)	
+				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.min_dist, method="Distance",    map=entity.heat_map, engine=engine)
+				entity = entity.Dijkstra(curr_position, next_waypoint, entity.paths.max_prob, method="Probability", map=entity.heat_map, engine=engine)	
 
-			if validate and prism_path is not None: 
+			# The synthesised policy already maximises the probability of success, so 
+			# the path does not need to be validated.
+			if planner == "policy":
+				entity.paths.selected = deepcopy(entity.paths.max_prob)
+
+			elif validate and prism_path is not None: 
 				# select the path through validation
-				entity = Simulation.__Validate(entity, prism_path)
+				entity = Simulation.__Validate(entity, prism_path, validation)
 
 			else:
 				# select the highest probability path
@@ -391,7 +420,7 @@ class Simulation:
 			entity.paths.selected.path.append(entity.paths.selected.path[0])
 
 		if print_output is True:
-			print(f"The {entity.ID} begins task {entity.mission.t_task+1} and will path from node {curr_position} to node: {next_waypoint} using path {entity.paths.selected.path}")
+			print(f"The {entity.ID} begins task {entity.mission.t_task+1} and will path from node {curr_position} to node: {next_waypoint} using path {list(entity.paths.selected.path)}")
 
 		return entity
 
@@ -402,12 +431,10 @@ class Simulation:
 	# -ation using PRISM. This method performs that action and selects the path 
 	# which has the highest validated probability of success.
 	# =============================================================================
-	def __Validate(agent, prism_path):
+	def __Validate(agent, prism_path, validation="prism"):
 		# Positions for validation
 		curr_position = agent.dynamics.position
 		next_waypoint = agent.mission.phase[agent.mission.i_task]
-		
-		export_file_name = "Prism/Model_1.prism" # Prism folder for exporting the models
 
 		# Since the path has yet to be validated, we should analyse both paths 
 		# using PRISM and select the path which has the best validated probability 
@@ -415,15 +442,14 @@ class Simulation:
 		action_1 = Prism.Generate_Action(agent.map, num_solutions=1, initial_guess=agent.paths.min_dist.path)
 		action_2 = Prism.Generate_Action(agent.map, num_solutions=1, initial_guess=agent.paths.max_prob.path)
 
-		# Run PRISM validation on the 1st path 
-		code = Prism.Create_Model(agent.map, curr_position, next_waypoint, action_1[0,:])
-		file_path, model_name = Prism.Export_Model(code, file_name=export_file_name)
-		agent.paths.min_dist.valid = Prism.Simulate(prism_path, file_path+model_name, output_files=True)
-		    
-		# Run PRISM validation on the 2nd path
-		code = Prism.Create_Model(agent.map, curr_position, next_waypoint, action_2[0,:])
-		file_path, model_name = Prism.Export_Model(code, file_name=export_file_name)
-		agent.paths.max_prob.valid = Prism.Simulate(prism_path, file_path+model_name, output_files=True)
+		# Run the validation on both paths at the same time. With PRISM, both paths are 
+		# checked by a single run of PRISM, while the native solver reuses the 
+		# transition matrix of the map.
+		nodes = agent.Transitions() if validation == "native" else agent.map
+		valid = Prism.Validate_Batch(prism_path, nodes, [curr_position]*2, [next_waypoint]*2, np.vstack([action_1[0,:], action_2[0,:]]), 
+									 engine=validation)
+		agent.paths.min_dist.valid = valid[0]
+		agent.paths.max_prob.valid = valid[1]
 
 		# Select the path based on validation probability as the PCTL relationship for 
 		# PRISM will return the maximum probability value. Therefore...
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from Utilities.Compact import CSR_Map
+
+# =============================================================================
+# Transition Matrix
+# =============================================================================
+''' The transition matrix stores the edges of a map as sparse arrays in the
+    order of the actions (see Prism.Generate_Action), so the action a of a node
+    selects the edge offsets[node] + a - 1. Each edge holds the neighbour moved
+    to on success and the distance, success, return and fail values.
+
+    The matrix is created once for each version of a map and is then reused by
+    the native solvers (Prism.Solve, Prism.Evaluate_Batch, Prism.Value_Iteration)
+    rather than reading the map dictionaries every time. Selecting the edges of
+    an action array (Apply_Action) and applying the heat map (Apply_Heat) only
+    index or patch the arrays.
+'''
+class Transition_Matrix:
+    def __init__(self, offsets, neighbours, values):
+        self.offsets = offsets          # First edge of each node, indexed by node (n_nodes+2)
+        self.neighbours = neighbours    # Neighbour of each edge
+        self.arrays = {"Offsets" : offsets, "Neighbours" : neighbours}
+        self.arrays.update(values)
+        self.n_nodes = len(offsets) - 2
+        self.n_edges = len(neighbours)
+        self.__index = None             # Edge of each connection {(node, neighbour) : edge}
+
+    # =============================================================================
+    # Create from a Map
+    # -----------------------------------------------------------------------------
+    # Create the transition matrix of a map. The arrays of the CSR map are already
+    # in the order of the actions and are used without copying, while the edges of
+    # the dictionary map (or heat map overlay) follow the order of each node's
+    # neighbours.
+    # =============================================================================
+    def From_Map(nodes):
+        if isinstance(nodes, CSR_Map):
+            return Transition_Matrix(nodes.offsets, nodes.neighbours, nodes.arrays)
+
+        n_nodes = max(nodes)
+        counts = np.zeros(shape=(n_nodes+2), dtype=np.int64)
+        neighbours = list()
+        values = {"Distance" : list(), "Success" : list(), "Return" : list(), "Fail" : list()}
+        for node in range(1, n_nodes+1):
+            if node not in nodes:
+                continue
+            counts[node+1] = len(nodes[node])
+            for trans in nodes[node]:
+                edge = nodes[node][trans]
+                neighbours.append(trans)
+                for key in values:
+                    values[key].append(edge[key])
+
+        return Transition_Matrix(np.cumsum(counts), np.asarray(neighbours, dtype=np.int64),
+                                 {key : np.asarray(values[key], dtype=np.float64) for key in values})
+
+    # =============================================================================
+    # Edge Index
+    # -----------------------------------------------------------------------------
+    # Return the edge between a node and its neighbour. The index of every edge is
+    # created the first time it is required.
+    # =============================================================================
+    def Index(self, node, neighbour):
+        if self.__index is None:
+            sources = np.repeat(np.arange(1, self.n_nodes+1), np.diff(self.offsets)[1:])
+            self.__index = dict(zip(zip(sources.tolist(), self.neighbours.tolist()), range(self.n_edges)))
+        return self.__index[(node, neighbour)]
+
+    # =============================================================================
+    # Apply Action
+    # -----------------------------------------------------------------------------
+    # Select the edge of every node using an action array (one row per candidate,
+    # with a column for each node). Returns the selected edges indexed by
+    # [candidate, node], with -1 where the action is not valid and for node 0
+    # (the failure state).
+    # =============================================================================
+    def Apply_Action(self, action_array):
+        action_array = np.atleast_2d(action_array)
+        n_candidates, n_nodes = action_array.shape
+        counts = np.diff(self.offsets)[1:n_nodes+1]
+        valid = (action_array >= 1) & (action_array <= counts)
+        edges = np.where(valid, self.offsets[1:n_nodes+1] + action_array - 1, -1)
+        return np.hstack([np.full(shape=(n_candidates, 1), fill_value=-1), edges])
+
+    # =============================================================================
+    # Apply Heat
+    # -----------------------------------------------------------------------------
+    # Create the transition matrix of a heat map overlay of this matrix's map. Only
+    # the edges changed by the overlay are patched, with the structure and the
+    # unchanged values shared with this matrix.
+    # =============================================================================
+    def Apply_Heat(self, heat_map):
+        keys = {value for values in heat_map.edges.values() for value in values}
+        values = dict(self.arrays)
+        del values["Offsets"], values["Neighbours"]
+        for key in keys:
+            values[key] = values[key].copy()
+        for (node, neighbour), changed in heat_map.edges.items():
+            edge = self.Index(node, neighbour)
+            for key, number in changed.items():
+                values[key][edge] = number
+
+        patched = Transition_Matrix(self.offsets, self.neighbours, values)
+        patched.__index = self.__index
+        return patched
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os, sys, random
+import numpy as np
+import pytest
+
+# The tests import the Utilities package from the root of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utilities.Environment import Graph
+from Utilities.Maps import Risk, Bungalow, LivingArea, CSI_Cobot
+
+# =============================================================================
+# Test Environments
+# -----------------------------------------------------------------------------
+# The shipped maps, and a small map with edges of success 1.0 which creates
+# paths of equal probability.
+# =============================================================================
+MAPS = {
+    "Bungalow"   : lambda: Bungalow(Risk())[0],
+    "LivingArea" : lambda: LivingArea(Risk()),
+    "CSI_Cobot"  : lambda: CSI_Cobot(Risk()),
+}
+
+EQUAL_SUCCESS = [[5, 3, 1.0, 0.9], [3, 2, 1.0, 1.0], [2, 4, 1.0, 0.9], [1, 4, 1.0, 0.9]]
+
+# =============================================================================
+# Build Graph
+# -----------------------------------------------------------------------------
+# Create a graph in the same way as Coop_Task for the agent. The random number
+# generators are seeded so the maps are the same for every backend.
+# =============================================================================
+def Build_Graph(connections, backend="dict", n_probs=3, seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    n_nodes = max(max(c[0], c[1]) for c in connections)
+    graph = Graph(n_nodes=n_nodes, ID="Agent", n_probs=n_probs, backend=backend)
+    graph.Create_Connections(connections)
+    graph.Create_Map()
+    return graph
+
+# =============================================================================
+# Human
+# -----------------------------------------------------------------------------
+# The position and predicted path of a human, as used by Graph.Update_Heat.
+# =============================================================================
+class Human:
+    def __init__(self, path, position):
+        self.paths = type("Paths", (), {})()
+        self.paths.selected = type("Path", (), {"path" : path})()
+        self.dynamics = type("Dynamics", (), {"position" : position})()
+
+@pytest.fixture(params=list(MAPS))
+def connections(request):
+    return MAPS[request.param]()
+
+@pytest.fixture
+def graph(connections):
+    return Build_Graph(connections)
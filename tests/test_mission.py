@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import random
+from copy import deepcopy
+import numpy as np
+import pytest
+
+from Utilities.Environment import Graph
+from Utilities.Maps import Risk, Bungalow
+from Utilities.Mission import Mission, Plan_Cache, Preset_Missions
+from conftest import Build_Graph
+
+# =============================================================================
+# Missions
+# -----------------------------------------------------------------------------
+# The preset mission and random missions of unordered tasks (split by an
+# ordered task) on the Bungalow map, from random start locations. Returns the
+# mission and its sub-tasks before they are solved.
+# =============================================================================
+def Missions(n_missions=8, seed=0):
+    agent = Build_Graph(Bungalow(Risk())[0])
+    rng = random.Random(seed)
+    missions = list()
+    for i in range(n_missions):
+        agent.dynamics.position = rng.randint(1, agent.n_nodes)
+        if i == 0:
+            tasks, headers = Preset_Missions.Mission_One(start=agent.dynamics.position, final=22)
+        else:
+            k = rng.randint(2, 7)
+            tasks = [agent.dynamics.position] + rng.sample(range(1, agent.n_nodes+1), k) + [22]
+            headers = ['O'] + ['U']*k + ['O']
+            if k > 4:
+                headers[3] = 'O'
+        agent.mission.tasks = tasks
+        agent.mission.headers = headers
+
+        mission = Mission(agent)
+        mission.environment = Graph(n_nodes=agent.n_nodes, ID="Agent", n_probs=3)
+        mission.environment.Create_Connections(mission.connections)
+        mission.environment.Create_Map()
+        missions.append((mission, mission.Breakdown()))
+    return missions
+
+MISSIONS = Missions()
+
+def Enumerate(mission, sub_tasks):
+    return mission.Solve(mission.Permute(deepcopy(sub_tasks)), method="enumerate")
+
+# =============================================================================
+# Tests
+# =============================================================================
+def test_connections_match_dijkstra():
+    agent = Build_Graph(Bungalow(Risk())[0])
+    agent.dynamics.position = 7
+    agent.mission.tasks, agent.mission.headers = Preset_Missions.Mission_One(start=7, final=22)
+
+    mission = Mission(agent)
+    assert len(mission.connections) == len(mission.tasks)**2
+    for start, final, distance, probability in mission.connections:
+        path, path_distance, path_probability = agent.Dijkstra(start, final, method="Probability")
+        assert distance == round(path_distance, 2)
+        assert probability == round(path_probability, 6)
+
+@pytest.mark.parametrize("method", ["vectorised", "held-karp", "branch-bound"])
+def test_solver_matches_enumeration(method):
+    for mission, sub_tasks in MISSIONS:
+        reference = Enumerate(mission, sub_tasks)
+        if method == "vectorised":
+            solved = mission.Solve(mission.Permute(deepcopy(sub_tasks)), method=method)
+        else:
+            solved = mission.Solve(deepcopy(sub_tasks), method=method)
+
+        for i in reference:
+            for key, value in (("Distance", "Min Value"), ("Probability", "Max Value")):
+                assert solved[i]["Solutions"][key][value] == reference[i]["Solutions"][key][value]
+                assert solved[i]["Solutions"][key]["Paths"] == reference[i]["Solutions"][key]["Paths"]
+
+def test_plan_cache(tmp_path):
+    mission, sub_tasks = MISSIONS[0]
+    solved = mission.Solve(deepcopy(sub_tasks), method="held-karp")
+    phase = next(iter(solved))
+    cache = Plan_Cache(directory=str(tmp_path))
+    key = cache.Key("map", [1, 2], ["O", "O"], 1, "held-karp")
+    assert cache.Get(key) is None
+
+    cache.Set(key, solved)
+    plan = cache.Get(key)
+    plan[phase]["Permuted"].append(None)
+    assert cache.Get(key)[phase]["Permuted"] == solved[phase]["Permuted"]
+
+    # A new cache reads the plan from the directory.
+    cache = Plan_Cache(directory=str(tmp_path))
+    assert cache.Get(key)[phase]["Permuted"] == solved[phase]["Permuted"]
+    assert cache.Statistics()["Disk Hits"] == 1
+
+def test_pareto_front_matches_enumeration():
+    for mission, sub_tasks in MISSIONS:
+        reference = Enumerate(mission, sub_tasks)
+        solved = mission.Pareto_Front(deepcopy(sub_tasks))
+        for i in reference:
+            # The orders which are not dominated by any other order, keeping the first
+            # order of equal values.
+            results = reference[i]["Solutions"]["Results"]
+            order = sorted(range(len(results)), key=lambda j: (results[j,0], -results[j,1], j))
+            front = list()
+            for j in order:
+                if not front or results[j,1] > results[front[-1],1]:
+                    front.append(j)
+
+            pareto = solved[i]["Solutions"]["Pareto"]
+            assert pareto["Paths"] == [reference[i]["Permuted"][j] for j in front]
+            assert np.array_equal(pareto["Results"], results[front])
+
+def test_select_plan():
+    mission, sub_tasks = MISSIONS[1]
+    solved = mission.Pareto_Front(mission.Solve(deepcopy(sub_tasks), method="held-karp"))
+    for sub_task in solved.values():
+        pareto = sub_task["Solutions"]["Pareto"]
+        assert Mission.Select_Plan(sub_task) == sub_task["Solutions"]["Probability"]["Paths"][0]
+        assert Mission.Select_Plan(sub_task, 0) == pareto["Paths"][0]
+        assert Mission.Select_Plan(sub_task, 2) == pareto["Paths"][-1]
+        for path, (distance, probability) in zip(pareto["Paths"], pareto["Results"]):
+            assert Mission.Select_Plan(sub_task, probability) == path
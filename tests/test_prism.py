@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+import random, re, subprocess
+import numpy as np
+import pytest
+
+from Utilities.Prism import Prism, Validation_Cache
+from Utilities.Optimise import Action_Optimiser
+from Utilities.Transitions import Transition_Matrix
+from conftest import Build_Graph, Human, EQUAL_SUCCESS
+
+# =============================================================================
+# Reference Iteration
+# -----------------------------------------------------------------------------
+# Iterate the model of a fixed action array until the values converge, where
+# each node moves to the neighbour of its action on success, stays on return
+# and fails otherwise. Returns the probability of reaching the final node.
+# =============================================================================
+def Reference_Probability(map, start, final, actions, iterations=20000):
+    values = {node : 0.0 for node in map}
+    values[final] = 1.0
+    for i in range(iterations):
+        new_values = dict(values)
+        for node in map:
+            if node == final:
+                continue
+            neighbours = list(map[node])
+            action = int(actions[node-1])
+            if not 1 <= action <= len(neighbours):
+                new_values[node] = 0.0
+                continue
+            edge = map[node][neighbours[action-1]]
+            new_values[node] = edge["Success"] * values[neighbours[action-1]] + edge["Return"] * values[node]
+        if max(abs(new_values[node] - values[node]) for node in map) < 1e-15:
+            break
+        values = new_values
+    return values[start]
+
+# =============================================================================
+# Reference Policy Values
+# -----------------------------------------------------------------------------
+# Iterate the maximum probability of reaching the target over every action,
+#       V(node) = max over edges (success * V(next) + return * V(node))
+# until the values converge.
+# =============================================================================
+def Reference_Policy(map, target, iterations=20000):
+    values = {node : 0.0 for node in map}
+    values[target] = 1.0
+    for i in range(iterations):
+        new_values = {node : max([edge["Success"] * values[n] + edge["Return"] * values[node] for n, edge in map[node].items()] + [0.0])
+                      for node in map}
+        new_values[target] = 1.0
+        if max(abs(new_values[node] - values[node]) for node in map) < 1e-15:
+            break
+        values = new_values
+    return values
+
+# =============================================================================
+# PRISM Output
+# -----------------------------------------------------------------------------
+# PRISM is not run by the tests. Run_Statistics is replaced by a function which 
+# records the expression and writes the results file (-exportresults) which 
+# PRISM would create.
+# =============================================================================
+PRISM_OUTPUT = """PRISM
+=====
+
+Version: 4.7
+
+Parsing model file "Model.prism"...
+
+Type:        MDP
+Modules:     workflow
+Variables:   end s
+
+---------------------------------------------------------------------
+
+Model checking: Pmax=? [ F (end&s=final) ]
+Model constants: k=0
+
+Building model...
+
+Computing reachable states...
+
+Reachability (BFS): 5 iterations in 0.00 seconds (average 0.000000, setup 0.00)
+
+Time for model construction: 0.045 seconds.
+
+Type:        MDP
+States:      12 (1 initial)
+Transitions: 30
+Choices:     14
+
+Value in the initial state: 0.81
+
+Time for model checking: 0.012 seconds.
+
+Result: 0.81 (exact floating point)
+
+---------------------------------------------------------------------
+
+Model checking: Pmax=? [ F (end&s=final) ]
+Model constants: k=1
+
+Building model...
+
+Time for model construction: 1.5E-2 seconds.
+
+Type:        MDP
+States:      8 (1 initial)
+Transitions: 20
+Choices:     9
+
+Value in the initial state: 0.9
+
+Time for model checking: 0.003 seconds.
+
+Result: 0.9 (exact floating point)
+"""
+
+# The states and adversary exported by PRISM for a policy to node 3, where the 
+# failure state is node 0.
+STATES = "(end,s)\n0:(false,0)\n1:(false,1)\n2:(false,2)\n3:(false,3)\n4:(true,0)\n5:(true,3)\n"
+ADVERSARY = "6 8\n0 4 1 end\n1 2 0.9 s1_s2\n1 1 0.1 s1_s2\n2 3 0.985 s2_s3\n2 2 0.01 s2_s3\n2 0 0.005 s2_s3\n3 5 1 end\n"
+
+def Fake_Prism(monkeypatch, results):
+    expressions = list()
+    def Run_Statistics(expression):
+        expressions.append(expression)
+        results_path = expression[expression.index("-exportresults")+1][0:-4]
+        with open(results_path, 'w') as f:
+            f.write(results)
+        return dict()
+    monkeypatch.setattr(Prism, "Run_Statistics", Run_Statistics)
+    return expressions
+
+# =============================================================================
+# Model Commands
+# -----------------------------------------------------------------------------
+# The commands of a model as {(node, action) : command}, with the states of a
+# reduced model renumbered to the nodes of the map.
+# =============================================================================
+def Commands(model, index=None):
+    nodes = {state : node for node, state in index.items()} if index is not None else None
+    commands = dict()
+    for line in model:
+        match = re.match(r"\t\[s(\d+)_s\d+\] \(s=\d+\) & \(a_s\d+=(\d+)\)", line)
+        if match:
+            if nodes is not None:
+                line = re.sub(r"(s'?=)(\d+)", lambda m: m.group(1) + str(nodes[int(m.group(2))]), line)
+            commands[(int(match.group(1)), int(match.group(2)))] = line
+    return commands
+
+def Queries(graph, n_queries=20, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randint(1, graph.n_nodes), rng.randint(1, graph.n_nodes)) for i in range(n_queries)]
+
+def Actions(graph, start, final, n_random=5):
+    # The actions of the Dijkstra paths, and random actions.
+    random.seed(0)
+    actions = [Prism.Generate_Action(graph.map, 1, initial_guess=graph.Dijkstra(start, final, method=method)[0])[0]
+               for method in ["Distance", "Probability"]]
+    return np.vstack(actions + [Prism.Generate_Action(graph.map, n_random)])
+
+# =============================================================================
+# Models
+# -----------------------------------------------------------------------------
+# The edges of the shipped maps either succeed or return, so the maps are also
+# created with the returns as failures (n_probs=2), and the heat map of the 
+# default map is used to include edges which both return and fail.
+# =============================================================================
+@pytest.fixture(params=["failures", "heat"])
+def model(request, connections):
+    if request.param == "failures":
+        graph = Build_Graph(connections, n_probs=2)
+        return graph, graph.map
+
+    graph = Build_Graph(connections)
+    graph.Update_Heat(Human([2, 3, 4, 5], 2))
+    return graph, {node : dict(graph.heat_map[node]) for node in graph.map}
+
+# =============================================================================
+# Tests
+# =============================================================================
+def test_solve_matches_iteration(model):
+    graph, map = model
+    for start, final in Queries(graph):
+        for actions in Actions(graph, start, final):
+            assert Prism.Solve(map, start, final, actions) == pytest.approx(
+                Reference_Probability(map, start, final, actions), abs=1e-9)
+
+def test_validate_native_matches_solve(graph):
+    for start, final in Queries(graph, n_queries=5):
+        actions = Actions(graph, start, final)
+        valid = Prism.Validate_Batch(None, graph.Transitions(), [start]*len(actions), [final]*len(actions), actions, engine="native", use_cache=False)
+        for i in range(len(actions)):
+            assert valid[i] == pytest.approx(Prism.Solve(graph.map, start, final, actions[i]), abs=1e-12)
+
+def test_select_expression():
+    assert Prism._Prism__Select([3, None, 3, 1], 1) == "((k=0|k=2) ? 3 : 1)"
+    assert Prism._Prism__Select([None, 2, None], 1) == "2"
+    assert Prism._Prism__Select([None, None], 1) == "1"
+
+def test_batch_model_text():
+    # Candidates 0 and 2 follow the path 5, 3, 2, 4 and candidate 1 the path 3, 5.
+    graph = Build_Graph(EQUAL_SUCCESS)
+    action_array = [[1, 2, 1, 2, 1], [1, 1, 2, 1, 1], [1, 2, 1, 2, 1]]
+    model = Prism.Create_Batch_Model(graph.map, [5, 3, 5], [4, 5, 4], action_array)
+    for line in ["const int k; \t// Candidate in the range 0 to 2\n",
+                 "const int start = ((k=0|k=2) ? 5 : 3);\n",
+                 "const int final = ((k=0|k=2) ? 4 : 5);\n",
+                 "const int a_s2 = 2; \t// Selected action in the range 1 to 2;\n",
+                 "const int a_s3 = ((k=0|k=2) ? 1 : 2); \t// Selected action in the range 1 to 2;\n",
+                 "const int a_s5 = 1; \t// Selected action in the range 1 to 1;\n",
+                 "\ts : [0..5] init start;\n\n",
+                 "\t[s3_s5] (s=3) & (a_s3=2) & (!end) -> "]:
+        assert line in model
+
+def test_simulate_batch_results(monkeypatch, tmp_path):
+    expressions = Fake_Prism(monkeypatch, "k,Result\n0,0.81\n1,0.9\n2,0.5\n")
+    model = str(tmp_path / "Model.prism")
+    assert Prism.Simulate_Batch("prism", model, 3) == [0.81, 0.9, 0.5]
+    assert expressions[0][expressions[0].index("-const")+1] == "k=0:2"
+    assert expressions[0][expressions[0].index("-exportresults")+1] == str(tmp_path / "Model.csv") + ":csv"
+
+def test_simulate_batch_missing_result(monkeypatch, tmp_path):
+    Fake_Prism(monkeypatch, "k,Result\n0,0.81\n2,0.5\n")
+    assert Prism.Simulate_Batch("prism", str(tmp_path / "Model.prism"), 3) == [0.81, None, 0.5]
+
+def test_validation_cache(monkeypatch, tmp_path):
+    graph = Build_Graph(EQUAL_SUCCESS)
+    actions = [1, 2, 1, 2, 1]
+    monkeypatch.setattr(Prism, "cache", Validation_Cache(directory=str(tmp_path)))
+    result = Prism.Validate(None, graph.map, 5, 4, actions, engine="native")
+    assert Prism.Validate(None, graph.map, 5, 4, actions, engine="native") == result
+    assert Prism.cache.Statistics()["Hits"] == 1
+
+    # A new cache reads the result from the directory.
+    monkeypatch.setattr(Prism, "cache", Validation_Cache(directory=str(tmp_path)))
+    assert Prism.Validate(None, graph.map, 5, 4, actions, engine="native") == result
+    assert Prism.cache.Statistics()["Disk Hits"] == 1
+
+def test_check_mismatch_warns(monkeypatch):
+    # The check engine compares every model, including models validated before.
+    graph = Build_Graph(EQUAL_SUCCESS)
+    Fake_Prism(monkeypatch, "k,Result\n0,0.5\n")
+    monkeypatch.setattr(Prism, "cache", Validation_Cache())
+    for i in range(2):
+        with pytest.warns(RuntimeWarning, match="Validation mismatch"):
+            assert Prism.Validate("prism", graph.map, 5, 4, [1, 2, 1, 2, 1], engine="check") == 0.5
+
+def test_reduced_model_matches_full(graph):
+    queries = Queries(graph, n_queries=6)
+    starts = [start for start, final in queries]
+    finals = [final for start, final in queries]
+    action_array = [Actions(graph, start, final, n_random=0)[0] for start, final in queries]
+    full = Prism.Create_Batch_Model(graph.map, starts, finals, action_array)
+    reduced = Prism.Create_Batch_Model(graph.map, starts, finals, action_array, reduced=True)
+    index, edges, selected = Prism._Prism__Reduced(graph.map, starts, finals, action_array)
+
+    # The commands of the reduced model are the commands of the full model for the
+    # actions selected at the reachable nodes.
+    commands = Commands(full)
+    expected = {(node, act) : commands[(node, act)] for node in selected for act in set(selected[node]) - {None} 
+                if (node, act) in commands}
+    assert Commands(reduced, index) == expected
+
+    # The action constants are the same, and the start and final are renumbered.
+    for node in selected:
+        constant = f"const int a_s{node} = "
+        assert [line.split(";")[0] for line in full if line.startswith(constant)] == [line.split(";")[0] for line in reduced if line.startswith(constant)]
+    assert f"const int start = {Prism._Prism__Select([index[n] for n in starts], None)};\n" in reduced
+    assert f"const int final = {Prism._Prism__Select([index[n] for n in finals], None)};\n" in reduced
+    assert f"\ts : [0..{len(index)-1}] init start;\n\n" in reduced
+
+def test_export_model_unique_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(Prism, "scratch_dir", str(tmp_path))
+    graph = Build_Graph(EQUAL_SUCCESS)
+    code = Prism.Create_Model(graph.map, 5, 4, [1, 2, 1, 2, 1])
+    models = [Prism.Export_Model(code) for i in range(3)]
+    assert len({file_name for path, file_name in models}) == 3
+    for path, file_name in models:
+        with open(path + file_name, 'r') as f:
+            assert f.read() == "".join(code)
+
+    path, file_name = models[0]
+    model = path + file_name
+    for extension in [".csv", ".tra", ".sta"]:
+        open(model[0:-6] + extension, 'w').close()
+    Prism.Remove_Files(model)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(file_name for path, file_name in models[1:])
+
+@pytest.mark.parametrize("n_candidates, workers, runs", [(2, 2, 1), (6, 4, 1), (8, 2, 2), (12, 4, 3)])
+def test_validate_batch_groups(monkeypatch, n_candidates, workers, runs):
+    # Each run of PRISM returns the candidate k of its group as the result.
+    sizes = list()
+    def Run_Statistics(expression):
+        n = int(expression[expression.index("-const")+1].split(":")[1]) + 1
+        sizes.append(n)
+        with open(expression[expression.index("-exportresults")+1][0:-4], 'w') as f:
+            f.write("k,Result\n" + "".join(f"{k},{k/100}\n" for k in range(n)))
+        return dict()
+    monkeypatch.setattr(Prism, "Run_Statistics", Run_Statistics)
+
+    graph = Build_Graph(EQUAL_SUCCESS)
+    results = Prism.Validate_Batch("prism", graph.map, [5]*n_candidates, [4]*n_candidates, [[1, 2, 1, 2, 1]]*n_candidates, 
+                                   use_cache=False, workers=workers)
+    assert len(sizes) == runs and min(sizes) >= min(4, n_candidates)
+    assert results == [k/100 for group in np.array_split(np.arange(n_candidates), runs) for k in range(len(group))]
+
+def test_run_statistics(monkeypatch):
+    class Popen:
+        def __init__(self, expression, stdout=None, stderr=None):
+            self.expression = expression
+        def communicate(self):
+            return PRISM_OUTPUT.encode('utf-8'), b""
+    monkeypatch.setattr(subprocess, "Popen", Popen)
+
+    stats = Prism.Run_Statistics(["prism", "Model.prism"])
+    assert stats["Models"] == 2
+    assert stats["Construction Time"] == pytest.approx(0.06)
+    assert stats["Checking Time"] == pytest.approx(0.015)
+    assert stats["States"] == 20
+    assert stats["Transitions"] == 50
+    assert stats["Wall Time"] >= 0
+
+@pytest.mark.parametrize("output_files", [False, True])
+def test_simulate_results(monkeypatch, tmp_path, output_files):
+    expressions = Fake_Prism(monkeypatch, "Result\n0.81\n")
+    model = str(tmp_path / "Model.prism")
+    assert Prism.Simulate("prism", model, output_files=output_files, return_stats=True) == (0.81, dict())
+    assert expressions[0][expressions[0].index("-exportresults")+1] == str(tmp_path / "Model.csv") + ":csv"
+    assert ("-exportadv" in expressions[0]) == output_files
+
+    # A results file left by a previous run is not read.
+    monkeypatch.setattr(Prism, "Run_Statistics", lambda expression: dict())
+    assert Prism.Simulate("prism", model) is None
+
+def test_read_policy(tmp_path):
+    (tmp_path / "Model.sta").write_text(STATES)
+    (tmp_path / "Model.tra").write_text(ADVERSARY)
+    assert Prism.Read_Policy(str(tmp_path / "Model.tra"), str(tmp_path / "Model.sta"), 3) == {1 : 2, 2 : 3}
+
+@pytest.mark.parametrize("states, adversary", [(STATES.replace("1:(false,1)", "1:(false)"), ADVERSARY),
+                                               (STATES, ADVERSARY + "7 3 1 s7_s3\n")])
+def test_read_policy_error(tmp_path, states, adversary):
+    (tmp_path / "Model.sta").write_text(states)
+    (tmp_path / "Model.tra").write_text(adversary)
+    with pytest.raises(ValueError):
+        Prism.Read_Policy(str(tmp_path / "Model.tra"), str(tmp_path / "Model.sta"), 3)
+
+@pytest.mark.parametrize("exported", [True, False])
+def test_synthesise_policy(monkeypatch, tmp_path, exported):
+    expressions = list()
+    def Run_Statistics(expression):
+        expressions.append(expression)
+        if exported:
+            with open(expression[expression.index("-exportstates")+1], 'w') as f:
+                f.write(STATES)
+            with open(expression[expression.index("-exportadv")+1], 'w') as f:
+                f.write(ADVERSARY)
+        return dict()
+    monkeypatch.setattr(Prism, "Run_Statistics", Run_Statistics)
+    monkeypatch.setattr(Prism, "scratch_dir", str(tmp_path))
+
+    graph = Build_Graph(EQUAL_SUCCESS)
+    if exported:
+        assert Prism.Synthesise_Policy("prism", graph.map, 3) == {1 : 2, 2 : 3}
+    else:
+        with pytest.raises(RuntimeError):
+            Prism.Synthesise_Policy("prism", graph.map, 3)
+    assert "Pmax=? [F (end & s=final)]" in expressions[0]
+    assert list(tmp_path.iterdir()) == []
+
+def test_value_iteration_matches_reference(model):
+    graph, map = model
+    targets = list(map)[::3]
+    result = Prism.Value_Iteration(map, targets)
+    for i, target in enumerate(targets):
+        reference = Reference_Policy(map, target)
+        for node in map:
+            assert result["Values"][i, node] == pytest.approx(reference[node], abs=1e-9)
+
+            # The policy reaches the target without a loop.
+            if result["Values"][i, node] > 0:
+                seen = set()
+                while node != target:
+                    assert node not in seen
+                    seen.add(node)
+                    node = result["Policy"][i, node]
+
+def test_value_iteration_equal_success():
+    graph = Build_Graph(EQUAL_SUCCESS)
+    result = Prism.Value_Iteration(graph.map, [4])
+    assert result["Values"][0, 5] == pytest.approx(1.0)
+    assert result["Policy"][0, 3] == 2
+
+def test_evaluate_batch_matches_solve(model):
+    graph, map = model
+    for start, final in Queries(graph):
+        actions = Actions(graph, start, final)
+        probability, distance = Prism.Evaluate_Batch(map, start, final, actions)
+        for i in range(len(actions)):
+            assert probability[i] == pytest.approx(Prism.Solve(map, start, final, actions[i]), abs=1e-12)
+
+def test_optimiser_improves_on_dijkstra(connections):
+    graph = Build_Graph(connections, n_probs=2)
+    for start, final in Queries(graph, n_queries=3):
+        paths = [graph.Dijkstra(start, final, method=method)[0] for method in ["Distance", "Probability"]]
+        dijkstra = max(Prism.Solve(graph.map, start, final, Prism.Generate_Action(graph.map, 1, initial_guess=path)[0]) for path in paths)
+
+        result = Action_Optimiser(graph.map, start, final, seed=0).Run(paths, iterations=20)
+        assert result["Probability"] >= dijkstra - 1e-12
+        assert result["Probability"] == pytest.approx(Prism.Solve(graph.map, start, final, result["Actions"]), abs=1e-12)
+
+def test_transition_heat_matches_rebuild(graph):
+    graph.Update_Heat(Human([1, 2, 3], 1))
+    patched = Transition_Matrix.From_Map(graph.map).Apply_Heat(graph.heat_map)
+    rebuilt = Transition_Matrix.From_Map({node : dict(graph.heat_map[node]) for node in graph.map})
+    for key in rebuilt.arrays:
+        assert np.array_equal(patched.arrays[key], rebuilt.arrays[key])
+
+def test_transition_cache(graph):
+    # The matrices are reused until the version of the map or heat map changes.
+    transitions = graph.Transitions()
+    assert graph.Transitions() is transitions
+    graph.Update_Heat(Human([1, 2, 3], 1))
+    heat = graph.Transitions(graph.heat_map)
+    assert graph.Transitions(graph.heat_map) is heat
+    graph.Update_Heat(Human([2, 3, 4], 2))
+    assert graph.Transitions(graph.heat_map) is not heat
+    assert graph.Transitions() is transitions
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import math
+from copy import deepcopy
+import numpy as np
+import pytest
+
+from Utilities.Maps import Risk, Bungalow
+from conftest import Build_Graph, Human, EQUAL_SUCCESS
+
+# =============================================================================
+# Reference Searches
+# -----------------------------------------------------------------------------
+# Bellman-Ford relaxation of every edge until no value changes, giving the
+# minimum distance or the maximum probability (with zero success edges given
+# the 0.05 probability used by Dijkstra) from the start node to every node.
+# =============================================================================
+def Reference_Values(map, start, method):
+    values = {node : (math.inf if method == "Distance" else 0) for node in map}
+    values[start] = 0 if method == "Distance" else 1
+    changed = True
+    while changed:
+        changed = False
+        for node in map:
+            for neighbour, edge in map[node].items():
+                if method == "Distance":
+                    new_value = values[node] + edge["Distance"]
+                    better = new_value < values[neighbour]
+                else:
+                    new_value = values[node] * (edge["Success"] if edge["Success"] != 0 else 0.05)
+                    better = new_value > values[neighbour]
+                if better:
+                    values[neighbour] = new_value
+                    changed = True
+    return values
+
+# =============================================================================
+# Reference Heat Map
+# -----------------------------------------------------------------------------
+# The heat map created by copying the default map and changing the edges of
+# the connections along the human's path, as before the overlay was added.
+# =============================================================================
+def Reference_Heat(graph, human_path, human_position, scale1=0.5, scale2=0.90):
+    heat_map = deepcopy(graph.map)
+    for c in graph.connections:
+        edge = heat_map[c[0]][c[1]]
+        if (c[0] in human_path) and (c[1] in human_path):
+            success = edge["Success"]
+            partition = np.round(np.round(success * (1 - scale1), 5) / 3, 5)
+            edge["Success"] = np.round(success * scale1, 5)
+            edge["Return"] += partition*2
+            edge["Fail"] += partition
+        elif (c[0] in human_path) or (c[1] in human_path):
+            success = edge["Success"]
+            partition = np.round(np.round(success * (1 - scale2), 5) / 3, 5)
+            edge["Success"] = np.round(success * scale2, 5)
+            edge["Return"] += partition*2
+            edge["Fail"] += partition
+
+        if c[0] == human_position or c[1] == human_position or c[0] == human_path[0] or c[1] == human_path[1]:
+            edge["Success"], edge["Return"], edge["Fail"] = 0, 1, 0
+    return heat_map
+
+def Check_Path(map, path, start, final):
+    assert path[0] == start and path[-1] == final
+    for i in range(len(path)-1):
+        assert path[i+1] in map[path[i]]
+
+# =============================================================================
+# Tests
+# =============================================================================
+@pytest.mark.parametrize("engine", ["dijkstra", "alt", "ch", "table"])
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_equal_success_edges(engine, method):
+    graph = Build_Graph(EQUAL_SUCCESS)
+    path, distance, probability = graph.Dijkstra(5, 4, method=method, engine=engine)
+    assert path == [5, 3, 2, 4]
+    assert distance == 3.0
+    assert probability == pytest.approx(0.81 if method == "Probability" else 1.0)
+
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_dijkstra_tree_has_no_loops(method):
+    graph = Build_Graph(EQUAL_SUCCESS)
+    for start in graph.map:
+        previous = graph.Dijkstra_Tree(start, method=method)["Previous"]
+        for node in previous:
+            seen = set()
+            while node != start:
+                assert node not in seen
+                seen.add(node)
+                node = previous[node]
+
+def test_dijkstra_tie_order():
+    # Paths of equal distance are resolved in the original search order.
+    graph = Build_Graph(Bungalow(Risk())[0])
+    assert graph.Dijkstra(15, 28)[0] == [15, 11, 8, 9, 26, 27, 28]
+
+@pytest.mark.parametrize("engine", ["dijkstra", "alt"])
+def test_dijkstra_tie_order(engine):
+    # Paths of equal distance are resolved in the original search order.
+    graph = Build_Graph(Bungalow(Risk())[0])
+    assert graph.Dijkstra(15, 28, engine=engine)[0] == [15, 11, 8, 9, 26, 27, 28]
+
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_dijkstra_matches_reference(graph, method):
+    for start in graph.map:
+        tree = graph.Dijkstra_Tree(start, method=method)
+        reference = Reference_Values(graph.map, start, method)
+        for node in graph.map:
+            assert tree["Values"][node] == pytest.approx(reference[node], rel=1e-12)
+
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_csr_backend_matches_dict(connections, method):
+    graph = Build_Graph(connections)
+    compact = Build_Graph(connections, backend="csr")
+    for start in graph.map:
+        for final in graph.map:
+            assert graph.Dijkstra(start, final, method=method) == compact.Dijkstra(start, final, method=method)
+
+@pytest.mark.parametrize("human_path", [[1, 2, 3], [2, 6, 7, 8]])
+def test_heat_map_matches_reference(graph, human_path):
+    human = Human(human_path, human_path[0])
+    reference = Reference_Heat(graph, human_path, human_path[0])
+
+    graph.Update_Heat(human)
+    for node in reference:
+        for neighbour, edge in reference[node].items():
+            for key in ("Distance", "Success", "Return", "Fail"):
+                assert graph.heat_map[node][neighbour][key] == pytest.approx(edge[key], abs=1e-12)
+
+def test_heat_map_version(graph):
+    human = Human([1, 2, 3], 1)
+    assert graph.Update_Heat(human)
+    version = graph.heat_version
+    assert not graph.Update_Heat(human)
+    assert graph.heat_version == version
+
+@pytest.mark.parametrize("human_path", [[1, 2, 3], [2, 6, 7, 8]])
+def test_numpy_heat_map_matches_reference(connections, human_path):
+    compact = Build_Graph(connections, backend="csr")
+    human = Human(human_path, human_path[0])
+    reference = Reference_Heat(Build_Graph(connections), human_path, human_path[0])
+
+    compact.Update_Heat(human, engine="numpy")
+    for node in reference:
+        for neighbour, edge in reference[node].items():
+            for key in ("Distance", "Success", "Return", "Fail"):
+                assert compact.heat_map[node][neighbour][key] == pytest.approx(edge[key], abs=1e-12)
+
+def test_numpy_heat_map_requires_csr(graph):
+    with pytest.raises(ValueError):
+        graph.Update_Heat(Human([1, 2, 3], 1), engine="numpy")
+
+@pytest.mark.parametrize("heated", [False, True])
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_alt_paths_match_dijkstra(graph, method, heated):
+    map = None
+    if heated:
+        graph.Update_Heat(Human([2, 3, 4, 5], 2))
+        map = graph.heat_map
+    for start in graph.map:
+        for final in graph.map:
+            tree = graph.Dijkstra_Tree(start, method=method, map=map)
+            assert graph.Tree_Path(graph.A_Star(start, final, method=method, map=map), final, map=map) == graph.Tree_Path(tree, final, map=map)
+
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_hierarchy_values_match_dijkstra(graph, method):
+    # Paths of equal value may be resolved differently, so the values are compared.
+    for start in graph.map:
+        for final in graph.map:
+            path, distance, probability = graph.Dijkstra(start, final, method=method)
+            path_ch, distance_ch, probability_ch = graph.Dijkstra(start, final, method=method, engine="ch")
+            Check_Path(graph.map, path_ch, start, final)
+            if method == "Distance":
+                assert distance_ch == pytest.approx(distance, rel=1e-12)
+            else:
+                assert probability_ch == pytest.approx(probability, rel=1e-12)
+
+@pytest.mark.parametrize("method", ["Distance", "Probability"])
+def test_routing_table_matches_dijkstra(graph, method):
+    for start in graph.map:
+        for final in graph.map:
+            assert graph.Dijkstra(start, final, method=method, engine="table")[0] == graph.Dijkstra(start, final, method=method)[0]
+
+def test_routing_table_file(graph, tmp_path):
+    file_name = str(tmp_path / "table")
+    graph.Create_Routing_Table()
+    graph.Save_Routing_Table(file_name)
+    assert (tmp_path / "table").exists()
+
+    graph.routing = None
+    assert graph.Load_Routing_Table(file_name)
+    assert graph.routing["Previous"].shape == (graph.n_nodes+1, graph.n_nodes+1)
+
+def test_path_cache(graph):
+    path = graph.Dijkstra(1, graph.n_nodes)
+    path[0].append(0)
+    assert graph.Dijkstra(1, graph.n_nodes)[0] != path[0]
+    assert graph.Cache_Statistics()["Hits"] == 1
+
+def test_path_cache_heat_version(graph):
+    # A change of the heat map must not return the path cached for the previous heat map.
+    final = graph.n_nodes
+    graph.Update_Heat(Human([1, 2, 3], 2))
+    graph.Dijkstra(1, final, method="Probability", map=graph.heat_map)
+    graph.Update_Heat(Human([final-1, final], final-1))
+    path = graph.Dijkstra(1, final, method="Probability", map=graph.heat_map)
+    tree = graph.Dijkstra_Tree(1, method="Probability", map=graph.heat_map)
+    assert path == graph.Tree_Path(tree, final, map=graph.heat_map)
+    assert graph.Cache_Statistics()["Hits"] == 0